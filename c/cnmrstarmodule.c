@@ -144,9 +144,11 @@ char *str_to_lowercase(char *orig) {
     if (!result)
         return NULL;
 
-    for(int i = 0; orig[i]; i++){
+    int i;
+    for(i = 0; orig[i]; i++){
         result[i] = tolower(orig[i]);
     }
+    result[i] = '\0';
 
     return result;
 }
@@ -511,6 +513,8 @@ bool ends_with(const char * str, const char * suffix)
     (0 == strcmp(str + (str_len-suffix_len), suffix));
 }
 
+static PyObject * quote_string(char * str);
+
 /*
     Automatically quotes the value in the appropriate way. Don't
     quote values you send to this method or they will show up in
@@ -524,12 +528,18 @@ bool ends_with(const char * str, const char * suffix)
 */
 static PyObject * clean_string(PyObject *self, PyObject *args){
     char * str;
-    char * format;
 
     // Get the string to clean
     if (!PyArg_ParseTuple(args, "s", &str))
         return NULL;
 
+    return quote_string(str);
+}
+
+/* Does the work of clean_string() for an already extracted string. */
+static PyObject * quote_string(char * str){
+    char * format;
+
     // Figure out how long the string is
     long len = strlen(str);
 
@@ -666,6 +676,443 @@ static PyObject * clean_string(PyObject *self, PyObject *args){
 }
 
 
+
+/*
+    The functions below format loops. They produce exactly the same text
+    as Loop.format() does using utils.quote_value() on every value.
+*/
+
+// A growable buffer for building the formatted loop
+typedef struct {
+    char * data;
+    size_t length;
+    size_t capacity;
+} out_buffer;
+
+bool buffer_reserve(out_buffer * buffer, size_t extra){
+    if (buffer->length + extra <= buffer->capacity)
+        return true;
+
+    size_t new_capacity = buffer->capacity ? buffer->capacity * 2 : 4096;
+    while (new_capacity < buffer->length + extra)
+        new_capacity *= 2;
+    char * new_data = realloc(buffer->data, new_capacity);
+    if (new_data == NULL){
+        PyErr_NoMemory();
+        return false;
+    }
+    buffer->data = new_data;
+    buffer->capacity = new_capacity;
+    return true;
+}
+
+bool buffer_append(out_buffer * buffer, const char * str, size_t length){
+    if (!buffer_reserve(buffer, length))
+        return false;
+    memcpy(buffer->data + buffer->length, str, length);
+    buffer->length += length;
+    return true;
+}
+
+bool buffer_pad(out_buffer * buffer, size_t spaces){
+    if (!buffer_reserve(buffer, spaces))
+        return false;
+    memset(buffer->data + buffer->length, ' ', spaces);
+    buffer->length += spaces;
+    return true;
+}
+
+// Returns the buffer as a python string and frees it
+static PyObject * buffer_finish(out_buffer * buffer){
+    PyObject * result = PyUnicode_DecodeUTF8(buffer->data ? buffer->data : "", buffer->length, "surrogatepass");
+    free(buffer->data);
+    buffer->data = NULL;
+    return result;
+}
+
+/*
+    Quotes one value the same way utils.quote_value() does: first apply
+    the STR_CONVERSION_DICT conversions, then convert to a string, and
+    then quote it. Returns a new reference, or NULL with an exception set.
+*/
+static PyObject * quote_object(PyObject * value, PyObject * conversions){
+    PyObject * converted = value;
+    Py_INCREF(converted);
+
+    int contains = PyDict_Contains(conversions, value);
+    if (contains < 0)
+        goto error;
+    if (contains){
+        // Only convert if the value has the same type as one of the keys
+        Py_ssize_t pos = 0;
+        PyObject * key;
+        PyObject * key_value;
+        while (PyDict_Next(conversions, &pos, &key, &key_value)){
+            int matches = PyObject_IsInstance(value, (PyObject *)Py_TYPE(key));
+            if (matches < 0)
+                goto error;
+            if (matches){
+                PyObject * replacement = PyDict_GetItemWithError(conversions, value);
+                if (replacement == NULL){
+                    if (!PyErr_Occurred())
+                        PyErr_SetObject(PyExc_KeyError, value);
+                    goto error;
+                }
+                Py_INCREF(replacement);
+                Py_DECREF(converted);
+                converted = replacement;
+                break;
+            }
+        }
+    }
+
+    PyObject * as_string;
+    if (PyUnicode_Check(converted)){
+        as_string = converted;
+        Py_INCREF(as_string);
+    } else {
+        as_string = PyObject_Str(converted);
+        if (as_string == NULL)
+            goto error;
+    }
+    Py_DECREF(converted);
+
+    Py_ssize_t size;
+    const char * str = PyUnicode_AsUTF8AndSize(as_string, &size);
+    if (str == NULL){
+        Py_DECREF(as_string);
+        return NULL;
+    }
+    if ((Py_ssize_t)strlen(str) != size){
+        Py_DECREF(as_string);
+        PyErr_SetString(PyExc_ValueError, "Values may not contain null characters.");
+        return NULL;
+    }
+
+    PyObject * result = quote_string((char *)str);
+    Py_DECREF(as_string);
+    return result;
+
+  error:
+    Py_DECREF(converted);
+    return NULL;
+}
+
+/*
+    Quotes a list of values, each the same way clean_value() does after
+    applying the conversions in the provided dictionary (which should be
+    STR_CONVERSION_DICT).
+*/
+static PyObject * clean_values(PyObject *self, PyObject *args){
+    PyObject * values;
+    PyObject * conversions;
+
+    if (!PyArg_ParseTuple(args, "OO!", &values, &PyDict_Type, &conversions))
+        return NULL;
+
+    PyObject * fast_values = PySequence_Fast(values, "The values must be a list.");
+    if (fast_values == NULL)
+        return NULL;
+    Py_ssize_t num_values = PySequence_Fast_GET_SIZE(fast_values);
+    PyObject ** items = PySequence_Fast_ITEMS(fast_values);
+
+    PyObject * result = PyList_New(num_values);
+    if (result == NULL){
+        Py_DECREF(fast_values);
+        return NULL;
+    }
+
+    Py_ssize_t pos;
+    for (pos = 0; pos < num_values; pos++){
+        PyObject * quoted = quote_object(items[pos], conversions);
+        if (quoted == NULL){
+            Py_DECREF(fast_values);
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, pos, quoted);
+    }
+
+    Py_DECREF(fast_values);
+    return result;
+}
+
+/*
+    Quotes all of the values in a row. Returns a new reference to a list of
+    the quoted values, or NULL with an exception set.
+*/
+static PyObject * quote_row(PyObject * row, PyObject * conversions, Py_ssize_t num_cols){
+    PyObject * fast_row = PySequence_Fast(row, "Loop rows must be lists.");
+    if (fast_row == NULL)
+        return NULL;
+    if (PySequence_Fast_GET_SIZE(fast_row) != num_cols){
+        Py_DECREF(fast_row);
+        PyErr_SetString(PyExc_ValueError, "A loop row does not have the same number of values as there are tags.");
+        return NULL;
+    }
+
+    PyObject * result = PyList_New(num_cols);
+    if (result == NULL){
+        Py_DECREF(fast_row);
+        return NULL;
+    }
+
+    PyObject ** items = PySequence_Fast_ITEMS(fast_row);
+    Py_ssize_t col;
+    for (col = 0; col < num_cols; col++){
+        PyObject * quoted = quote_object(items[col], conversions);
+        if (quoted == NULL){
+            Py_DECREF(fast_row);
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, col, quoted);
+    }
+
+    Py_DECREF(fast_row);
+    return result;
+}
+
+// Updates the column widths to fit the quoted row
+void update_widths(PyObject * quoted_row, Py_ssize_t * widths, Py_ssize_t num_cols){
+    Py_ssize_t col;
+    for (col = 0; col < num_cols; col++){
+        Py_ssize_t width = PyUnicode_GET_LENGTH(PyList_GET_ITEM(quoted_row, col)) + 3;
+        if (width > widths[col])
+            widths[col] = width;
+    }
+}
+
+// Appends a quoted row to the buffer, with the columns padded to the widths
+bool append_row(out_buffer * buffer, PyObject * quoted_row, Py_ssize_t * widths, Py_ssize_t num_cols){
+    if (!buffer_append(buffer, "     ", 5))
+        return false;
+
+    Py_ssize_t col;
+    for (col = 0; col < num_cols; col++){
+        PyObject * quoted = PyList_GET_ITEM(quoted_row, col);
+        Py_ssize_t size;
+        const char * str = PyUnicode_AsUTF8AndSize(quoted, &size);
+        if (str == NULL)
+            return false;
+        Py_ssize_t char_length = PyUnicode_GET_LENGTH(quoted);
+
+        // Values with newlines go on their own lines
+        if (memchr(str, '\n', size) != NULL){
+            if (!buffer_append(buffer, "\n;\n", 3) || !buffer_append(buffer, str, size) ||
+                !buffer_append(buffer, ";\n", 2))
+                return false;
+            char_length += 5;
+        } else {
+            if (!buffer_append(buffer, str, size))
+                return false;
+        }
+
+        if (widths[col] > char_length){
+            if (!buffer_pad(buffer, widths[col] - char_length))
+                return false;
+        }
+    }
+
+    return buffer_append(buffer, " \n", 2);
+}
+
+// Checks the arguments shared by the formatting functions
+bool check_loop_args(PyObject * data, PyObject * conversions){
+    if (!PyList_Check(data)){
+        PyErr_SetString(PyExc_TypeError, "The loop data must be a list.");
+        return false;
+    }
+    if (!PyDict_Check(conversions)){
+        PyErr_SetString(PyExc_TypeError, "The conversions must be a dictionary.");
+        return false;
+    }
+    return true;
+}
+
+// Returns the number of columns in the loop data
+Py_ssize_t get_num_cols(PyObject * data){
+    if (PyList_GET_SIZE(data) == 0)
+        return 0;
+    Py_ssize_t num_cols = PySequence_Size(PyList_GET_ITEM(data, 0));
+    if (num_cols == 0)
+        PyErr_SetString(PyExc_ValueError, "Loop rows must contain at least one value.");
+    return num_cols;
+}
+
+/*
+    Quotes every value in the loop data and returns a list of the width
+    of each column, as used by format_loop(). Used to format a loop in
+    pieces.
+*/
+static PyObject * loop_widths(PyObject *self, PyObject *args){
+    PyObject * data;
+    PyObject * conversions;
+
+    if (!PyArg_ParseTuple(args, "OO", &data, &conversions))
+        return NULL;
+    if (!check_loop_args(data, conversions))
+        return NULL;
+    Py_ssize_t num_cols = get_num_cols(data);
+    if (num_cols <= 0)
+        return num_cols == 0 && !PyErr_Occurred() ? PyList_New(0) : NULL;
+
+    Py_ssize_t * widths = calloc(num_cols, sizeof(Py_ssize_t));
+    if (widths == NULL)
+        return PyErr_NoMemory();
+
+    Py_ssize_t row_pos;
+    for (row_pos = 0; row_pos < PyList_GET_SIZE(data); row_pos++){
+        PyObject * quoted_row = quote_row(PyList_GET_ITEM(data, row_pos), conversions, num_cols);
+        if (quoted_row == NULL){
+            free(widths);
+            return NULL;
+        }
+        update_widths(quoted_row, widths, num_cols);
+        Py_DECREF(quoted_row);
+    }
+
+    PyObject * result = PyList_New(num_cols);
+    Py_ssize_t col;
+    for (col = 0; result != NULL && col < num_cols; col++){
+        PyObject * width = PyLong_FromSsize_t(widths[col]);
+        if (width == NULL){
+            Py_CLEAR(result);
+            break;
+        }
+        PyList_SET_ITEM(result, col, width);
+    }
+    free(widths);
+    return result;
+}
+
+/*
+    Formats rows of loop data using the provided column widths (as
+    returned by loop_widths()).
+*/
+static PyObject * format_loop_rows(PyObject *self, PyObject *args){
+    PyObject * data;
+    PyObject * conversions;
+    PyObject * width_list;
+
+    if (!PyArg_ParseTuple(args, "OOO!", &data, &conversions, &PyList_Type, &width_list))
+        return NULL;
+    if (!check_loop_args(data, conversions))
+        return NULL;
+
+    Py_ssize_t num_cols = PyList_GET_SIZE(width_list);
+    Py_ssize_t * widths = calloc(num_cols ? num_cols : 1, sizeof(Py_ssize_t));
+    if (widths == NULL)
+        return PyErr_NoMemory();
+    Py_ssize_t col;
+    for (col = 0; col < num_cols; col++){
+        widths[col] = PyLong_AsSsize_t(PyList_GET_ITEM(width_list, col));
+        if (widths[col] == -1 && PyErr_Occurred()){
+            free(widths);
+            return NULL;
+        }
+    }
+
+    out_buffer buffer = {NULL, 0, 0};
+    Py_ssize_t row_pos;
+    for (row_pos = 0; row_pos < PyList_GET_SIZE(data); row_pos++){
+        PyObject * quoted_row = quote_row(PyList_GET_ITEM(data, row_pos), conversions, num_cols);
+        if (quoted_row == NULL || !append_row(&buffer, quoted_row, widths, num_cols)){
+            Py_XDECREF(quoted_row);
+            free(widths);
+            free(buffer.data);
+            return NULL;
+        }
+        Py_DECREF(quoted_row);
+    }
+
+    free(widths);
+    return buffer_finish(&buffer);
+}
+
+/*
+    Formats an entire loop, including the loop_ and stop_ keywords and the
+    tags. The values are quoted only once, and all kept in memory.
+*/
+static PyObject * format_loop(PyObject *self, PyObject *args){
+    PyObject * category;
+    PyObject * tags;
+    PyObject * data;
+    PyObject * conversions;
+
+    if (!PyArg_ParseTuple(args, "OOOO", &category, &tags, &data, &conversions))
+        return NULL;
+    if (!check_loop_args(data, conversions))
+        return NULL;
+
+    PyObject * fast_tags = PySequence_Fast(tags, "The loop tags must be a list.");
+    if (fast_tags == NULL)
+        return NULL;
+    Py_ssize_t num_cols = PySequence_Fast_GET_SIZE(fast_tags);
+    Py_ssize_t num_rows = PyList_GET_SIZE(data);
+
+    out_buffer buffer = {NULL, 0, 0};
+    PyObject * quoted_rows = NULL;
+    Py_ssize_t * widths = calloc(num_cols ? num_cols : 1, sizeof(Py_ssize_t));
+    if (widths == NULL){
+        PyErr_NoMemory();
+        goto error;
+    }
+
+    // Print the tags
+    if (!buffer_append(&buffer, "\n   loop_\n", 10))
+        goto error;
+    Py_ssize_t col;
+    for (col = 0; col < num_cols; col++){
+        PyObject * tag_line = PyUnicode_FromFormat("      %S.%S\n", category, PySequence_Fast_GET_ITEM(fast_tags, col));
+        if (tag_line == NULL)
+            goto error;
+        Py_ssize_t size;
+        const char * str = PyUnicode_AsUTF8AndSize(tag_line, &size);
+        bool appended = str != NULL && buffer_append(&buffer, str, size);
+        Py_DECREF(tag_line);
+        if (!appended)
+            goto error;
+    }
+    if (!buffer_append(&buffer, "\n", 1))
+        goto error;
+
+    // Quote the data and determine the column widths
+    quoted_rows = PyList_New(num_rows);
+    if (quoted_rows == NULL)
+        goto error;
+    Py_ssize_t row_pos;
+    for (row_pos = 0; row_pos < num_rows; row_pos++){
+        PyObject * quoted_row = quote_row(PyList_GET_ITEM(data, row_pos), conversions, num_cols);
+        if (quoted_row == NULL)
+            goto error;
+        PyList_SET_ITEM(quoted_rows, row_pos, quoted_row);
+        update_widths(quoted_row, widths, num_cols);
+    }
+
+    // Print the data
+    for (row_pos = 0; row_pos < num_rows; row_pos++){
+        if (!append_row(&buffer, PyList_GET_ITEM(quoted_rows, row_pos), widths, num_cols))
+            goto error;
+    }
+
+    if (!buffer_append(&buffer, "\n   stop_\n", 10))
+        goto error;
+
+    Py_DECREF(fast_tags);
+    Py_DECREF(quoted_rows);
+    free(widths);
+    return buffer_finish(&buffer);
+
+  error:
+    Py_DECREF(fast_tags);
+    Py_XDECREF(quoted_rows);
+    free(widths);
+    free(buffer.data);
+    return NULL;
+}
+
+
 static PyObject *
 PARSE_load(PyObject *self, PyObject *args)
 {
@@ -710,16 +1157,15 @@ bool StartsWith(const char *a, const char *b)
    return 0;
 }
 
-static PyObject *
-PARSE_get_token_full(PyObject *self)
-{
+/* Gets one token from the parser as a (token, line number, delimiter)
+   tuple. The token is None once there are no more tokens. */
+static PyObject * get_token_tuple(parser_data * my_parser){
     char * token;
-    token = get_token(&parser);
-    parser_data * my_parser = &parser;
+    token = get_token(my_parser);
 
     // Skip comments
     while (my_parser->last_delimiter == '#'){
-        token = get_token(&parser);
+        token = get_token(my_parser);
     }
 
     // Pass errors up the chain
@@ -765,6 +1211,74 @@ PARSE_get_token_full(PyObject *self)
     #endif
 }
 
+static PyObject *
+PARSE_get_token_full(PyObject *self)
+{
+    return get_token_tuple(&parser);
+}
+
+/* A tokenizer with its own state, so that more than one string can be
+   tokenized at once (e.g. from different threads). */
+typedef struct {
+    PyObject_HEAD
+    parser_data parser;
+} Tokenizer;
+
+static int
+Tokenizer_init(Tokenizer *self, PyObject *args, PyObject *kwds)
+{
+    char *data;
+    static char *kwlist[] = {"data", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s", kwlist, &data))
+        return -1;
+
+    reset_parser(&self->parser);
+
+    // Copy the input data to a newly malloc'd location so we don't lose it
+    self->parser.length = strlen(data);
+    self->parser.full_data = malloc(self->parser.length+1);
+    if (self->parser.full_data == NULL){
+        PyErr_NoMemory();
+        return -1;
+    }
+    memcpy(self->parser.full_data, data, self->parser.length+1);
+
+    return 0;
+}
+
+static void
+Tokenizer_dealloc(Tokenizer *self)
+{
+    reset_parser(&self->parser);
+    Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
+static PyObject *
+Tokenizer_get_token_full(Tokenizer *self, PyObject *Py_UNUSED(ignored))
+{
+    return get_token_tuple(&self->parser);
+}
+
+static PyMethodDef Tokenizer_methods[] = {
+    {"get_token_full", (PyCFunction)Tokenizer_get_token_full, METH_NOARGS,
+     "Get one token from the string as well as the line number and delimiter."},
+    {NULL, NULL, 0, NULL}        /* Sentinel */
+};
+
+static PyTypeObject TokenizerType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "cnmrstar.Tokenizer",
+    .tp_doc = "Tokenizes a string, keeping its own state.",
+    .tp_basicsize = sizeof(Tokenizer),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc) Tokenizer_init,
+    .tp_dealloc = (destructor) Tokenizer_dealloc,
+    .tp_methods = Tokenizer_methods,
+};
+
 static PyObject *
 version(PyObject *self)
 {
@@ -775,6 +1289,18 @@ static PyMethodDef cnmrstar_methods[] = {
     {"clean_value",  (PyCFunction)clean_string, METH_VARARGS,
      "Properly quote or encapsulate a value before printing."},
 
+    {"clean_values",  (PyCFunction)clean_values, METH_VARARGS,
+     "Properly quote or encapsulate a list of values, given the string conversion dictionary."},
+
+    {"format_loop",  (PyCFunction)format_loop, METH_VARARGS,
+     "Format a loop, given the category, tags, data and string conversion dictionary."},
+
+    {"loop_widths",  (PyCFunction)loop_widths, METH_VARARGS,
+     "Get the column widths used to format loop data."},
+
+    {"format_loop_rows",  (PyCFunction)format_loop_rows, METH_VARARGS,
+     "Format rows of loop data using the provided column widths."},
+
     {"load",  (PyCFunction)PARSE_load, METH_VARARGS,
      "Load a file in preparation to tokenize."},
 
@@ -819,6 +1345,9 @@ static struct PyModuleDef moduledef = {
 
 PyMODINIT_FUNC
 PyInit_cnmrstar(void){
+    if (PyType_Ready(&TokenizerType) < 0)
+        INITERROR;
+
     PyObject *module = PyModule_Create(&moduledef);
 
     if (module == NULL)
@@ -831,5 +1360,12 @@ PyInit_cnmrstar(void){
         INITERROR;
     }
 
+    Py_INCREF(&TokenizerType);
+    if (PyModule_AddObject(module, "Tokenizer", (PyObject *) &TokenizerType) < 0) {
+        Py_DECREF(&TokenizerType);
+        Py_DECREF(module);
+        INITERROR;
+    }
+
     return module;
 }
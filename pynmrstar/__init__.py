@@ -7,7 +7,6 @@ It also provides some utility functions in pynmrstar.utils
 Use python's built in help function for documentation."""
 
 import decimal as _decimal
-import logging
 import warnings
 
 from pynmrstar import utils
@@ -18,13 +17,9 @@ from pynmrstar.parser import Parser as _Parser
 from pynmrstar.saveframe import Saveframe
 from pynmrstar.schema import Schema
 
-# Set up logging
-logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s')
-logging.getLogger().setLevel(logging.INFO)
-
 # This makes sure that when decimals are printed a lower case "e" is used
 _decimal.getcontext().capitals = 0
-# Make sure the cnmstar module is compiled
+# Load the cnmrstar module if it is available
 cnmrstar = _get_cnmrstar()
 del loop
 del entry
@@ -33,6 +28,26 @@ del schema
 del parser
 
 
+# The optional modules and functions, which are only imported when they are first used so that importing
+#  pynmrstar stays fast
+_LAZY_MODULES = ['benchmarks', 'corpus', 'hooks', 'profiling', 'testing']
+_LAZY_FUNCTIONS = {'enable_cache': 'pynmrstar._cache', 'disable_cache': 'pynmrstar._cache'}
+
+
+def __getattr__(name):
+    import importlib
+
+    if name in _LAZY_MODULES:
+        return importlib.import_module('pynmrstar.' + name)
+    if name in _LAZY_FUNCTIONS:
+        return getattr(importlib.import_module(_LAZY_FUNCTIONS[name]), name)
+    raise AttributeError("module 'pynmrstar' has no attribute '%s'" % name)
+
+
+def __dir__():
+    return sorted(list(globals()) + _LAZY_MODULES + list(_LAZY_FUNCTIONS))
+
+
 def clean_value(value):
     """Deprecated. Please use utils.quote_value() instead."""
     warnings.warn('This function has moved to utils.quote_value().', DeprecationWarning)
@@ -47,5 +62,6 @@ def iter_entries(metabolomics=False):
 
 
 
-__all__ = ['Loop', 'Saveframe', 'Entry', 'Schema', 'definitions', 'utils', '__version__', 'exceptions', 'cnmrstar']
+__all__ = ['Loop', 'Saveframe', 'Entry', 'Schema', 'definitions', 'utils', '__version__', 'exceptions', 'cnmrstar',
+           'enable_cache', 'disable_cache', 'corpus', 'hooks', 'profiling', 'testing']
 
@@ -0,0 +1,350 @@
+""" Implements the compact binary representation of entries used by
+Entry.to_bytes() and Entry.from_bytes().
+
+The layout is (all integers are little-endian):
+
+    magic (b'PYNMRSTAR') | format version (uint8)
+    string table:
+        number of values (uint32)
+        value types (uint8 array)
+        value lengths, in characters (uint32 array)
+        all of the values, as one UTF-8 encoded string
+    entry ID (value index)
+    number of saveframes (uint32), then for each saveframe:
+        name, tag prefix, category (value indexes)
+        tags (uint32 array of name index, value index, line number triples)
+        number of loops (uint32), then for each loop:
+            category (value index)
+            tags (uint32 array of value indexes)
+            number of rows (uint32)
+            layout (uint8), and then either:
+                LAYOUT_COLUMNS: for each tag a column type (uint8) and the column as
+                    an array of value indexes, int64s or doubles
+                LAYOUT_ROWS: row lengths (uint32 array) and all of the values as an
+                    array of value indexes
+
+Every distinct value (and tag name) is stored only once, in the string
+table. Loops store their data column-by-column, so that columns made up
+entirely of python ints or floats can be stored as typed numeric arrays
+rather than through the string table. Loops whose rows are not all the
+same width as the tags use the row layout instead. """
+
+import decimal
+import struct
+import sys
+from array import array
+from datetime import date
+from typing import Any, Dict, List
+
+from pynmrstar import entry as entry_mod, loop as loop_mod, saveframe as saveframe_mod
+
+MAGIC: bytes = b'PYNMRSTAR'
+FORMAT_VERSION: int = 1
+
+TYPE_STR, TYPE_NONE, TYPE_INT, TYPE_FLOAT, TYPE_DECIMAL, TYPE_DATE, TYPE_BOOL = range(7)
+COLUMN_INDEXES, COLUMN_INT, COLUMN_FLOAT = range(3)
+LAYOUT_COLUMNS, LAYOUT_ROWS = range(2)
+
+_uint8 = struct.Struct('<B')
+_uint32 = struct.Struct('<I')
+_swap_bytes: bool = sys.byteorder != 'little'
+
+
+class _Writer(object):
+    """ Builds the body of the serialized entry and the table of the
+    distinct values used within it. """
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.value_ids: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def value(self, value: Any) -> int:
+        """ Returns the index of the value in the value table, adding it
+        if necessary. """
+
+        # Non-string values are keyed by type and printed value, since 1 == 1.0 == True
+        #  and Decimal('1.0') == Decimal('1.00')
+        key = value if type(value) is str else (type(value), str(value))
+        try:
+            return self.value_ids[key]
+        except KeyError:
+            self.value_ids[key] = len(self.values)
+            self.values.append(value)
+            return len(self.values) - 1
+
+    def write_uint8(self, value: int) -> None:
+        self.chunks.append(_uint8.pack(value))
+
+    def write_uint32(self, value: int) -> None:
+        self.chunks.append(_uint32.pack(value))
+
+    def write_array(self, typecode: str, values) -> None:
+        """ Writes the number of elements followed by the array. """
+
+        packed = array(typecode, values)
+        if _swap_bytes:
+            packed.byteswap()
+        self.write_uint32(len(packed))
+        self.chunks.append(packed.tobytes())
+
+    def write_column(self, column: List[Any]) -> None:
+        """ Writes a loop column, using a typed array when all values in
+        the column are python ints or floats. """
+
+        column_type = type(column[0]) if column else None
+        if column_type in (int, float) and all(type(x) is column_type for x in column):
+            try:
+                packed = array('q' if column_type is int else 'd', column)
+            except OverflowError:
+                pass
+            else:
+                self.write_uint8(COLUMN_INT if column_type is int else COLUMN_FLOAT)
+                if _swap_bytes:
+                    packed.byteswap()
+                self.write_uint32(len(packed))
+                self.chunks.append(packed.tobytes())
+                return
+
+        value = self.value
+        self.write_uint8(COLUMN_INDEXES)
+        self.write_array('I', [value(x) for x in column])
+
+    def table(self) -> bytes:
+        """ Returns the serialized value table. """
+
+        types = []
+        strings = []
+        for value in self.values:
+            value_type = type(value)
+            if value_type is str:
+                types.append(TYPE_STR)
+                strings.append(value)
+            elif value is None:
+                types.append(TYPE_NONE)
+                strings.append('')
+            elif value_type is bool:
+                types.append(TYPE_BOOL)
+                strings.append('1' if value else '0')
+            elif value_type is int:
+                types.append(TYPE_INT)
+                strings.append(str(value))
+            elif value_type is float:
+                types.append(TYPE_FLOAT)
+                strings.append(repr(value))
+            elif value_type is decimal.Decimal:
+                types.append(TYPE_DECIMAL)
+                strings.append(str(value))
+            elif value_type is date:
+                types.append(TYPE_DATE)
+                strings.append(value.isoformat())
+            # Anything else is stored the way it would be printed
+            else:
+                types.append(TYPE_STR)
+                strings.append(str(value))
+
+        lengths = array('I', [len(x) for x in strings])
+        type_array = array('B', types)
+        if _swap_bytes:
+            lengths.byteswap()
+        text = ''.join(strings).encode('utf-8', 'surrogatepass')
+
+        return b''.join([_uint32.pack(len(types)), type_array.tobytes(), lengths.tobytes(),
+                         _uint32.pack(len(text)), text])
+
+
+class _Reader(object):
+    """ Reads the pieces of a serialized entry in order. """
+
+    def __init__(self, data: bytes) -> None:
+        self.data: memoryview = memoryview(data)
+        self.position: int = 0
+        self.values: List[Any] = []
+
+    def read_uint8(self) -> int:
+        self.position += 1
+        return self.data[self.position - 1]
+
+    def read_uint32(self) -> int:
+        value = _uint32.unpack_from(self.data, self.position)[0]
+        self.position += 4
+        return value
+
+    def read_array(self, typecode: str, length: int = None) -> array:
+        """ Reads an array. If the length isn't provided it is read from
+        the data first. """
+
+        if length is None:
+            length = self.read_uint32()
+        result = array(typecode)
+        end = self.position + length * result.itemsize
+        if end > len(self.data):
+            raise ValueError("The serialized entry is truncated.")
+        result.frombytes(self.data[self.position:end])
+        if _swap_bytes:
+            result.byteswap()
+        self.position = end
+        return result
+
+    def read_value(self) -> Any:
+        return self.values[self.read_uint32()]
+
+    def read_column(self, num_rows: int) -> List[Any]:
+        column_type = self.read_uint8()
+        if column_type == COLUMN_INDEXES:
+            column = list(map(self.values.__getitem__, self.read_array('I')))
+        elif column_type == COLUMN_INT:
+            column = self.read_array('q').tolist()
+        elif column_type == COLUMN_FLOAT:
+            column = self.read_array('d').tolist()
+        else:
+            raise ValueError("Invalid column type in serialized entry: %s" % column_type)
+
+        if len(column) != num_rows:
+            raise ValueError("The serialized entry is corrupt. A loop column has the wrong number of rows.")
+        return column
+
+    def read_table(self) -> None:
+        """ Reads the value table, which must come before anything that
+        refers to the values in it. """
+
+        num_values = self.read_uint32()
+        types = self.read_array('B', num_values)
+        lengths = self.read_array('I', num_values)
+        text_length = self.read_uint32()
+        text = bytes(self.data[self.position:self.position + text_length]).decode('utf-8', 'surrogatepass')
+        self.position += text_length
+
+        values = []
+        append = values.append
+        offset = 0
+        for length in lengths:
+            append(text[offset:offset + length])
+            offset += length
+
+        # Only the values which are not strings need to be converted
+        for pos, value_type in enumerate(types):
+            if value_type == TYPE_STR:
+                continue
+            elif value_type == TYPE_NONE:
+                values[pos] = None
+            elif value_type == TYPE_INT:
+                values[pos] = int(values[pos])
+            elif value_type == TYPE_FLOAT:
+                values[pos] = float(values[pos])
+            elif value_type == TYPE_DECIMAL:
+                values[pos] = decimal.Decimal(values[pos])
+            elif value_type == TYPE_DATE:
+                year, month, day = [int(x) for x in values[pos].split("-")]
+                values[pos] = date(year, month, day)
+            elif value_type == TYPE_BOOL:
+                values[pos] = values[pos] == '1'
+            else:
+                raise ValueError("Invalid value type in serialized entry: %s" % value_type)
+
+        self.values = values
+
+
+def _entry_to_bytes(entry: 'entry_mod.Entry') -> bytes:
+    """ Returns the binary representation of an entry. """
+
+    writer = _Writer()
+    value = writer.value
+
+    writer.write_uint32(value(entry.entry_id))
+    writer.write_uint32(len(entry.frame_list))
+    for saveframe in entry.frame_list:
+        writer.write_uint32(value(saveframe.name))
+        writer.write_uint32(value(saveframe.tag_prefix))
+        writer.write_uint32(value(saveframe.category))
+
+        tag_values = []
+        for tag in saveframe.tags:
+            line_number = tag[2] if len(tag) > 2 and isinstance(tag[2], int) and tag[2] > 0 else 0
+            tag_values.extend((value(tag[0]), value(tag[1]), line_number))
+        writer.write_array('I', tag_values)
+
+        writer.write_uint32(len(saveframe.loops))
+        for loop in saveframe.loops:
+            writer.write_uint32(value(loop.category))
+            writer.write_array('I', [value(x) for x in loop.tags])
+            writer.write_uint32(len(loop.data))
+
+            num_tags = len(loop.tags)
+            if all(len(row) == num_tags for row in loop.data):
+                writer.write_uint8(LAYOUT_COLUMNS)
+                for column in range(num_tags):
+                    writer.write_column([row[column] for row in loop.data])
+            else:
+                writer.write_uint8(LAYOUT_ROWS)
+                writer.write_array('I', [len(row) for row in loop.data])
+                writer.write_array('I', [value(x) for row in loop.data for x in row])
+
+    return b''.join([MAGIC, _uint8.pack(FORMAT_VERSION), writer.table()] + writer.chunks)
+
+
+def _entry_from_bytes(data: bytes) -> 'entry_mod.Entry':
+    """ Creates an entry from its binary representation. No validation
+    of the tags or values is performed. """
+
+    if not isinstance(data, (bytes, bytearray, memoryview)) or len(data) <= len(MAGIC) or \
+            bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("The data provided is not a serialized entry.")
+    if data[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError("The serialized entry uses format version %s, but only version %s is supported." %
+                         (data[len(MAGIC)], FORMAT_VERSION))
+
+    reader = _Reader(data)
+    reader.position = len(MAGIC) + 1
+
+    try:
+        reader.read_table()
+        values = reader.values
+        read_uint32, read_value, read_array = reader.read_uint32, reader.read_value, reader.read_array
+
+        entry = entry_mod.Entry.from_scratch(read_value())
+        for _ in range(read_uint32()):
+            saveframe = saveframe_mod.Saveframe.from_scratch(read_value())
+            saveframe.tag_prefix = read_value()
+            saveframe.category = read_value()
+
+            tag_values = read_array('I')
+            tags = []
+            for pos in range(0, len(tag_values), 3):
+                if tag_values[pos + 2]:
+                    tags.append([values[tag_values[pos]], values[tag_values[pos + 1]], tag_values[pos + 2]])
+                else:
+                    tags.append([values[tag_values[pos]], values[tag_values[pos + 1]]])
+            saveframe.tags = tags
+
+            for _ in range(read_uint32()):
+                loop = loop_mod.Loop.from_scratch(read_value())
+                loop.tags = list(map(values.__getitem__, read_array('I')))
+                num_rows = read_uint32()
+
+                layout = reader.read_uint8()
+                if layout == LAYOUT_COLUMNS:
+                    columns = [reader.read_column(num_rows) for _ in loop.tags]
+                    if columns:
+                        loop.data = list(map(list, zip(*columns)))
+                    else:
+                        loop.data = [[] for _ in range(num_rows)]
+                elif layout == LAYOUT_ROWS:
+                    row_lengths = read_array('I')
+                    flat = list(map(values.__getitem__, read_array('I')))
+                    offset = 0
+                    for length in row_lengths:
+                        loop.data.append(flat[offset:offset + length])
+                        offset += length
+                else:
+                    raise ValueError("Invalid loop layout in serialized entry: %s" % layout)
+                loop.source = "from_bytes()"
+                saveframe.loops.append(loop)
+
+            saveframe.source = "from_bytes()"
+            entry.frame_list.append(saveframe)
+    except (IndexError, struct.error):
+        raise ValueError("The serialized entry is truncated or corrupt.")
+
+    entry.source = "from_bytes()"
+    return entry
@@ -0,0 +1,432 @@
+""" Implements the optional on-disk cache of parsed entries and schemas
+(see pynmrstar.enable_cache() for details), and the precompiled versions
+of the schemas shipped with the library. """
+
+import logging
+import os
+import sys
+from typing import Dict, Optional, Any, Tuple
+
+from pynmrstar import entry as entry_mod
+from pynmrstar._internal import __version__
+
+logger = logging.getLogger(__name__)
+
+_cache_dir: Optional[str] = None
+_max_bytes: int = 0
+# The size of the cache directory as of the last scan plus what was written since, so that the directory only has to
+#  be scanned when it might be over the limit. Other processes sharing the directory aren't counted, so it is also
+#  rescanned every _RESCAN_WRITES writes.
+_cache_size: Optional[int] = None
+_writes_since_scan: int = 0
+_RESCAN_WRITES: int = 100
+
+# Suffix for the files in the cache directory, so that we never touch anything else in the directory
+_CACHE_SUFFIX: str = '.pynmrstar_cache'
+
+# The schemas shipped with the library, and the precompiled versions of them built when the library is released. These
+#  are loaded instead of parsing the CSV files whether or not the cache is enabled. A runtime copy is kept in
+#  _COMPILED_SCHEMA_DIR, or the user cache directory if that is None, which is compiled from the CSV files if the
+#  shipped copy is missing or out of date (e.g. in a source checkout). The package directory itself is never written
+#  to at runtime.
+_REFERENCE_DIR: str = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'reference_files')
+_COMPILED_SCHEMAS: Dict[str, str] = {os.path.join(_REFERENCE_DIR, 'schema.csv'):
+                                     os.path.join(_REFERENCE_DIR, 'schema.pickle')}
+_COMPILED_SCHEMA_DIR: Optional[str] = None
+# The newest pickle protocol that every supported python version can read, as the precompiled schema is shipped
+_COMPILED_SCHEMA_PROTOCOL: int = 4
+
+
+def enable_cache(path: str, max_bytes: int = 1024 ** 3) -> None:
+    """ Enables the on-disk cache of parsed files. When enabled,
+    Entry.from_file() and Schema() store the objects they parse from
+    local files in the provided directory, and load them from there
+    (without tokenizing the file again) the next time the same file is
+    loaded. A cached copy is only used if the absolute path,
+    modification time, and size of the file, as well as the version of
+    this library, all match.
+
+    Once the files in the cache directory take up more than max_bytes,
+    the least recently used ones are deleted.
+
+    Multiple processes may safely share the same cache directory. The
+    cached schemas are stored using pickle, so only use a directory that
+    no untrusted users can write to."""
+
+    global _cache_dir, _max_bytes, _cache_size
+
+    if max_bytes <= 0:
+        raise ValueError("The maximum cache size must be a positive number of bytes.")
+    os.makedirs(path, exist_ok=True)
+    _cache_dir = os.path.abspath(path)
+    _max_bytes = max_bytes
+    _cache_size = None
+
+
+def disable_cache() -> None:
+    """ Disables the on-disk cache of parsed files. Files already in the
+    cache directory are left in place. """
+
+    global _cache_dir
+
+    _cache_dir = None
+
+
+def _cache_file(kind: str, the_file: Any, *options: Any) -> Optional[str]:
+    """ Returns the location in the cache for the provided file, or None
+    if the file can't be cached. Only local files can be cached. """
+
+    if _cache_dir is None or not isinstance(the_file, str) or \
+            the_file.startswith(("http://", "https://", "ftp://")):
+        return None
+
+    try:
+        absolute_path = os.path.abspath(the_file)
+        stat = os.stat(absolute_path)
+    except OSError:
+        return None
+
+    import hashlib
+
+    key = repr((kind, absolute_path, stat.st_mtime_ns, stat.st_size, __version__) + options)
+    return os.path.join(_cache_dir, hashlib.sha256(key.encode()).hexdigest() + _CACHE_SUFFIX)
+
+
+def _read(cache_file: str) -> Optional[bytes]:
+    """ Returns the contents of a cache file, or None if it isn't cached. """
+
+    try:
+        with open(cache_file, 'rb') as cached:
+            data = cached.read()
+        # Mark the file as recently used
+        os.utime(cache_file)
+        return data
+    except OSError:
+        return None
+
+
+def _write_atomically(file_name: str, data: bytes) -> None:
+    """ Writes to a temporary file and then renames it, so that other
+    processes never see a partial file. """
+
+    import tempfile
+
+    handle, temp_name = tempfile.mkstemp(dir=os.path.dirname(file_name), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_name, file_name)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+def _write(cache_file: str, data: bytes) -> None:
+    """ Atomically writes a file into the cache, and then evicts the
+    least recently used files if the cache might be too large. """
+
+    global _cache_size, _writes_since_scan
+
+    try:
+        _write_atomically(cache_file, data)
+    except OSError as err:
+        logger.warning('Could not write to the pynmrstar cache directory: %s', err)
+        return
+
+    _writes_since_scan += 1
+    if _cache_size is not None:
+        _cache_size += len(data)
+    if _cache_size is None or _cache_size > _max_bytes or _writes_since_scan >= _RESCAN_WRITES:
+        _cache_size = _evict(os.path.dirname(cache_file))
+        _writes_since_scan = 0
+
+
+def _evict(cache_dir: str) -> Optional[int]:
+    """ Deletes the least recently used cache files until the cache is
+    no larger than the maximum size. Returns the size of the cache
+    afterwards, or None if the directory couldn't be read. """
+
+    cached_files = []
+    total_size = 0
+    try:
+        with os.scandir(cache_dir) as directory:
+            for dir_entry in directory:
+                if not dir_entry.name.endswith(_CACHE_SUFFIX):
+                    continue
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    # Another process deleted it
+                    continue
+                cached_files.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                total_size += stat.st_size
+    except OSError:
+        return None
+
+    if total_size <= _max_bytes:
+        return total_size
+
+    for _, size, path in sorted(cached_files):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        total_size -= size
+        if total_size <= _max_bytes:
+            break
+    return total_size
+
+
+def _discard(cache_file: str) -> None:
+    """ Deletes a corrupt cache file, so that it is replaced the next
+    time the file is parsed. """
+
+    logger.warning('Ignoring corrupt file in the pynmrstar cache: %s', cache_file)
+    try:
+        os.unlink(cache_file)
+    except OSError:
+        pass
+
+
+def _load_entry(the_file: Any, convert_data_types: bool) -> Optional['entry_mod.Entry']:
+    """ Returns the cached entry for the file, or None if it isn't
+    cached. """
+
+    cache_file = _cache_file('entry', the_file, convert_data_types)
+    if cache_file is None:
+        return None
+
+    data = _read(cache_file)
+    if data is None:
+        return None
+
+    # A truncated or corrupt file can fail in many ways (ValueError, EOFError, struct.error, KeyError,
+    #  UnicodeDecodeError...), all of which are treated as a cache miss
+    try:
+        entry = entry_mod.Entry.from_bytes(data)
+    except Exception:
+        _discard(cache_file)
+        return None
+
+    # Restore the sources to match a freshly parsed entry
+    source = "from_file('%s')" % the_file
+    entry.source = source
+    for saveframe in entry.frame_list:
+        saveframe.source = source
+        for loop in saveframe.loops:
+            loop.source = source
+
+    return entry
+
+
+def _store_entry(the_file: Any, convert_data_types: bool, entry: 'entry_mod.Entry') -> None:
+    """ Stores the entry parsed from the file in the cache. """
+
+    cache_file = _cache_file('entry', the_file, convert_data_types)
+    if cache_file is not None:
+        _write(cache_file, entry.to_bytes())
+
+
+def _share_strings(attributes: dict) -> dict:
+    """ Returns a copy of the attributes of a schema in which equal
+    strings of the tag definitions are the same object. Pickled, they are
+    then stored once, which makes the schema smaller and faster to load. """
+
+    strings = {}
+    shared = dict(attributes)
+    shared['schema'] = {tag: {key: strings.setdefault(value, value) if isinstance(value, str) else value
+                              for key, value in definition.items()}
+                        for tag, definition in attributes['schema'].items()}
+    return shared
+
+
+def _user_cache_dir() -> str:
+    """ Returns the directory the platform keeps per-user caches in. """
+
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+    return os.path.join(base, 'pynmrstar')
+
+
+def _compiled_schema_files(schema_file: Any) -> Optional[Tuple[str, str]]:
+    """ Returns where the shipped precompiled version of the schema file
+    is, and where it is compiled to at runtime, or None if it is not one of
+    the schemas shipped with the library. """
+
+    if not isinstance(schema_file, str) or schema_file.startswith(("http://", "https://", "ftp://")):
+        return None
+    schema_file = os.path.realpath(schema_file)
+    shipped_file = _COMPILED_SCHEMAS.get(schema_file)
+    if shipped_file is None:
+        return None
+
+    import hashlib
+
+    compiled_dir = _COMPILED_SCHEMA_DIR if _COMPILED_SCHEMA_DIR is not None else _user_cache_dir()
+    compiled_name = 'schema-%s.pickle' % hashlib.sha256(schema_file.encode()).hexdigest()[:16]
+    return shipped_file, os.path.join(compiled_dir, compiled_name)
+
+
+def _source_files(schema_file: str) -> Tuple[str, str]:
+    """ Returns the files the schema is parsed from. """
+
+    return schema_file, os.path.join(_REFERENCE_DIR, 'data_types.csv')
+
+
+def _compiled_schema_key(schema_file: str) -> Optional[tuple]:
+    """ Returns the key of the copy compiled at runtime: the library
+    version, the pickle protocol, and the size and modification time of
+    the files the schema is parsed from, which change whenever they do.
+    Returns None if the files can't be read. """
+
+    key = [__version__, _COMPILED_SCHEMA_PROTOCOL]
+    try:
+        for file_name in _source_files(schema_file):
+            stat = os.stat(file_name)
+            key.append((stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        return None
+    return tuple(key)
+
+
+def _shipped_schema_key(schema_file: str) -> Optional[tuple]:
+    """ Returns the key of the copy shipped with the library: the library
+    version, the pickle protocol, and a hash of the contents of the files
+    the schema is parsed from, as installing the library doesn't preserve
+    their modification times. Returns None if the files can't be read. """
+
+    import hashlib
+
+    hasher = hashlib.sha256()
+    try:
+        for file_name in _source_files(schema_file):
+            with open(file_name, 'rb') as source_file:
+                hasher.update(source_file.read())
+    except OSError:
+        return None
+    return __version__, _COMPILED_SCHEMA_PROTOCOL, hasher.hexdigest()
+
+
+def _read_compiled_schema(compiled_file: str, key: Optional[tuple]) -> Optional[dict]:
+    """ Returns the attributes stored in a precompiled schema, or None if
+    it doesn't exist, is unreadable, or was compiled under another key. """
+
+    if key is None:
+        return None
+
+    import pickle
+
+    try:
+        with open(compiled_file, 'rb') as compiled:
+            # The key is stored first, so that an out of date schema doesn't have to be loaded to find out
+            if pickle.load(compiled) != key:
+                return None
+            return pickle.load(compiled)
+    except OSError:
+        return None
+    except Exception:
+        logger.debug('Ignoring unreadable precompiled schema: %s', compiled_file)
+        return None
+
+
+def _write_compiled_schema(compiled_file: str, key: tuple, attributes: dict) -> None:
+    """ Writes a precompiled schema, keyed with the given key. """
+
+    import pickle
+
+    os.makedirs(os.path.dirname(compiled_file), exist_ok=True)
+    _write_atomically(compiled_file, pickle.dumps(key, protocol=_COMPILED_SCHEMA_PROTOCOL) +
+                      pickle.dumps(_share_strings(attributes), protocol=_COMPILED_SCHEMA_PROTOCOL))
+
+
+def _load_compiled_schema(schema_file: Any) -> Optional[dict]:
+    """ Returns the attributes of the runtime or shipped precompiled
+    version of the schema, or None if there isn't one or they are out of
+    date. Checking the shipped copy means hashing the CSV files, so once
+    it has been checked it is also stored as the runtime copy, which is
+    checked by the file sizes and modification times alone. """
+
+    compiled_files = _compiled_schema_files(schema_file)
+    if compiled_files is None:
+        return None
+    shipped_file, compiled_file = compiled_files
+
+    attributes = _read_compiled_schema(compiled_file, _compiled_schema_key(schema_file))
+    if attributes is None and os.path.isfile(shipped_file):
+        attributes = _read_compiled_schema(shipped_file, _shipped_schema_key(schema_file))
+        if attributes is not None:
+            _store_compiled_schema(schema_file, attributes)
+    return attributes
+
+
+def _store_compiled_schema(schema_file: Any, attributes: dict) -> None:
+    """ Stores the precompiled version of the schema in the user cache
+    directory, if it is one of the schemas shipped with the library. If
+    that can't be written to, the CSV file is parsed every time instead. """
+
+    compiled_files = _compiled_schema_files(schema_file)
+    if compiled_files is None:
+        return
+    key = _compiled_schema_key(schema_file)
+    if key is None:
+        return
+
+    try:
+        _write_compiled_schema(compiled_files[1], key, attributes)
+    except OSError as err:
+        logger.debug('Could not store the precompiled schema: %s', err)
+
+
+def _ship_compiled_schemas() -> None:
+    """ Builds the precompiled versions of the schemas shipped with the
+    library into the package. Run when the library is released. """
+
+    from pynmrstar.schema import Schema
+
+    for schema_file, shipped_file in _COMPILED_SCHEMAS.items():
+        # Leave out the lookup tables, which are rebuilt when the schema is loaded
+        attributes = {name: value for name, value in vars(Schema(schema_file)).items() if not name.startswith('_')}
+        _write_compiled_schema(shipped_file, _shipped_schema_key(schema_file), attributes)
+        # The temporary file it was written through is only readable by its owner
+        os.chmod(shipped_file, 0o644)
+
+
+def _load_schema(schema_file: Any) -> Optional[dict]:
+    """ Returns the attributes of the precompiled or cached schema for the
+    file, or None if there is neither. """
+
+    compiled_schema = _load_compiled_schema(schema_file)
+    if compiled_schema is not None:
+        return compiled_schema
+
+    cache_file = _cache_file('schema', schema_file)
+    if cache_file is None:
+        return None
+
+    data = _read(cache_file)
+    if data is None:
+        return None
+
+    import pickle
+
+    try:
+        return pickle.loads(data)
+    except Exception:
+        _discard(cache_file)
+        return None
+
+
+def _store_schema(schema_file: Any, attributes: dict) -> None:
+    """ Stores the attributes of the schema parsed from the file as its
+    precompiled version, and in the cache. """
+
+    import pickle
+
+    _store_compiled_schema(schema_file, attributes)
+    cache_file = _cache_file('schema', schema_file)
+    if cache_file is not None:
+        _write(cache_file, pickle.dumps(_share_strings(attributes), protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,122 @@
+""" Implements fetching many entries from the BMRB API concurrently, and
+loading entries in the background. See Entry.from_database_many() and
+utils.iter_entries() for details. """
+
+import http.client
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator, Union, Optional, Dict, Callable, Any
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+from pynmrstar import definitions, entry as entry_mod
+from pynmrstar._internal import __version__
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch_entry(api_url: str, entry_num: Union[str, int], convert_data_types: bool, retries: int,
+                 timeout: float) -> 'entry_mod.Entry':
+    """ Downloads, decompresses and loads one entry, retrying requests
+    that fail due to connection problems or server (5xx) errors with an
+    exponential backoff. The request is made the same way as in
+    Entry.from_database(), so proxies and redirects are handled by urllib.
+    Like Entry.from_database(), the entry is loaded from the FTP site if
+    the API server keeps failing or returns an error. """
+
+    request = Request("%s/entry/%s?format=zlib" % (api_url, entry_num),
+                      headers={'Application': 'PyNMRSTAR %s' % __version__})
+    attempt = 0
+    while True:
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                body = response.read()
+            break
+        except HTTPError as err:
+            err.close()
+            if err.code == 404:
+                raise IOError("Entry '%s' does not exist in the public database." % entry_num)
+            # Other client errors won't go away by asking again
+            if err.code < 500 or attempt >= retries:
+                logger.warning("The BMRB API server returned status %s for entry '%s'. Attempting to load from FTP "
+                               "site.", err.code, entry_num)
+                return entry_mod.Entry(entry_num=entry_num)
+        except (OSError, http.client.HTTPException):
+            if attempt >= retries:
+                logger.warning("BMRB API server appears to be down. Attempting to load from FTP site.")
+                return entry_mod.Entry(entry_num=entry_num)
+        time.sleep(0.5 * 2 ** attempt)
+        attempt += 1
+
+    return entry_mod.Entry._from_database_response(entry_num, body, convert_data_types)
+
+
+def _fetch_entries(entry_nums: Iterable[Union[str, int]], convert_data_types: bool, max_workers: int, retries: int,
+                   api_url: Optional[str], timeout: float) -> Iterator['entry_mod.Entry']:
+    """ Yields the entries in the order they finish downloading. At most
+    twice as many entries as there are workers are requested at once, so
+    that arbitrarily long iterables of IDs may be provided. """
+
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1.")
+    if retries < 0:
+        raise ValueError("retries must not be negative.")
+
+    api_url = (api_url or definitions.API_URL).rstrip('/')
+    if urlsplit(api_url).scheme not in ('http', 'https'):
+        raise ValueError("The API URL must start with http:// or https://, not: %s" % api_url)
+    entry_nums = iter(entry_nums)
+    pending: Dict = {}
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while True:
+            while len(pending) < max_workers * 2:
+                try:
+                    entry_num = next(entry_nums)
+                except StopIteration:
+                    break
+                future = executor.submit(_fetch_entry, api_url, entry_num, convert_data_types, retries, timeout)
+                pending[future] = entry_num
+
+            if not pending:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _prefetch(function: Callable[[Any], 'entry_mod.Entry'], arguments: Iterable[Any], prefetch: int,
+              workers: int) -> Iterator['entry_mod.Entry']:
+    """ Yields function(argument) for each of the arguments, in order,
+    while the next prefetch results are computed by the worker threads in
+    the background. No more than prefetch results are ever held in memory
+    beyond the one being yielded. """
+
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1.")
+
+    queue = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for argument in arguments:
+            queue.append(executor.submit(function, argument))
+            if len(queue) > prefetch:
+                yield queue.popleft().result()
+        while queue:
+            yield queue.popleft().result()
+    finally:
+        for future in queue:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -1,87 +1,67 @@
 import decimal
 import logging
 import os
-import sys
+import stat
 from datetime import date
 from gzip import GzipFile
-from io import StringIO, BytesIO
-from typing import Dict, Union, IO
-from urllib.request import urlopen
+from io import StringIO, BytesIO, RawIOBase, BufferedIOBase
+from time import perf_counter
+from typing import Any, Dict, Union, IO, Iterable, Iterator, List, Optional
 
-from pynmrstar import definitions
+from pynmrstar import definitions, hooks, profiling
 
 __version__: str = "3.0.9"
 
+logger = logging.getLogger(__name__)
 
-def _build_extension() -> bool:
-    """ Try to compile the c extension. """
-    import subprocess
-
-    cur_dir = os.getcwd()
-    try:
-        src_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)))
-        os.chdir(os.path.join(src_dir, '..', "c"))
-
-        # Use the appropriate build command
-        process = subprocess.Popen(['make', 'python3'], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        ret_code = process.poll()
-        # The make command exited with a non-zero status
-        if ret_code:
-            logging.warning('Compiling cnmrstar failed with error code %s and stderr: %s', ret_code, stderr)
-            return False
-
-        # We were able to build the extension?
-        return True
-    except OSError:
-        # There was an error going into the c dir
-        logging.warning('Could not find a directory with c source code.')
-        return False
-    finally:
-        # Go back to the directory we were in before exiting
-        os.chdir(cur_dir)
+# The umask of the process, which can only be read by changing it. It is read once here rather than when writing files,
+#  as changing it affects every thread.
+_UMASK: int = os.umask(0)
+os.umask(_UMASK)
 
 
 def _get_cnmrstar() -> Union[None, object]:
-    """ Returns the cnmrstar module, or returns None if it isn't available. """
+    """ Returns the cnmrstar module, or returns None if it isn't available.
+
+    This only imports the module, so that importing PyNMR-STAR never runs
+    a compiler or exits the interpreter. If the module isn't available the
+    pure python implementation is used instead. """
 
     # First see if it's installed via pip
     try:
         import cnmrstar
-        logging.debug('Imported cnmrstar via installed package.')
+        logger.debug('Imported cnmrstar via installed package.')
         return cnmrstar
     except ImportError:
+        pass
 
-        # See if it is compiled locally
-        try:
-            import pynmrstar.cnmrstar as cnmrstar
-            logging.debug('Imported cnmrstar from locally compiled file.')
-
-            if "version" not in dir(cnmrstar) or cnmrstar.version() < "3.0.9":
-                logging.warning("Recompiling cnmrstar module due to API changes. You may experience a segmentation "
-                                "fault immediately following this message but should have no issues the next time you "
-                                "run your script or this program.")
-                _build_extension()
-                sys.exit(0)
-
-            return cnmrstar
-
-        except ImportError:
-
-            # Try to compile cnmrstar, but check for the 'no c module' file before continuing
-            if not os.path.isfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".nocompile")):
-                logging.info('Compiling local cnmrstar module...')
-
-                if _build_extension():
-                    try:
-                        import pynmrstar.cnmrstar as cnmrstar
-                        logging.debug('Imported cnmrstar from locally compiled file.')
-                        return cnmrstar
-                    except ImportError:
-                        return
-            else:
-                logging.debug("Not compiling cnmrstar due to presence of '.nocompile' file")
-                return
+    # See if it is compiled locally
+    try:
+        import pynmrstar.cnmrstar as cnmrstar
+    except ImportError:
+        logger.debug('The cnmrstar module is not available, so the pure python implementation will be used.')
+        return None
+
+    if "version" not in dir(cnmrstar) or cnmrstar.version() < "3.0.9":
+        logger.warning("The locally compiled cnmrstar module is out of date, so the pure python implementation will "
+                       "be used. Run 'make python3' in the c directory to recompile it.")
+        return None
+
+    logger.debug('Imported cnmrstar from locally compiled file.')
+    return cnmrstar
+
+
+def _find_entry_files(directory: str) -> List[str]:
+    """ Returns the sorted paths of every file ending in .str or .str.gz
+    in the directory or its subdirectories. """
+
+    entry_files = []
+    for sub_directory, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            if file_name.endswith(('.str', '.str.gz')):
+                entry_files.append(os.path.join(sub_directory, file_name))
+    entry_files.sort()
+    return entry_files
 
 
 # noinspection PyDefaultArgument
@@ -104,10 +84,10 @@ def _get_comments(_comment_cache: Dict[str, Dict[str, str]] = {}) -> Dict[str, D
     except IOError:
         # Load the comments from Github if we can't find them locally
         try:
-            logging.warning('Could not load comments from disk. Loading from web...')
+            logger.warning('Could not load comments from disk. Loading from web...')
             comment_entry = Entry.from_file(_interpret_file(definitions.COMMENT_URL))
         except Exception:
-            logging.exception('Could not load comments from web. No comments will be shown.')
+            logger.exception('Could not load comments from web. No comments will be shown.')
             # No comments will be printed
             return {}
 
@@ -136,6 +116,7 @@ def _interpret_file(the_file: Union[str, IO]) -> StringIO:
     the_file could be a URL, a file location, a file object, or a
     gzipped version of any of the above."""
 
+    start = perf_counter()
     if hasattr(the_file, 'read'):
         read_data: Union[bytes, str] = the_file.read()
         if type(read_data) == bytes:
@@ -146,6 +127,8 @@ def _interpret_file(the_file: Union[str, IO]) -> StringIO:
             raise IOError("What did your file object return when .read() was called on it?")
     elif isinstance(the_file, str):
         if the_file.startswith("http://") or the_file.startswith("https://") or the_file.startswith("ftp://"):
+            from urllib.request import urlopen
+
             with urlopen(the_file) as url_data:
                 buffer = BytesIO(url_data.read())
         else:
@@ -165,4 +148,116 @@ def _interpret_file(the_file: Union[str, IO]) -> StringIO:
         pass
 
     buffer.seek(0)
-    return StringIO(buffer.read().decode())
+    data = buffer.read().decode()
+    profile = profiling.active()
+    if profile is not None:
+        profile.add('read', perf_counter() - start)
+        profile.bytes_read += len(data)
+    return StringIO(data)
+
+
+def _write_file(the_file: Union[str, IO], chunks: Iterable[str], compress: bool = False,
+                atomic: bool = False, hook_info: Optional[Dict[str, Any]] = None) -> None:
+    """Helper method that writes a series of strings to the_file as they
+    are generated. the_file can be a file location or a text or binary
+    file object. If compress is True, the output is gzipped. If atomic is
+    True, the output is written to a temporary file which then replaces
+    the_file, so that the_file is never left partially written. If
+    hook_info is provided, the write_end hooks are called with it once
+    the file is written."""
+
+    if hook_info is None or not hooks._callbacks['write_end']:
+        _profiled_write_file(the_file, chunks, compress, atomic)
+        return
+
+    size = [0]
+
+    def counted_chunks() -> Iterator[str]:
+        for chunk in chunks:
+            size[0] += len(chunk)
+            yield chunk
+
+    start = perf_counter()
+    _profiled_write_file(the_file, counted_chunks(), compress, atomic)
+    hooks._emit('write_end', file_name=the_file if isinstance(the_file, str) else getattr(the_file, 'name', None),
+                size=size[0], seconds=perf_counter() - start, **hook_info)
+
+
+def _profiled_write_file(the_file: Union[str, IO], chunks: Iterable[str], compress: bool, atomic: bool) -> None:
+    """Writes the file while collecting the profiling counters, if they
+    are being collected."""
+
+    profile = profiling.active()
+    if profile is None:
+        _write_chunks(the_file, chunks, compress, atomic)
+        return
+
+    # Only count the time spent writing, not the time spent generating the chunks
+    generating = [0.0]
+
+    def timed_chunks() -> Iterator[str]:
+        iterator = iter(chunks)
+        while True:
+            start = perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                generating[0] += perf_counter() - start
+            yield chunk
+
+    start = perf_counter()
+    try:
+        _write_chunks(the_file, timed_chunks(), compress, atomic)
+    finally:
+        profile.add('write', perf_counter() - start - generating[0])
+
+
+def _write_chunks(the_file: Union[str, IO], chunks: Iterable[str], compress: bool, atomic: bool) -> None:
+    """Does the work of _write_file() and _profiled_write_file()."""
+
+    if hasattr(the_file, 'write'):
+        if atomic:
+            raise ValueError("Atomic writes are only possible when writing to a file location.")
+        if compress:
+            with GzipFile(fileobj=the_file, mode='wb') as gzip_file:
+                for chunk in chunks:
+                    gzip_file.write(chunk.encode())
+        elif isinstance(the_file, (RawIOBase, BufferedIOBase)):
+            for chunk in chunks:
+                the_file.write(chunk.encode())
+        else:
+            for chunk in chunks:
+                the_file.write(chunk)
+        return
+
+    if not atomic:
+        with (GzipFile(the_file, 'wb') if compress else open(the_file, 'w')) as out_file:
+            for chunk in chunks:
+                out_file.write(chunk.encode() if compress else chunk)
+        return
+
+    import tempfile
+
+    # Write to a temporary file in the same directory, and then rename it over the original
+    directory, file_name = os.path.split(os.path.abspath(the_file))
+    handle, temp_name = tempfile.mkstemp(dir=directory, prefix='.%s.' % file_name, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb' if compress else 'w') as temp_file:
+            if compress:
+                temp_file = GzipFile(fileobj=temp_file, mode='wb', filename=file_name)
+            with temp_file:
+                for chunk in chunks:
+                    temp_file.write(chunk.encode() if compress else chunk)
+
+        # Give the new file the permissions the file had, or would have if newly created
+        try:
+            mode = stat.S_IMODE(os.stat(the_file).st_mode)
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, the_file)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
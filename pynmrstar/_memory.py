@@ -0,0 +1,91 @@
+""" Estimates how much memory an entry uses, as used by
+Entry.memory_report().
+
+The sizes are measured with sys.getsizeof(), and are split into:
+
+    row_overhead       the lists that hold the rows and the saveframe tags,
+                       and the line numbers stored with the tags
+    strings            the str values, including the saveframe tag names
+    converted          the values of other types, e.g. Decimal, date and int
+    total              the sum of the three above
+    interning_savings  the part of strings that would be saved if equal
+                       strings were stored as one shared object
+
+Objects that are shared (e.g. a string that appears in several places, or
+small ints) are only counted where they first appear. """
+
+import sys
+from typing import Any, Dict, List, Optional
+
+from pynmrstar import entry as entry_mod
+
+_KEYS: List[str] = ['row_overhead', 'strings', 'converted', 'total', 'interning_savings']
+
+
+def _new_counts() -> Dict[str, int]:
+    return dict.fromkeys(_KEYS, 0)
+
+
+def _add_counts(counts: Dict[str, int], other: Dict[str, Any]) -> None:
+    for key in _KEYS:
+        counts[key] += other[key]
+
+
+class _MemoryCounter(object):
+    """ Counts the memory used by rows of values, remembering which objects
+    and string values were already counted. """
+
+    def __init__(self) -> None:
+        self.counted: set = set()
+        self.string_values: set = set()
+
+    def count_rows(self, rows: List[list], width: Optional[int] = None) -> Dict[str, int]:
+        """ Returns the counts for the rows. Only the first width items of
+        each row are counted as values; the rest count as overhead. """
+
+        counts = _new_counts()
+        getsizeof = sys.getsizeof
+        counts['row_overhead'] = getsizeof(rows) + sum([getsizeof(row) for row in rows])
+
+        for row in rows:
+            for pos, value in enumerate(row):
+                if value is None or id(value) in self.counted:
+                    continue
+                self.counted.add(id(value))
+                size = getsizeof(value)
+                if width is not None and pos >= width:
+                    counts['row_overhead'] += size
+                elif isinstance(value, str):
+                    counts['strings'] += size
+                    if value in self.string_values:
+                        counts['interning_savings'] += size
+                    else:
+                        self.string_values.add(value)
+                else:
+                    counts['converted'] += size
+
+        counts['total'] = counts['row_overhead'] + counts['strings'] + counts['converted']
+        return counts
+
+
+def _memory_report(entry: 'entry_mod.Entry') -> Dict[str, Any]:
+    """ Does the work of Entry.memory_report(). """
+
+    counter = _MemoryCounter()
+    total, saveframes, loops, categories = _new_counts(), [], [], {}
+
+    for saveframe in entry.frame_list:
+        counts = counter.count_rows(saveframe.tags, width=2)
+        saveframes.append(dict(name=saveframe.name, category=saveframe.category, tags=len(saveframe.tags), **counts))
+        _add_counts(categories.setdefault(saveframe.tag_prefix, _new_counts()), counts)
+        _add_counts(total, counts)
+
+        for loop in saveframe.loops:
+            counts = counter.count_rows(loop.data)
+            loops.append(dict(saveframe=saveframe.name, category=loop.category, rows=len(loop.data),
+                              columns=len(loop.tags), **counts))
+            _add_counts(categories.setdefault(loop.category, _new_counts()), counts)
+            _add_counts(total, counts)
+
+    return {'total': total, 'saveframes': saveframes, 'loops': loops,
+            'categories': dict(sorted(categories.items(), key=lambda x: x[1]['total'], reverse=True))}
@@ -0,0 +1,97 @@
+""" Implements formatting and validating the saveframes of an entry
+concurrently in worker processes. See Entry.format(),
+Entry.write_to_file() and Entry.validate() for details. """
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from pynmrstar import definitions, saveframe as saveframe_mod
+from pynmrstar._internal import _get_comments
+from pynmrstar.schema import Schema
+
+# The number of batches the saveframes are split into for each worker
+BATCHES_PER_WORKER: int = 4
+
+
+def _format_batch(batch: List[Tuple['saveframe_mod.Saveframe', bool]], skip_empty_loops: bool,
+                  skip_empty_tags: bool, compact: bool, str_conversion_dict: dict) -> List[str]:
+    """ Formats a batch of saveframes in a worker process. The
+    STR_CONVERSION_DICT of the calling process is used, as the worker may
+    not have been forked from it. """
+
+    definitions.STR_CONVERSION_DICT = str_conversion_dict
+    return ["".join(saveframe._format_chunks(first_in_category=True, skip_empty_loops=skip_empty_loops,
+                                             skip_empty_tags=skip_empty_tags, show_comments=show_comments,
+                                             compact=compact))
+            for saveframe, show_comments in batch]
+
+
+def _validate_batch(batch: List['saveframe_mod.Saveframe'], validate_schema: bool, schema: Optional[Schema],
+                    validate_star: bool, max_errors: Optional[int], str_conversion_dict: dict) -> List[List[str]]:
+    """ Validates a batch of saveframes in a worker process, and returns
+    the errors of each saveframe. The batch stops early once max_errors
+    errors have been found. """
+
+    definitions.STR_CONVERSION_DICT = str_conversion_dict
+    results, found = [], 0
+    for saveframe in batch:
+        if max_errors is not None and found >= max_errors:
+            break
+        errors = saveframe.validate(validate_schema=validate_schema, schema=schema, validate_star=validate_star,
+                                    max_errors=max_errors - found if max_errors is not None else None)
+        found += len(errors)
+        results.append(errors)
+    return results
+
+
+def _map_batches(function: Callable[..., List[Any]], items: list, workers: int, *args) -> Iterator[Any]:
+    """ Yields the results of calling function(batch, *args) on batches of
+    the items, in order. The items are pickled and sent to a pool of
+    worker processes in batches, so that each worker gets several batches
+    (to balance the load) but the per-task overhead stays small. At most
+    twice as many batches as there are workers are in flight at once, so
+    that not every result is held in memory at once. Batches that have not
+    completed are cancelled when the generator is closed. """
+
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+
+    batch_size = max(1, len(items) // (workers * BATCHES_PER_WORKER))
+    queue = deque()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for pos in range(0, len(items), batch_size):
+            queue.append(executor.submit(function, items[pos:pos + batch_size], *args))
+            if len(queue) > workers * 2:
+                yield from queue.popleft().result()
+        while queue:
+            yield from queue.popleft().result()
+    finally:
+        for future in queue:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _format_saveframes(saveframes: List[Tuple['saveframe_mod.Saveframe', bool]], workers: int,
+                       skip_empty_loops: bool, skip_empty_tags: bool, compact: bool = False) -> Iterator[str]:
+    """ Yields the formatted text of each of the (saveframe, show_comments)
+    pairs, in order. """
+
+    # Load the comments before the pool starts, so that forked workers don't each have to load them
+    _get_comments()
+
+    return _map_batches(_format_batch, saveframes, workers, skip_empty_loops, skip_empty_tags, compact,
+                        definitions.STR_CONVERSION_DICT)
+
+
+def _validate_saveframes(saveframes: List['saveframe_mod.Saveframe'], workers: int, validate_schema: bool,
+                         schema: Optional[Schema], validate_star: bool,
+                         max_errors: Optional[int]) -> Iterator[List[str]]:
+    """ Yields the errors of each saveframe, in order. When max_errors is
+    given, each batch stops after that many errors, so fewer lists than
+    saveframes may be yielded; the caller should stop once it has enough
+    errors. If no schema is given, each worker uses its default schema. """
+
+    return _map_batches(_validate_batch, saveframes, workers, validate_schema, schema, validate_star, max_errors,
+                        definitions.STR_CONVERSION_DICT)
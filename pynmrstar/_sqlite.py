@@ -0,0 +1,259 @@
+""" Implements storing entries in an SQLite database, as used by
+Entry.to_sqlite() and Entry.from_sqlite().
+
+Each saveframe tag category (e.g. _Entry) and each loop category (e.g.
+_Atom_chem_shift) is stored in a table of the same name, without the
+leading underscore. Saveframe tables hold one row per saveframe and loop
+tables one row per loop row. In addition to a column for each tag, every
+table has the columns:
+
+    _entry_id    the ID of the entry the row belongs to
+    _saveframe   the name of the saveframe the row belongs to
+    _row         the position of the row in its loop (0 for saveframes)
+
+The columns are typed using the data types of the schema, and the columns
+that point to other categories (according to the Foreign Table and Foreign
+Column of the schema) are indexed, so that tables can be joined quickly.
+Null values are stored as NULL.
+
+The order of the saveframes, loops and tags of each entry is recorded in
+the _pynmrstar_saveframes and _pynmrstar_loops tables, so that the entry
+can be rebuilt exactly. """
+
+import decimal
+import json
+import sqlite3
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+
+from pynmrstar import definitions, entry as entry_mod, loop as loop_mod, saveframe as saveframe_mod
+from pynmrstar.schema import Schema
+
+# Maps the data types of the schema to SQLite column types
+SQLITE_TYPES: Dict[str, str] = {'INTEGER': 'INTEGER', 'FLOAT': 'REAL'}
+
+_BOOKKEEPING_COLUMNS: List[str] = ['_entry_id', '_saveframe', '_row']
+
+
+def _quote_identifier(name: str) -> str:
+    return '"%s"' % name.replace('"', '""')
+
+
+def _schema_type(schema: Schema, category: str, tag: str) -> str:
+    """ Returns the data type of the tag according to the schema, or an
+    empty string if the tag isn't in the schema. """
+
+    tag_schema = schema.schema.get(("%s.%s" % (category, tag)).lower())
+    if tag_schema is None:
+        return ''
+    return tag_schema['Data Type']
+
+
+def _to_sql_value(value: Any) -> Any:
+    if value in definitions.NULL_VALUES:
+        return None
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def _from_sql_value(value: Any, data_type: str) -> Any:
+    """ Converts a value read from the database to the type that
+    Schema.convert_tag() would produce. """
+
+    if isinstance(value, float):
+        return decimal.Decimal(repr(value))
+    if isinstance(value, str) and data_type == 'DATETIME year to day':
+        try:
+            year, month, day = [int(x) for x in value.split("-")]
+            return date(year, month, day)
+        except ValueError:
+            pass
+    return value
+
+
+class _TableWriter(object):
+    """ Creates and extends the category tables as needed. """
+
+    def __init__(self, connection: sqlite3.Connection, schema: Schema) -> None:
+        self.connection = connection
+        self.schema = schema
+        self.columns: Dict[str, set] = {}
+        self.schema_tags: Optional[Dict[str, List[str]]] = None
+
+        for (table,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+            self.columns[table.lower()] = set(
+                row[1].lower() for row in connection.execute("PRAGMA table_info(%s)" % _quote_identifier(table)))
+
+    def column_definition(self, category: str, tag: str) -> str:
+        data_type = _schema_type(self.schema, category, tag)
+        return "%s %s" % (_quote_identifier(tag), SQLITE_TYPES.get(data_type, 'TEXT'))
+
+    def create_indexes(self, table: str, category: str, tags: List[str]) -> None:
+        """ Indexes the columns of the tags which refer to another
+        category. """
+
+        for tag in tags:
+            tag_schema = self.schema.schema.get(("%s.%s" % (category, tag)).lower())
+            if tag_schema is not None and tag_schema['Foreign Table'] and tag_schema['Foreign Column']:
+                self.connection.execute("CREATE INDEX %s ON %s (_entry_id, %s)" % (
+                    _quote_identifier("%s_%s_index" % (table, tag)), _quote_identifier(table),
+                    _quote_identifier(tag)))
+
+    def prepare(self, category: str, tags: List[str]) -> str:
+        """ Makes sure that the table of the category exists and has a
+        column for each of the tags, and returns the table name. New
+        tables get a column for every tag of the category in the schema,
+        so that the tables rarely need to be altered later on. """
+
+        table = category.lstrip('_')
+        existing = self.columns.get(table.lower())
+
+        if existing is None:
+            if self.schema_tags is None:
+                self.schema_tags = {}
+                for tag in self.schema.schema_order:
+                    self.schema_tags.setdefault(tag.split('.')[0].lower(), []).append(tag.split('.')[1])
+
+            columns, seen = [], set()
+            for tag in self.schema_tags.get(category.lower(), []) + tags:
+                if tag.lower() not in seen:
+                    columns.append(tag)
+                    seen.add(tag.lower())
+            self.connection.execute(
+                "CREATE TABLE %s (_entry_id TEXT NOT NULL, _saveframe TEXT NOT NULL, _row INTEGER NOT NULL, %s"
+                "PRIMARY KEY (_entry_id, _saveframe, _row))" % (
+                    _quote_identifier(table), "".join([self.column_definition(category, x) + ", " for x in columns])))
+            self.create_indexes(table, category, columns)
+            self.columns[table.lower()] = seen.union(_BOOKKEEPING_COLUMNS)
+            return table
+
+        for tag in tags:
+            if tag.lower() not in existing:
+                self.connection.execute("ALTER TABLE %s ADD COLUMN %s" % (
+                    _quote_identifier(table), self.column_definition(category, tag)))
+                self.create_indexes(table, category, [tag])
+                existing.add(tag.lower())
+
+        return table
+
+
+def _create_tables(connection: sqlite3.Connection) -> None:
+    connection.execute("CREATE TABLE IF NOT EXISTS _pynmrstar_saveframes (entry_id TEXT NOT NULL, "
+                       "position INTEGER NOT NULL, name TEXT NOT NULL, category TEXT, tag_prefix TEXT, "
+                       "tags TEXT NOT NULL, PRIMARY KEY (entry_id, position))")
+    connection.execute("CREATE TABLE IF NOT EXISTS _pynmrstar_loops (entry_id TEXT NOT NULL, "
+                       "saveframe TEXT NOT NULL, position INTEGER NOT NULL, category TEXT NOT NULL, "
+                       "tags TEXT NOT NULL, PRIMARY KEY (entry_id, saveframe, position))")
+
+
+def _delete_entry(connection: sqlite3.Connection, entry_id: str, existing_tables: Iterable[str]) -> None:
+    """ Removes all of the rows of an entry from the database. """
+
+    tables = set()
+    for (tag_prefix,) in connection.execute("SELECT tag_prefix FROM _pynmrstar_saveframes WHERE entry_id = ?",
+                                            (entry_id,)):
+        if tag_prefix:
+            tables.add(tag_prefix.lstrip('_'))
+    for (category,) in connection.execute("SELECT category FROM _pynmrstar_loops WHERE entry_id = ?", (entry_id,)):
+        tables.add(category.lstrip('_'))
+
+    for table in tables:
+        if table.lower() not in existing_tables:
+            continue
+        connection.execute("DELETE FROM %s WHERE _entry_id = ?" % _quote_identifier(table), (entry_id,))
+    connection.execute("DELETE FROM _pynmrstar_saveframes WHERE entry_id = ?", (entry_id,))
+    connection.execute("DELETE FROM _pynmrstar_loops WHERE entry_id = ?", (entry_id,))
+
+
+def _insert_rows(connection: sqlite3.Connection, table: str, tags: List[str], rows: List[list]) -> None:
+    columns = ", ".join([_quote_identifier(x) for x in _BOOKKEEPING_COLUMNS + tags])
+    placeholders = ", ".join(["?"] * (len(tags) + len(_BOOKKEEPING_COLUMNS)))
+    connection.executemany("INSERT INTO %s (%s) VALUES (%s)" % (_quote_identifier(table), columns, placeholders),
+                           rows)
+
+
+def _entry_to_sqlite(entry: 'entry_mod.Entry', connection: sqlite3.Connection, schema: Schema) -> None:
+    """ Stores the entry in the database, replacing any previously stored
+    entry with the same ID. Everything is done in one transaction. """
+
+    entry_id = str(entry.entry_id)
+    with connection:
+        _create_tables(connection)
+        writer = _TableWriter(connection, schema)
+        _delete_entry(connection, entry_id, writer.columns)
+
+        for position, saveframe in enumerate(entry.frame_list):
+            tag_names = [tag[0] for tag in saveframe.tags]
+            connection.execute("INSERT INTO _pynmrstar_saveframes VALUES (?, ?, ?, ?, ?, ?)",
+                               (entry_id, position, saveframe.name, saveframe.category, saveframe.tag_prefix,
+                                json.dumps(tag_names)))
+            if saveframe.tags:
+                if saveframe.tag_prefix is None:
+                    raise ValueError("The tag prefix was never set for saveframe '%s'." % saveframe.name)
+                table = writer.prepare(saveframe.tag_prefix, tag_names)
+                _insert_rows(connection, table, tag_names,
+                             [[entry_id, saveframe.name, 0] + [_to_sql_value(tag[1]) for tag in saveframe.tags]])
+
+            for loop_position, loop in enumerate(saveframe.loops):
+                if loop.category is None:
+                    raise ValueError("The category was never set for a loop in saveframe '%s'." % saveframe.name)
+                loop._check_tags_match_data()
+                connection.execute("INSERT INTO _pynmrstar_loops VALUES (?, ?, ?, ?, ?)",
+                                   (entry_id, saveframe.name, loop_position, loop.category, json.dumps(loop.tags)))
+                if loop.tags and loop.data:
+                    table = writer.prepare(loop.category, loop.tags)
+                    _insert_rows(connection, table, loop.tags,
+                                 [[entry_id, saveframe.name, row_pos] + [_to_sql_value(x) for x in row]
+                                  for row_pos, row in enumerate(loop.data)])
+
+
+def _read_rows(connection: sqlite3.Connection, category: str, tags: List[str], entry_id: str, saveframe: str,
+               schema: Schema) -> List[list]:
+    data_types = [_schema_type(schema, category, tag) for tag in tags]
+    cursor = connection.execute(
+        "SELECT %s FROM %s WHERE _entry_id = ? AND _saveframe = ? ORDER BY _row" % (
+            ", ".join([_quote_identifier(x) for x in tags]), _quote_identifier(category.lstrip('_'))),
+        (entry_id, saveframe))
+    return [[_from_sql_value(value, data_type) for value, data_type in zip(row, data_types)] for row in cursor]
+
+
+def _entry_from_sqlite(connection: sqlite3.Connection, entry_id: str,
+                       schema: Optional[Schema]) -> 'entry_mod.Entry':
+    """ Rebuilds an entry stored using _entry_to_sqlite(). """
+
+    try:
+        saveframe_rows = connection.execute("SELECT name, category, tag_prefix, tags FROM _pynmrstar_saveframes "
+                                            "WHERE entry_id = ? ORDER BY position", (entry_id,)).fetchall()
+        loop_rows = connection.execute("SELECT saveframe, category, tags FROM _pynmrstar_loops "
+                                       "WHERE entry_id = ? ORDER BY saveframe, position", (entry_id,)).fetchall()
+    except sqlite3.OperationalError:
+        raise ValueError("The database does not contain any entries.")
+    if not saveframe_rows:
+        raise ValueError("Entry '%s' is not in the database." % entry_id)
+
+    loops: Dict[str, list] = {}
+    for saveframe_name, category, tags in loop_rows:
+        loops.setdefault(saveframe_name, []).append((category, json.loads(tags)))
+
+    source = "from_sqlite()"
+    entry = entry_mod.Entry.from_scratch(entry_id)
+    for name, category, tag_prefix, tags in saveframe_rows:
+        saveframe = saveframe_mod.Saveframe.from_scratch(name, source=source)
+        saveframe.category = category
+        saveframe.tag_prefix = tag_prefix
+        tags = json.loads(tags)
+        if tags:
+            values = _read_rows(connection, tag_prefix, tags, entry_id, name, schema)[0]
+            saveframe.tags = [[tag, value] for tag, value in zip(tags, values)]
+
+        for loop_category, loop_tags in loops.get(name, []):
+            loop = loop_mod.Loop.from_scratch(loop_category, source=source)
+            loop.tags = loop_tags
+            if loop_tags:
+                loop.data = _read_rows(connection, loop_category, loop_tags, entry_id, name, schema)
+            saveframe.loops.append(loop)
+        entry.frame_list.append(saveframe)
+
+    entry.source = source
+    return entry
@@ -0,0 +1,260 @@
+""" A performance harness for PyNMR-STAR. Times the main operations
+(parsing with the C and the python tokenizer, formatting, validating,
+normalizing, JSON conversion, and the loop operations) on entries of
+several sizes, as well as importing the library, and compares the results against a previous run to catch
+performance regressions.
+
+From the command line:
+
+    python -m pynmrstar.benchmarks --output results.json
+    python -m pynmrstar.benchmarks --baseline results.json --threshold 0.2
+
+Or from python:
+
+    >>> from pynmrstar import benchmarks
+    >>> results = benchmarks.run(sizes=[1, 10])
+    >>> benchmarks.save(results, 'results.json')
+    >>> benchmarks.compare(results, benchmarks.load('baseline.json'))
+
+The entries are made by repeating the rows of every loop of a base entry
+(by default the sample entry of the unit tests) size times, or for the
+benchmarks in SAVEFRAME_SCALED, by repeating every saveframe size
+times. """
+
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from copy import deepcopy
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pynmrstar import entry as entry_mod, loop as loop_mod, parser as parser_mod, utils
+from pynmrstar._internal import __version__
+
+# The default entry to scale up, and the default sizes to scale it to
+SAMPLE_ENTRY: str = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'unit_tests',
+                                 'sample_files', 'bmr15000_3.str')
+SIZES: List[int] = [1, 10, 50]
+
+
+def _largest_loop(entry: 'entry_mod.Entry') -> 'loop_mod.Loop':
+    return max([loop for saveframe in entry for loop in saveframe.loops], key=len)
+
+
+def _parse_c(entry: 'entry_mod.Entry') -> Optional[Callable[[], Any]]:
+    if parser_mod.cnmrstar is None:
+        return None
+    text = str(entry)
+    return lambda: entry_mod.Entry.from_string(text)
+
+
+def _parse_python(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    text = str(entry)
+
+    def run():
+        cnmrstar, parser_mod.cnmrstar = parser_mod.cnmrstar, None
+        try:
+            entry_mod.Entry.from_string(text)
+        finally:
+            parser_mod.cnmrstar = cnmrstar
+    return run
+
+
+def _format(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    return entry.format
+
+
+def _validate(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    schema = utils.get_schema()
+    return lambda: entry.validate(schema=schema)
+
+
+def _normalize(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    schema = utils.get_schema()
+    copied = deepcopy(entry)
+    return lambda: copied.normalize(schema=schema)
+
+
+def _get_json(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    return entry.get_json
+
+
+def _from_json(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    serialized = entry.get_json()
+    return lambda: entry_mod.Entry.from_json(serialized)
+
+
+def _loop_get_tag(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    loop = _largest_loop(entry)
+    return lambda: loop.get_tag(loop.tags[:3])
+
+
+def _loop_sort_rows(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    loop = deepcopy(_largest_loop(entry))
+    loop.data.reverse()
+    return lambda: loop.sort_rows(loop.tags[0])
+
+
+def _import(entry: 'entry_mod.Entry') -> Callable[[], Any]:
+    # Import the library in a new interpreter (which is included in the time), from the same location as this one
+    command = "import sys; sys.path.insert(0, %r); import pynmrstar" % os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.realpath(__file__))))
+    return lambda: subprocess.run([sys.executable, '-c', command], check=True)
+
+
+# Each benchmark prepares (outside of the timed part) and returns the function to time, or None if the
+#  benchmark can't run here. It is prepared again for each repetition.
+BENCHMARKS: Dict[str, Callable[['entry_mod.Entry'], Optional[Callable[[], Any]]]] = {
+    'parse_c': _parse_c,
+    'parse_python': _parse_python,
+    'format': _format,
+    'validate': _validate,
+    'normalize': _normalize,
+    'normalize_wide': _normalize,
+    'get_json': _get_json,
+    'from_json': _from_json,
+    'loop_get_tag': _loop_get_tag,
+    'loop_sort_rows': _loop_sort_rows,
+    'import': _import,
+}
+# The benchmarks which don't depend on the entry, and are only run for the first size
+SIZE_INDEPENDENT: List[str] = ['import']
+# The benchmarks which are run on entries with the saveframes (rather than the loop rows) repeated size times, e.g. to
+#  time sorting many saveframes and their tags
+SAVEFRAME_SCALED: List[str] = ['normalize_wide']
+
+
+def scale_entry(entry: 'entry_mod.Entry', size: int, saveframes: bool = False) -> 'entry_mod.Entry':
+    """ Returns a copy of the entry with the rows of each loop repeated
+    size times. If saveframes is True, each saveframe is repeated size
+    times instead, with the copies named <name>_2, <name>_3 and so on. """
+
+    scaled = deepcopy(entry)
+    if saveframes:
+        frame_list = []
+        for saveframe in scaled.frame_list:
+            frame_list.append(saveframe)
+            for copy_number in range(2, size + 1):
+                copied = deepcopy(saveframe)
+                copied.name = "%s_%d" % (saveframe.name, copy_number)
+                frame_list.append(copied)
+        scaled.frame_list = frame_list
+        return scaled
+
+    for saveframe in scaled:
+        for loop in saveframe.loops:
+            loop.data = [row[:] for _ in range(size) for row in loop.data]
+    return scaled
+
+
+def run(sizes: Iterable[int] = None, repeat: int = 5, benchmarks: Iterable[str] = None,
+        entry: Optional['entry_mod.Entry'] = None, progress: Callable[[str], None] = None) -> Dict[str, Any]:
+    """ Runs the benchmarks and returns the results. Each benchmark is run
+    repeat times on each size of entry, and the fastest and median times
+    (in seconds) are recorded.
+
+    Specify benchmarks to only run some of the benchmarks (see BENCHMARKS
+    for their names), and entry to scale up a different entry than the
+    sample entry. progress is called with the name of each result as it
+    is finished."""
+
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1.")
+    if benchmarks is None:
+        benchmarks = list(BENCHMARKS)
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            raise ValueError("Unknown benchmark '%s'. Valid benchmarks are: %s" % (name, ", ".join(BENCHMARKS)))
+    if entry is None:
+        if not os.path.isfile(SAMPLE_ENTRY):
+            raise IOError("The sample entry '%s' is not available. Please provide an entry to benchmark with."
+                          % SAMPLE_ENTRY)
+        entry = entry_mod.Entry.from_file(SAMPLE_ENTRY)
+
+    # Warnings (e.g. from normalize()) would flood the output, and logging them would be timed as well
+    previous_disable = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    try:
+        results = _run(sizes if sizes is not None else SIZES, repeat, benchmarks, entry, progress)
+    finally:
+        logging.disable(previous_disable)
+
+    return {'metadata': {'pynmrstar_version': __version__, 'python_version': platform.python_version(),
+                         'platform': platform.platform(), 'c_tokenizer': parser_mod.cnmrstar is not None,
+                         'c_formatter': hasattr(utils.cnmrstar, 'format_loop'),
+                         'date': datetime.now().isoformat()},
+            'results': results}
+
+
+def _run(sizes: Iterable[int], repeat: int, benchmarks: Iterable[str], entry: 'entry_mod.Entry',
+         progress: Optional[Callable[[str], None]]) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for pos, size in enumerate(sizes):
+        scaled = {saveframes: scale_entry(entry, size, saveframes=saveframes)
+                  for saveframes in set([name in SAVEFRAME_SCALED for name in benchmarks])}
+        rows = {saveframes: sum([len(loop) for saveframe in scaled_entry for loop in saveframe.loops])
+                for saveframes, scaled_entry in scaled.items()}
+
+        for name in benchmarks:
+            if pos > 0 and name in SIZE_INDEPENDENT:
+                continue
+            saveframes = name in SAVEFRAME_SCALED
+            timings = []
+            for _ in range(repeat):
+                function = BENCHMARKS[name](scaled[saveframes])
+                if function is None:
+                    break
+                start = time.perf_counter()
+                function()
+                timings.append(time.perf_counter() - start)
+            if not timings:
+                continue
+
+            result_name = "%s[size=%d]" % (name, size)
+            results[result_name] = {'benchmark': name, 'size': size, 'rows': rows[saveframes], 'min': min(timings),
+                                    'median': statistics.median(timings), 'repeat': repeat}
+            if progress is not None:
+                progress(result_name)
+
+    return results
+
+
+def save(results: Dict[str, Any], file_name: str) -> None:
+    """ Writes the results of run() to a JSON file. """
+
+    with open(file_name, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load(file_name: str) -> Dict[str, Any]:
+    """ Loads results which were written using save(). """
+
+    with open(file_name, 'r') as results_file:
+        return json.load(results_file)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = 0.1) -> List[Tuple[str, float, float, float]]:
+    """ Compares results against the baseline results, and returns the
+    regressions as a list of (name, baseline time, new time, ratio) tuples.
+    A result has regressed if its fastest time is more than threshold
+    (a fraction, e.g. 0.1 for 10%) slower than in the baseline. Results
+    which are missing from either run are ignored. """
+
+    regressions = []
+    for name, result in sorted(results['results'].items()):
+        if name not in baseline['results']:
+            continue
+        old, new = baseline['results'][name]['min'], result['min']
+        if old > 0 and new > old * (1 + threshold):
+            regressions.append((name, old, new, new / old))
+    return regressions
+
+
+__all__ = ['BENCHMARKS', 'SAVEFRAME_SCALED', 'SIZES', 'SIZE_INDEPENDENT', 'compare', 'load', 'run', 'save',
+           'scale_entry']
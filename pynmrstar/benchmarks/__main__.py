@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+""" Runs the benchmarks from the command line. See pynmrstar.benchmarks for
+details. Exits with status 1 if a regression against the baseline was
+found. """
+
+import argparse
+import sys
+
+from pynmrstar import Entry, benchmarks
+
+
+def main(args: list = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m pynmrstar.benchmarks',
+                                     description='Time the main PyNMR-STAR operations on entries of several sizes.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results against the results in this JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='How much slower (as a fraction) a result may be than the baseline before it is '
+                             'reported as a regression. Default: %(default)s')
+    parser.add_argument('--sizes', type=lambda x: [int(y) for y in x.split(',')], default=benchmarks.SIZES,
+                        help='Comma separated list of the number of times to repeat the loop rows of the entry. '
+                             'Default: %s' % ','.join([str(x) for x in benchmarks.SIZES]))
+    parser.add_argument('--repeat', type=int, default=5, help='How many times to run each benchmark. '
+                                                              'Default: %(default)s')
+    parser.add_argument('--entry', help='The NMR-STAR file to benchmark with, rather than the sample entry.')
+    parser.add_argument('--only', nargs='+', choices=list(benchmarks.BENCHMARKS), metavar='BENCHMARK',
+                        help='Only run these benchmarks. Choices: %s' % ', '.join(benchmarks.BENCHMARKS))
+    options = parser.parse_args(args)
+
+    entry = Entry.from_file(options.entry) if options.entry else None
+    results = benchmarks.run(sizes=options.sizes, repeat=options.repeat, benchmarks=options.only, entry=entry)
+
+    print("%-30s %10s %12s %12s" % ('Benchmark', 'Rows', 'Min (ms)', 'Median (ms)'))
+    for name, result in results['results'].items():
+        print("%-30s %10d %12.2f %12.2f" % (name, result['rows'], result['min'] * 1000, result['median'] * 1000))
+
+    if options.output:
+        benchmarks.save(results, options.output)
+
+    if options.baseline:
+        regressions = benchmarks.compare(results, benchmarks.load(options.baseline), threshold=options.threshold)
+        if regressions:
+            print("\nRegressions of more than %d%% against %s:" % (options.threshold * 100, options.baseline))
+            for name, old, new, ratio in regressions:
+                print("%-30s %10.2f ms -> %10.2f ms (%.2fx)" % (name, old * 1000, new * 1000, ratio))
+            return 1
+        print("\nNo regressions of more than %d%% against %s." % (options.threshold * 100, options.baseline))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+""" Provides the Corpus class, which runs an analysis over a collection of
+NMR-STAR files (such as a local mirror of the BMRB archive) using a pool of
+worker processes.
+
+    >>> import operator
+    >>> from pynmrstar.corpus import Corpus
+    >>> def count_shifts(entry):
+    ...     return sum(len(loop) for loop in entry.get_loops_by_category('_Atom_chem_shift'))
+    >>> corpus = Corpus('/data/bmrb/**/*.str')
+    >>> total = corpus.reduce(count_shifts, operator.add, 0, workers=8)
+    >>> corpus.errors
+    [('/data/bmrb/bmr1234/bmr1234_3.str', "ParsingError: ...")]
+
+The functions given to map() and reduce() are sent to the worker processes,
+so when using more than one worker they must be defined at the top level of
+a module (not a lambda or a nested function) and return something that can
+be pickled.
+
+validate_many() validates every entry of a collection of files:
+
+    >>> from pynmrstar.corpus import validate_many
+    >>> errors = validate_many('/data/bmrb/**/*.str', workers=8, max_errors=10)
+
+The TagIndex class builds a persistent index of the values of every tag in
+a corpus, to quickly find which entries contain a value.
+"""
+
+import functools
+import glob
+import os
+import traceback
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pynmrstar import definitions, entry as entry_mod, utils
+from pynmrstar._internal import _find_entry_files
+
+# Used to tell "no initial value" apart from an initial value of None
+_NO_INITIAL = object()
+
+
+def _load_file(file_name: str, categories: Optional[List[str]], convert_data_types: bool) -> 'entry_mod.Entry':
+    """ Loads one file, keeping only the saveframes of the given categories
+    (if any were given). """
+
+    entry = entry_mod.Entry.from_file(file_name, convert_data_types=convert_data_types)
+    if categories is not None:
+        entry.frame_list = [saveframe for saveframe in entry.frame_list if saveframe.category in categories]
+    return entry
+
+
+def _process_file(task: Tuple[str, Callable, Optional[List[str]], bool]) -> Tuple[str, bool, Any]:
+    """ Loads one file and calls the function on it. Returns the file name,
+    whether it succeeded, and either the result of the function or a
+    description of the error. Runs in the worker processes. """
+
+    file_name, function, categories, convert_data_types = task
+    try:
+        return file_name, True, function(_load_file(file_name, categories, convert_data_types))
+    except Exception as err:
+        return file_name, False, "".join(traceback.format_exception_only(type(err), err)).strip()
+
+
+class Corpus(object):
+    """ A collection of NMR-STAR files to run an analysis over. Create it
+    from a directory (every file ending in .str or .str.gz in it or its
+    subdirectories is used), a glob pattern (** matches subdirectories),
+    or a list of file names.
+
+    Optionally specify:
+    categories=[...] to only give the function the saveframes of the listed
+      categories, e.g. ['assigned_chemical_shifts'].
+    convert_data_types=True to convert the values to python types when the
+      files are loaded. See Entry.from_file() for details.
+
+    Files that can't be loaded, and files for which the function raises an
+    exception, do not stop the run. Instead they are recorded in the errors
+    attribute as (file name, error) pairs."""
+
+    def __init__(self, path_glob: Union[str, Iterable[str]], categories: Optional[Iterable[str]] = None,
+                 convert_data_types: bool = False) -> None:
+
+        if isinstance(path_glob, str):
+            if os.path.isdir(path_glob):
+                self.files: List[str] = _find_entry_files(path_glob)
+            else:
+                self.files = sorted(glob.glob(path_glob, recursive=True))
+        else:
+            self.files = list(path_glob)
+
+        self.categories: Optional[List[str]] = list(categories) if categories is not None else None
+        self.convert_data_types: bool = convert_data_types
+        self.errors: List[Tuple[str, str]] = []
+
+    def __iter__(self) -> Iterator['entry_mod.Entry']:
+        """ Yields each of the entries in the corpus, loaded in this
+        process. Unlike map(), errors are raised. """
+
+        for file_name in self.files:
+            yield _load_file(file_name, self.categories, self.convert_data_types)
+
+    def __len__(self) -> int:
+        """ Returns the number of files in the corpus. """
+
+        return len(self.files)
+
+    def __repr__(self) -> str:
+        return "<pynmrstar.Corpus of %d files>" % len(self.files)
+
+    def map(self, function: Callable[['entry_mod.Entry'], Any], workers: int = 1, chunksize: int = 1,
+            ordered: bool = True, max_tasks_per_worker: Optional[int] = None) -> Iterator[Tuple[str, Any]]:
+        """ Calls function on the entry of each file, and yields the
+        (file name, result) pairs. Files that fail are skipped, and are
+        recorded in the errors attribute instead.
+
+        workers is the number of worker processes to use. With one worker
+          the files are processed in this process, which is useful when
+          debugging.
+        chunksize is the number of files sent to a worker at once. Larger
+          values reduce the overhead for collections of many small files.
+        ordered=False yields the results as they complete, rather than in
+          the order of the files.
+        max_tasks_per_worker replaces each worker process after it has
+          processed that many chunks, which releases any memory that the
+          function (or the parser) holds on to."""
+
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+        if chunksize < 1:
+            raise ValueError("chunksize must be at least 1.")
+
+        self.errors = []
+        tasks = ((file_name, function, self.categories, self.convert_data_types) for file_name in self.files)
+
+        if workers == 1:
+            results = map(_process_file, tasks)
+            pool = None
+        else:
+            import multiprocessing
+
+            pool = multiprocessing.Pool(processes=workers, maxtasksperchild=max_tasks_per_worker)
+            if ordered:
+                results = pool.imap(_process_file, tasks, chunksize)
+            else:
+                results = pool.imap_unordered(_process_file, tasks, chunksize)
+
+        try:
+            for file_name, success, result in results:
+                if success:
+                    yield file_name, result
+                else:
+                    self.errors.append((file_name, result))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def reduce(self, function: Callable[['entry_mod.Entry'], Any], reducer: Callable[[Any, Any], Any],
+               initial: Any = _NO_INITIAL, workers: int = 1, chunksize: int = 1,
+               max_tasks_per_worker: Optional[int] = None) -> Any:
+        """ Calls function on the entry of each file, and combines the
+        results using reducer(combined, result), starting from initial.
+        If initial isn't provided the first result is used instead.
+
+        The results are combined in this process, in the order they
+        complete, so reducer should not depend on the order of the files.
+        See map() for the other arguments. Raises a ValueError if there
+        are no results to combine and no initial value."""
+
+        combined = initial
+        for _, result in self.map(function, workers=workers, chunksize=chunksize, ordered=False,
+                                  max_tasks_per_worker=max_tasks_per_worker):
+            if combined is _NO_INITIAL:
+                combined = result
+            else:
+                combined = reducer(combined, result)
+
+        if combined is _NO_INITIAL:
+            raise ValueError("There were no results to reduce, and no initial value was provided.")
+        return combined
+
+
+def _validate_entry(entry: 'entry_mod.Entry', max_errors: Optional[int]) -> List[str]:
+    """ Validates one entry. Runs in the worker processes. """
+
+    return entry.validate(max_errors=max_errors)
+
+
+def validate_many(path_glob: Union[str, Iterable[str]], workers: int = 1, max_errors: Optional[int] = None,
+                  convert_data_types: bool = False, chunksize: int = 1) -> Dict[str, List[str]]:
+    """ Validates the entry of each file against the default schema, and
+    returns a dictionary from each file name to the list of errors found
+    in it, in the order of the files. The files can be given as for
+    Corpus. A file that can't be loaded gets a single error describing
+    why.
+
+    workers is the number of worker processes the files are validated in.
+    max_errors stops validating each entry once that many errors have
+      been found in it. See Entry.validate().
+    convert_data_types and chunksize are as for Corpus and Corpus.map()."""
+
+    if max_errors is not None and max_errors < 1:
+        raise ValueError("max_errors must be at least 1.")
+
+    corpus = Corpus(path_glob, convert_data_types=convert_data_types)
+    results = dict(corpus.map(functools.partial(_validate_entry, max_errors=max_errors), workers=workers,
+                              chunksize=chunksize))
+    results.update((file_name, [error]) for file_name, error in corpus.errors)
+    return {file_name: results[file_name] for file_name in corpus.files}
+
+
+def _index_entry(entry: 'entry_mod.Entry') -> Tuple[str, str, List[Tuple[str, str, str, str, Optional[str]]]]:
+    """ Returns the ID, the digest, and the distinct (tag, value, category,
+    saveframe, loop) locations of the non-null values of an entry. Runs in
+    the worker processes when building a TagIndex. """
+
+    postings = set()
+    for saveframe in entry.frame_list:
+        category = (saveframe.tag_prefix or '').lstrip('_').lower()
+        for tag in saveframe.tags:
+            if tag[1] not in definitions.NULL_VALUES:
+                postings.add((tag[0].lower(), str(tag[1]), category, saveframe.name, None))
+        for loop in saveframe.loops:
+            loop_category = loop.category.lstrip('_')
+            for pos, tag in enumerate(loop.tags):
+                tag = tag.lower()
+                for value in set([row[pos] for row in loop.data]):
+                    if value not in definitions.NULL_VALUES:
+                        postings.add((tag, str(value), loop_category.lower(), saveframe.name, loop_category))
+    return str(entry.entry_id), entry.digest(), list(postings)
+
+
+class TagIndex(object):
+    """ A persistent index of where each value of each tag occurs in a
+    collection of NMR-STAR files, stored in an SQLite database file. Use it
+    to quickly find the entries that contain a value, without loading every
+    entry:
+
+        >>> index = TagIndex('archive_index.sqlite')
+        >>> index.update(Corpus('/data/bmrb'), workers=8)
+        >>> index.search('Comp_ID', 'MSE')
+        [('/data/bmrb/bmr1234_3.str', '1234', 'assigned_chem_shift_list_1', 'Atom_chem_shift'), ...]
+
+    Calling update() again only reloads the files which were modified since
+    they were last indexed."""
+
+    def __init__(self, index_file: str) -> None:
+        import sqlite3
+
+        self.index_file: str = index_file
+        self.connection: 'sqlite3.Connection' = sqlite3.connect(index_file)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE "
+                                    "NOT NULL, mtime REAL NOT NULL, size INTEGER NOT NULL, digest TEXT NOT NULL, "
+                                    "entry_id TEXT NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS postings (tag TEXT NOT NULL, value TEXT NOT NULL, "
+                                    "category TEXT NOT NULL, file_id INTEGER NOT NULL, saveframe TEXT NOT NULL, "
+                                    "loop TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS postings_tag_value ON postings (tag, value)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS postings_file ON postings (file_id)")
+
+    def __len__(self) -> int:
+        """ Returns the number of files in the index. """
+
+        return self.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def __repr__(self) -> str:
+        return "<pynmrstar.TagIndex '%s' of %d files>" % (self.index_file, len(self))
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def update(self, corpus: Corpus, workers: int = 1, chunksize: int = 1) -> int:
+        """ Brings the index up to date with the files of the corpus, and
+        returns the number of files which were (re)indexed.
+
+        Files that are new, or whose modification time or size changed,
+        are loaded (in worker processes if workers > 1). A file that was
+        touched but whose contents are the same, according to
+        Entry.digest(), is not reindexed. Files which are no longer part
+        of the corpus, or which were deleted since the corpus was created,
+        are removed from the index. Files that can't be found or loaded
+        are recorded in corpus.errors, and are left out of the index."""
+
+        known = {}
+        for file_id, path, mtime, size, digest in self.connection.execute(
+                "SELECT id, path, mtime, size, digest FROM files"):
+            known[path] = (file_id, mtime, size, digest)
+
+        changed, stats, missing = [], {}, []
+        for path in corpus.files:
+            # Files deleted since the corpus was created are removed from the index below, like any other file
+            #  which is no longer part of the corpus
+            try:
+                stat_result = os.stat(path)
+            except OSError as err:
+                missing.append((path, "".join(traceback.format_exception_only(type(err), err)).strip()))
+                continue
+            stats[path] = (stat_result.st_mtime, stat_result.st_size)
+            if path not in known or known[path][1:3] != stats[path]:
+                changed.append(path)
+
+        to_load = Corpus(changed, categories=corpus.categories, convert_data_types=corpus.convert_data_types)
+        indexed = 0
+        with self.connection:
+            for path in set(known).difference(stats):
+                self._remove(known[path][0])
+
+            for path, (entry_id, digest, postings) in to_load.map(_index_entry, workers=workers,
+                                                                  chunksize=chunksize, ordered=False):
+                mtime, size = stats[path]
+                if path in known:
+                    if known[path][3] == digest:
+                        self.connection.execute("UPDATE files SET mtime = ?, size = ? WHERE id = ?",
+                                                (mtime, size, known[path][0]))
+                        continue
+                    self._remove(known[path][0])
+
+                file_id = self.connection.execute("INSERT INTO files (path, mtime, size, digest, entry_id) "
+                                                  "VALUES (?, ?, ?, ?, ?)",
+                                                  (path, mtime, size, digest, entry_id)).lastrowid
+                self.connection.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?, ?)",
+                                            [(tag, value, category, file_id, saveframe, loop)
+                                             for tag, value, category, saveframe, loop in postings])
+                indexed += 1
+
+            # Files that can no longer be loaded shouldn't be found by searches
+            for path, _ in to_load.errors:
+                if path in known:
+                    self._remove(known[path][0])
+
+        corpus.errors = missing + to_load.errors
+        return indexed
+
+    def _remove(self, file_id: int) -> None:
+        self.connection.execute("DELETE FROM postings WHERE file_id = ?", (file_id,))
+        self.connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _search(self, tag: str, condition: str, arguments: tuple) -> List[Tuple[str, str, str, Optional[str]]]:
+        query = "SELECT DISTINCT files.path, files.entry_id, postings.saveframe, postings.loop FROM postings JOIN " \
+                "files ON files.id = postings.file_id WHERE postings.tag = ? AND " + condition
+        arguments = (utils.format_tag(tag).lower(),) + arguments
+        if "." in tag:
+            query += " AND postings.category = ?"
+            arguments += (utils.format_category(tag).lstrip('_').lower(),)
+        return sorted(self.connection.execute(query, arguments).fetchall(), key=lambda x: (x[0], x[2], x[3] or ''))
+
+    def search(self, tag: str, value: Any) -> List[Tuple[str, str, str, Optional[str]]]:
+        """ Returns the locations where the tag has the value, as a sorted
+        list of (file name, entry ID, saveframe name, loop category)
+        tuples. The loop category is None if the value is a saveframe tag
+        value. The tag can be given either with its category (e.g.
+        '_Atom_chem_shift.Comp_ID') or without, in which case it is
+        searched for in every category. Tags are case-insensitive, values
+        are not."""
+
+        return self._search(tag, "postings.value = ?", (str(value),))
+
+    def search_prefix(self, tag: str, prefix: str) -> List[Tuple[str, str, str, Optional[str]]]:
+        """ The same as search(), but returns the locations where the value
+        of the tag starts with the prefix. """
+
+        # A range rather than LIKE, so that the index can be used (and the comparison is case-sensitive)
+        return self._search(tag, "postings.value >= ? AND postings.value < ?", (prefix, prefix + '\U0010ffff'))
@@ -10,13 +10,22 @@ to set the default conversion value for Booleans or other objects.
 WARNING: STR_CONVERSION_DICT cannot contain both booleans and arithmetic types.
 Attempting to use both will cause an issue since boolean True == 1 in python
 and False == 0.
+
+Setting CACHE_FORMATTED_OUTPUT to True makes loops and saveframes remember
+their NMR-STAR text, so that printing an entry again only formats the loops
+and saveframes that were modified in the meantime. Modifications made using
+the Entry, Saveframe, and Loop methods are tracked automatically, but if you
+modify the .tags or .data lists directly you must call mark_dirty() on the
+modified object (or the entry) afterwards, or stale text will be printed.
 """
 
 NULL_VALUES = ['', ".", "?", None]
 WHITESPACE: str = " \t\n\v"
 RESERVED_KEYWORDS = ["data_", "save_", "loop_", "stop_", "global_"]
 STR_CONVERSION_DICT: dict = {None: "."}
+CACHE_FORMATTED_OUTPUT: bool = False
 
 API_URL: str = "http://api.bmrb.io/v2"
+FTP_URL: str = "https://bmrb.io/ftp/pub/bmrb/entry_directories"
 SCHEMA_URL: str = 'https://raw.githubusercontent.com/uwbmrb/nmr-star-dictionary/master/xlschem_ann.csv'
 COMMENT_URL: str = "https://raw.githubusercontent.com/uwbmrb/PyNMRSTAR/v3/reference_files/comments.str"
@@ -1,16 +1,17 @@
-import hashlib
+import functools
 import json
 import logging
 import zlib
 from io import StringIO
-from typing import TextIO, BinaryIO, Union, List, Optional, Dict, Any
-from urllib.error import HTTPError, URLError
-from urllib.request import urlopen, Request
+from time import perf_counter
+from typing import TextIO, BinaryIO, IO, Union, List, Optional, Dict, Any, Iterable, Iterator
 
-from pynmrstar import definitions, utils, loop as loop_mod, parser as parser_mod, saveframe as saveframe_mod
-from pynmrstar._internal import __version__, _json_serialize, _interpret_file
+from pynmrstar import definitions, hooks, utils, loop as loop_mod, parser as parser_mod, saveframe as saveframe_mod
+from pynmrstar._internal import __version__, _json_serialize, _interpret_file, _write_file
 from pynmrstar.schema import Schema
 
+logger = logging.getLogger(__name__)
+
 
 class Entry(object):
     """An OO representation of a BMRB entry. You can initialize this
@@ -76,7 +77,10 @@ class Entry(object):
 
             # The location to fetch entries from
             entry_number = kwargs['entry_num']
-            url = f'https://bmrb.io/ftp/pub/bmrb/entry_directories/bmr{entry_number}/bmr{entry_number}_3.str'
+            url = f'{definitions.FTP_URL}/bmr{entry_number}/bmr{entry_number}_3.str'
+
+            from urllib.error import HTTPError, URLError
+            from urllib.request import urlopen
 
             # Parse from the official BMRB library
             try:
@@ -152,21 +156,52 @@ class Entry(object):
         else:
             raise ValueError("You can only assign a saveframe to an entry splice.")
 
-    def __str__(self, skip_empty_loops: bool = False, skip_empty_tags: bool = False, show_comments: bool = True) -> str:
+    def __str__(self, skip_empty_loops: bool = False, skip_empty_tags: bool = False, show_comments: bool = True,
+                compact: bool = False) -> str:
         """Returns the entire entry in STAR format as a string."""
 
-        sf_strings = []
+        return "".join(self._format_chunks(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags,
+                                           show_comments=show_comments, compact=compact))
+
+    def _format_chunks(self, skip_empty_loops: bool = False, skip_empty_tags: bool = False,
+                       show_comments: bool = True, stream: bool = False, workers: int = 1,
+                       compact: bool = False) -> Iterator[str]:
+        """Yields the entire entry in STAR format as a series of strings.
+        If stream is True, the loops are streamed as well, rather than
+        each being formatted as one string. If workers is greater than one,
+        the saveframes are formatted in that many worker processes. If
+        compact is True, the values are not aligned and no blank lines
+        are printed."""
+
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+
+        yield "data_%s\n" % self.entry_id if compact else "data_%s\n\n" % self.entry_id
+        separator = "" if compact else "\n"
+
+        # Only the first saveframe of each category gets the comment
         seen_saveframes = {}
+        saveframes = []
         for saveframe_obj in self:
-            if saveframe_obj.category in seen_saveframes:
-                sf_strings.append(saveframe_obj.format(skip_empty_loops=skip_empty_loops,
-                                                       skip_empty_tags=skip_empty_tags, show_comments=False))
-            else:
-                sf_strings.append(saveframe_obj.format(skip_empty_loops=skip_empty_loops,
-                                                       skip_empty_tags=skip_empty_tags, show_comments=show_comments))
-                seen_saveframes[saveframe_obj.category] = True
+            saveframes.append((saveframe_obj, show_comments and saveframe_obj.category not in seen_saveframes))
+            seen_saveframes[saveframe_obj.category] = True
+
+        if workers > 1 and len(saveframes) > 1:
+            from pynmrstar._parallel import _format_saveframes
 
-        return "data_%s\n\n%s" % (self.entry_id, "\n".join(sf_strings))
+            formatted = _format_saveframes(saveframes, workers, skip_empty_loops, skip_empty_tags, compact)
+            for pos, saveframe_text in enumerate(formatted):
+                if pos > 0:
+                    yield separator
+                yield saveframe_text
+            return
+
+        for pos, (saveframe_obj, show_comment) in enumerate(saveframes):
+            if pos > 0:
+                yield separator
+            yield from saveframe_obj._format_chunks(first_in_category=True, skip_empty_loops=skip_empty_loops,
+                                                    skip_empty_tags=skip_empty_tags, show_comments=show_comment,
+                                                    stream=stream, compact=compact)
 
     @property
     def category_list(self) -> List[str]:
@@ -205,6 +240,7 @@ class Entry(object):
                 try:
                     if schema.schema[fqtn]['entryIdFlg'] == 'Y':
                         tag[1] = self._entry_id
+                        saveframe._clear_cache()
                 except KeyError:
                     pass
 
@@ -238,6 +274,17 @@ class Entry(object):
 
         return frame_dict
 
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """Create an entry from the binary representation generated by
+        Entry.to_bytes(). This is many times faster than parsing the
+        entry from NMR-STAR or JSON, as no tokenizing or validation of the
+        tags and values is performed."""
+
+        from pynmrstar._binary import _entry_from_bytes
+
+        return _entry_from_bytes(data)
+
     @classmethod
     def from_database(cls, entry_num: Union[str, int], convert_data_types: bool = False):
         """Create an entry corresponding to the most up to date entry on
@@ -254,6 +301,9 @@ class Entry(object):
         notation floats to lowercase "e"s this should not cause any change in
         the way re-printed NMR-STAR objects are displayed."""
 
+        from urllib.error import HTTPError, URLError
+        from urllib.request import urlopen, Request
+
         # Try to load the entry using JSON
         try:
             entry_url: str = (definitions.API_URL + "/entry/%s?format=zlib") % entry_num
@@ -277,46 +327,75 @@ class Entry(object):
                 else:
                     raise err
 
-            # Decompress and convert bytes to string
-            serialized_ent = zlib.decompress(serialized_ent).decode()
+            return cls._from_database_response(entry_num, serialized_ent, convert_data_types)
+        except URLError:
+            logger.warning("BMRB API server appears to be down. Attempting to load from FTP site.")
+            return cls(entry_num=entry_num)
+
+    @classmethod
+    async def from_database_async(cls, entry_num: Union[str, int], convert_data_types: bool = False):
+        """The asyncio version of from_database(). from_database() is run
+        in the default executor of the event loop, so that the event loop
+        isn't blocked, and proxies, redirects and the fallback to the FTP
+        site work the same way."""
 
-            # Parse JSON string to dictionary
-            json_data = json.loads(serialized_ent)
-            if "error" in json_data:
-                # Something up with the API server, try the FTP site
-                return cls(entry_num=entry_num)
+        import asyncio
 
-            # Load the entry from the JSON
-            ent = Entry.from_json(json_data)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(cls.from_database, entry_num, convert_data_types=convert_data_types))
 
-            # Update the entry source
-            ent_source = "from_database(%s)" % entry_num
-            ent.source = ent_source
-            for each_saveframe in ent:
-                each_saveframe.source = ent_source
-                for each_loop in each_saveframe:
-                    each_loop.source = ent_source
-
-            if convert_data_types:
-                schema = utils.get_schema()
-                for each_saveframe in ent:
-                    for tag in each_saveframe.tags:
-                        cur_tag = each_saveframe.tag_prefix + "." + tag[0]
-                        tag[1] = schema.convert_tag(cur_tag, tag[1], line_num="SF %s" % each_saveframe.name)
-                    for loop in each_saveframe:
-                        for row in loop.data:
-                            for pos in range(0, len(row)):
-                                category = loop.category + "." + loop.tags[pos]
-                                line_num = "Loop %s" % loop.category
-                                row[pos] = schema.convert_tag(category, row[pos], line_num=line_num)
+    @classmethod
+    def _from_database_response(cls, entry_num: Union[str, int], serialized_ent: bytes,
+                                convert_data_types: bool) -> 'Entry':
+        """ Loads an entry from the compressed JSON returned by the API. """
+
+        # Decompress and convert bytes to string
+        serialized_ent = zlib.decompress(serialized_ent).decode()
+
+        # Parse JSON string to dictionary
+        json_data = json.loads(serialized_ent)
+        if "error" in json_data:
+            # Something up with the API server, try the FTP site
+            return cls(entry_num=entry_num)
 
-            return ent
+        # Load the entry from the JSON
+        try:
+            ent = Entry.from_json(json_data)
         # The entry doesn't exist
         except KeyError:
             raise IOError("Entry '%s' does not exist in the public database." % entry_num)
-        except URLError:
-            logging.warning("BMRB API server appears to be down. Attempting to load from FTP site.")
-            return cls(entry_num=entry_num)
+        ent._finish_database_load(entry_num, convert_data_types)
+
+        return ent
+
+    @classmethod
+    def from_database_many(cls, entry_nums: Iterable[Union[str, int]], convert_data_types: bool = False,
+                           max_workers: int = 8, retries: int = 3, api_url: str = None,
+                           timeout: float = 60) -> Iterator['Entry']:
+        """Returns a generator that fetches the provided entries from the
+        public BMRB server concurrently and yields them in the order they
+        finish downloading (which is not necessarily the order of
+        entry_nums). (Requires ability to initiate outbound HTTP
+        connections.)
+
+        The entries are requested by max_workers threads, the same way
+        from_database() requests them (so proxies and redirects are
+        followed), and requests which fail due to connection problems or
+        server (5xx) errors are retried up to retries times. If they still
+        fail, or the API server returns another error, the entry is loaded
+        from the FTP site instead, as from_database() does. An IOError is
+        raised for an entry which does not exist. Only a few
+        requests are made ahead of the entries that have been consumed, so
+        entry_nums can be a long or lazy iterable.
+
+        By default, the entries are fetched from definitions.API_URL. Set
+        api_url to fetch them from a different (mirror) API server instead.
+
+        See from_database() for the meaning of convert_data_types."""
+
+        from pynmrstar._fetch import _fetch_entries
+
+        return _fetch_entries(entry_nums, convert_data_types, max_workers, retries, api_url, timeout)
 
     @classmethod
     def from_file(cls, the_file: Union[str, TextIO, BinaryIO], convert_data_types: bool = False):
@@ -332,9 +411,29 @@ class Entry(object):
         dates will become datetime.date objects. When printing str() is called
         on all objects. Other that converting uppercase "E"s in scientific
         notation floats to lowercase "e"s this should not cause any change in
-        the way re-printed NMR-STAR objects are displayed."""
+        the way re-printed NMR-STAR objects are displayed.
+
+        If the parse cache was enabled using pynmrstar.enable_cache() and
+        this file was parsed before, the cached entry is returned instead
+        of parsing the file again."""
+
+        from pynmrstar._cache import _load_entry, _store_entry
+
+        entry = _load_entry(the_file, convert_data_types)
+        if entry is None:
+            entry = cls(file_name=the_file, convert_data_types=convert_data_types)
+            _store_entry(the_file, convert_data_types, entry)
+        return entry
 
-        return cls(file_name=the_file, convert_data_types=convert_data_types)
+    @classmethod
+    async def from_file_async(cls, the_file: Union[str, TextIO, BinaryIO], convert_data_types: bool = False):
+        """The asyncio version of from_file(). from_file() is run in the
+        default executor of the event loop, so that downloading or reading
+        and parsing the file don't block the event loop."""
+
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(None, cls.from_file, the_file, convert_data_types)
 
     @classmethod
     def from_json(cls, json_dict: Union[dict, str]):
@@ -392,6 +491,22 @@ class Entry(object):
 
         return cls(entry_id=entry_id)
 
+    @classmethod
+    def from_sqlite(cls, connection: 'sqlite3.Connection', entry_id: Union[str, int], schema: Schema = None):
+        """Create an entry from an SQLite database that it was stored in
+        using Entry.to_sqlite(). Provide an open sqlite3 connection and
+        the ID of the entry.
+
+        The values are returned as the python types the schema specifies,
+        the same as when loading a file with convert_data_types=True.
+        Because numbers are stored as SQLite numbers, insignificant
+        trailing zeros of floats (e.g. "7.7420") are not preserved.
+        Raises a ValueError if the entry is not in the database."""
+
+        from pynmrstar._sqlite import _entry_from_sqlite
+
+        return _entry_from_sqlite(connection, str(entry_id), schema if schema is not None else utils.get_schema())
+
     @classmethod
     def from_template(cls, entry_id, all_tags=False, default_values=False, schema=None) -> 'Entry':
         """ Create an entry that has all of the saveframes and loops from the
@@ -411,6 +526,31 @@ class Entry(object):
         entry.source = "from_template(%s)" % schema.version
         return entry
 
+    def _finish_database_load(self, entry_num: Union[str, int], convert_data_types: bool) -> None:
+        """ Sets the source of an entry loaded from the API and converts
+        the data types if requested. """
+
+        # Update the entry source
+        ent_source = "from_database(%s)" % entry_num
+        self.source = ent_source
+        for each_saveframe in self:
+            each_saveframe.source = ent_source
+            for each_loop in each_saveframe:
+                each_loop.source = ent_source
+
+        if convert_data_types:
+            schema = utils.get_schema()
+            for each_saveframe in self:
+                for tag in each_saveframe.tags:
+                    cur_tag = each_saveframe.tag_prefix + "." + tag[0]
+                    tag[1] = schema.convert_tag(cur_tag, tag[1], line_num="SF %s" % each_saveframe.name)
+                for loop in each_saveframe:
+                    for row in loop.data:
+                        for pos in range(0, len(row)):
+                            category = loop.category + "." + loop.tags[pos]
+                            line_num = "Loop %s" % loop.category
+                            row[pos] = schema.convert_tag(category, row[pos], line_num=line_num)
+
     def add_saveframe(self, frame) -> None:
         """Add a saveframe to the entry."""
 
@@ -440,6 +580,7 @@ class Entry(object):
                 return ['String was not exactly equal to entry.']
         elif not isinstance(other, Entry):
             return ['Other object is not of class Entry.']
+
         try:
             if str(self.entry_id) != str(other.entry_id):
                 diffs.append("Entry ID does not match between entries: '%s' vs '%s'." % (self.entry_id, other.entry_id))
@@ -477,16 +618,38 @@ class Entry(object):
             if entry.empty:
                 del self.frame_list[pos]
 
-    def format(self, skip_empty_loops: bool = True, skip_empty_tags: bool = False, show_comments: bool = True) -> str:
+    def digest(self, refresh: bool = False) -> str:
+        """ Returns a stable hash (as a hex string) of the contents of the
+        entry. Two entries with the same digest print identically. This is
+        much cheaper than hashing str(entry), and makes for a good cache key
+        or a quick way to check if an entry has changed.
+
+        The hash is built from the digest() of each saveframe, which cache
+        their hashes and only recompute the parts that were modified. If
+        you modify the .tags or .data lists of a saveframe or loop
+        directly, call mark_dirty() afterwards, or specify refresh=True to
+        ignore the cached hashes."""
+
+        import hashlib
+
+        return hashlib.sha256(json.dumps([str(self.entry_id)] +
+                                         [x.digest(refresh=refresh) for x in self.frame_list]).encode()).hexdigest()
+
+    def format(self, skip_empty_loops: bool = True, skip_empty_tags: bool = False, show_comments: bool = True,
+               workers: int = 1, compact: bool = False) -> str:
         """ The same as calling str(Entry), except that you can pass options
         to customize how the entry is printed.
 
         skip_empty_loops will omit printing loops with no tags at all. (A loop with null tags is not "empty".)
         skip_empty_tags will omit tags in the saveframes and loops which have no non-null values.
-        show_comments will show the standard comments before a saveframe."""
+        show_comments will show the standard comments before a saveframe.
+        workers=N will format the saveframes in N worker processes. This only pays off for large entries, as
+          each saveframe has to be sent to a worker process. The output is identical to the serial output.
+        compact will separate the values with single spaces rather than aligning them in columns. This is faster,
+          and intended for output that will be read by programs rather than people."""
 
-        return self.__str__(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags,
-                            show_comments=show_comments)
+        return "".join(self._format_chunks(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags,
+                                           show_comments=show_comments, workers=workers, compact=compact))
 
     def get_json(self, serialize: bool = True) -> Union[dict, str]:
         """ Returns the entry in JSON format. If serialize is set to
@@ -572,26 +735,63 @@ class Entry(object):
 
         return results
 
+    def mark_dirty(self) -> None:
+        """ Notifies the entry that the tags or data of its saveframes or
+        loops were modified directly rather than through the Saveframe
+        and Loop methods, so that any cached values (such as the digest()
+        and the formatted text) are recomputed the next time they are
+        needed."""
+
+        for saveframe in self.frame_list:
+            saveframe.mark_dirty()
+
+    def memory_report(self) -> Dict[str, Any]:
+        """ Returns an estimate of the memory used by the entry, in bytes.
+        Each count is split into 'row_overhead' (the lists holding the
+        rows and tags), 'strings' (the str values), 'converted' (values of
+        other types, such as Decimal and date, as created by
+        convert_data_types=True) and their 'total'. 'interning_savings' is
+        how much of the string memory could be saved by sharing one object
+        between equal strings (e.g. using sys.intern()).
+
+        The returned dictionary has these keys:
+
+        total       the counts for the whole entry
+        saveframes  a list of the counts for the tags of each saveframe
+        loops       a list of the counts for each loop, with the number
+                    of rows and columns
+        categories  the counts summed up per tag prefix and loop
+                    category, starting with the largest
+
+        Objects which are shared are only counted once. All of the values
+        are visited, so this takes about as long as formatting the entry."""
+
+        from pynmrstar._memory import _memory_report
+
+        return _memory_report(self)
+
     def normalize(self, schema: Optional['Schema'] = None) -> None:
         """ Sorts saveframes, loops, and tags according to the schema
         provided (or BMRB default if none provided).
 
         Also re-assigns ID tag values and updates tag links to ID values."""
 
+        import hashlib
+
         # Assign all the ID tags, and update all links to ID tags
         my_schema = utils.get_schema(schema)
 
         # Sort the saveframes according to ID, if an ID exists. Otherwise, still sort by category
         ordering = my_schema.category_order
+        category_positions = my_schema._category_positions
 
         def sf_key(_: saveframe_mod.Saveframe) -> [int, Union[int, float]]:
             """ Helper function to sort the saveframes.
             Returns (category order, saveframe order) """
 
             # If not a real category, generate an artificial but stable order > the real saveframes
-            try:
-                category_order = ordering.index(_.tag_prefix)
-            except (ValueError, KeyError):
+            category_order = category_positions.get(_.tag_prefix)
+            if category_order is None:
                 if _.category is None:
                     category_order = float('infinity')
                 else:
@@ -612,12 +812,12 @@ class Entry(object):
         def loop_key(_) -> Union[int, float]:
             """ Helper function to sort the loops."""
 
-            try:
-                return ordering.index(_.category)
-            except ValueError:
+            category_order = category_positions.get(_.category)
+            if category_order is None:
                 # Generate an arbitrary sort order for loops that aren't in the schema but make sure that they
                 #  always come after loops in the schema
                 return len(ordering) + abs(int(hashlib.sha1(str(_.category).encode()).hexdigest(), 16))
+            return category_order
 
         # Go through all the saveframes
         for each_frame in self.frame_list:
@@ -641,6 +841,8 @@ class Entry(object):
 
         # tag_prefix -> tag -> original value -> mapped value
         mapping: dict = {}
+        # saveframe name -> saveframe, for resolving the framecode references
+        frames_by_name: Optional[Dict[str, 'saveframe_mod.Saveframe']] = None
 
         # Reassign the ID tags first
         for each_category in categories:
@@ -712,16 +914,16 @@ class Entry(object):
                         if tag_schema['Nullable']:
                             continue
                         else:
-                            logging.warning("A foreign key tag that is not nullable was set to "
-                                            f"a null value. Tag: {saveframe.tag_prefix}.{tag[1]} Primary key: "
-                                            f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']} "
-                                            f"Value: {tag[1]}")
+                            logger.warning("A foreign key tag that is not nullable was set to "
+                                           f"a null value. Tag: {saveframe.tag_prefix}.{tag[1]} Primary key: "
+                                           f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']} "
+                                           f"Value: {tag[1]}")
 
                     try:
                         tag[1] = mapping[f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']}.{tag[1]}"]
                     except KeyError:
-                        logging.warning(f'The tag {saveframe.tag_prefix}.{tag[0]} has value {tag[1]} '
-                                        f'but there is no valid primary key.')
+                        logger.warning(f'The tag {saveframe.tag_prefix}.{tag[0]} has value {tag[1]} '
+                                       f'but there is no valid primary key.')
 
             # Now apply the remapping to loops...
             for loop in saveframe:
@@ -735,10 +937,10 @@ class Entry(object):
                                 if tag_schema['Nullable']:
                                     continue
                                 else:
-                                    logging.warning("A foreign key reference tag that is not nullable was set to "
-                                                    f"a null value. Tag: {loop.category}.{tag} Foreign key: "
-                                                    f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']} "
-                                                    f"Value: {row[x]}")
+                                    logger.warning("A foreign key reference tag that is not nullable was set to "
+                                                   f"a null value. Tag: {loop.category}.{tag} Foreign key: "
+                                                   f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']} "
+                                                   f"Value: {row[x]}")
                             try:
                                 row[x] = mapping[
                                     f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']}.{row[x]}"]
@@ -746,10 +948,10 @@ class Entry(object):
                                 if (loop.category == '_Atom_chem_shift' or loop.category == '_Entity_comp_index') and \
                                         (tag == 'Atom_ID' or tag == 'Comp_ID'):
                                     continue
-                                logging.warning(f'The tag {loop.category}.{tag} has value {row[x]} '
-                                                f'but there is no valid primary key '
-                                                f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']} "
-                                                f"with the tag value.")
+                                logger.warning(f'The tag {loop.category}.{tag} has value {row[x]} '
+                                               f'but there is no valid primary key '
+                                               f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']} "
+                                               f"with the tag value.")
 
                     # If there is both a label tag and an ID tag, do the reassignment
 
@@ -773,18 +975,21 @@ class Entry(object):
                                         if tag_schema['Nullable']:
                                             continue
                                         else:
-                                            logging.info(f"A foreign saveframe reference tag that is not nullable was "
-                                                         f"set to a null value. Tag: {loop.category}.{tag} "
-                                                         "Foreign saveframe: "
-                                                         f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']}"
-                                                         )
+                                            logger.info(f"A foreign saveframe reference tag that is not nullable was "
+                                                        f"set to a null value. Tag: {loop.category}.{tag} "
+                                                        "Foreign saveframe: "
+                                                        f"{tag_schema['Foreign Table']}.{tag_schema['Foreign Column']}"
+                                                        )
                                             continue
+                                    # The saveframe names don't change here, so only look them up once
+                                    if frames_by_name is None:
+                                        frames_by_name = self.frame_dict
                                     try:
-                                        row[tag_pos] = self.get_saveframe_by_name(row[x][1:])['ID'][0]
+                                        row[tag_pos] = frames_by_name[row[x][1:]]['ID'][0]
                                     except IndexError:
-                                        logging.info(f"Getting {self.get_saveframe_by_name(row[x][1:])['ID']}")
+                                        logger.info(f"Getting {frames_by_name[row[x][1:]]['ID']}")
                                     except KeyError:
-                                        logging.warning(f"Missing frame of type {tag} pointed to by {conditional_tag}")
+                                        logger.warning(f"Missing frame of type {tag} pointed to by {conditional_tag}")
 
         # Renumber the 'ID' column in a loop
         for each_frame in self.frame_list:
@@ -792,6 +997,9 @@ class Entry(object):
                 if loop.tag_index('ID') is not None and loop.category != '_Experiment':
                     loop.renumber_rows('ID')
 
+        # The tags and data were modified in place above
+        self.mark_dirty()
+
     def print_tree(self) -> None:
         """Prints a summary, tree style, of the frames and loops in
         the entry."""
@@ -835,15 +1043,53 @@ class Entry(object):
             for each_tag in each_frame.tags:
                 if each_tag[1] == old_reference:
                     each_tag[1] = new_reference
+                    each_frame._clear_cache()
             # Iterate through the loops
             for each_loop in each_frame:
                 for each_row in each_loop:
                     for pos, val in enumerate(each_row):
                         if val == old_reference:
                             each_row[pos] = new_reference
+                            each_loop._clear_cache()
+
+    def to_bytes(self) -> bytes:
+        """ Returns a compact binary representation of the entry, which can
+        be loaded much more quickly than NMR-STAR or JSON using
+        Entry.from_bytes(). Useful for caching entries or passing them
+        between processes. The binary format is specific to PyNMR-STAR,
+        so don't use it to exchange entries with other software.
+
+        Data types are preserved, so an entry loaded with
+        convert_data_types=True is restored with the same python types."""
+
+        from pynmrstar._binary import _entry_to_bytes
+
+        return _entry_to_bytes(self)
+
+    def to_sqlite(self, connection: 'sqlite3.Connection', schema: Schema = None) -> None:
+        """ Stores the entry in an SQLite database, which makes it possible
+        to query many entries at once using SQL. Provide an open sqlite3
+        connection. An entry with the same ID which was stored previously
+        is replaced.
+
+        Each saveframe and loop category is stored in a table of the same
+        name (e.g. Atom_chem_shift), with one column per tag, typed
+        according to the schema. Every table also has _entry_id,
+        _saveframe and _row columns, and the columns that refer to other
+        categories are indexed. For example:
+
+        SELECT _entry_id, Comp_ID, AVG(Val) FROM Atom_chem_shift WHERE Atom_ID = 'CA' GROUP BY 1, 2
+
+        All of the rows are inserted in one transaction, which is
+        committed when the entry has been stored (or rolled back if an
+        error occurs). Use Entry.from_sqlite() to load the entry again."""
+
+        from pynmrstar._sqlite import _entry_to_sqlite
+
+        _entry_to_sqlite(self, connection, schema if schema is not None else utils.get_schema())
 
     def validate(self, validate_schema: bool = True, schema: 'Schema' = None,
-                 validate_star: bool = True) -> List[str]:
+                 validate_star: bool = True, workers: int = 1, max_errors: Optional[int] = None) -> List[str]:
         """Validate an entry in a variety of ways. Returns a list of
         errors found. 0-length list indicates no errors found. By
         default all validation modes are enabled.
@@ -852,8 +1098,23 @@ class Entry(object):
         the NMR-STAR schema. You can pass your own custom schema if desired,
         otherwise the cached schema will be used.
 
-        validate_star - Determines if the STAR syntax checks are ran."""
+        validate_star - Determines if the STAR syntax checks are ran.
+
+        workers - Validate the saveframes in this many worker processes.
+        The errors are returned in the same order as with one worker. A
+        schema passed in is sent to each worker; otherwise each worker
+        uses its default schema.
+
+        max_errors - Stop validating once this many errors have been found,
+        and return only the first max_errors errors, e.g. to quickly reject
+        an entry without checking all of it."""
 
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+        if max_errors is not None and max_errors < 1:
+            raise ValueError("max_errors must be at least 1.")
+
+        start = perf_counter()
         errors = []
 
         # They should validate for something...
@@ -872,6 +1133,9 @@ class Entry(object):
             fdict = self.frame_dict
 
             for each_frame in self:
+                if max_errors is not None and len(errors) >= max_errors:
+                    break
+
                 # Iterate through the tags
                 for each_tag in each_frame.tags:
                     tag_copy = str(each_tag[1])
@@ -883,9 +1147,11 @@ class Entry(object):
 
                 # Iterate through the loops
                 for each_loop in each_frame:
-                    for each_row in each_loop:
+                    for each_row in each_loop.data:
                         for pos, val in enumerate(each_row):
-                            val = str(val)
+                            # Almost every value is already a string, so only convert the ones that aren't
+                            if val.__class__ is not str:
+                                val = str(val)
                             if val.startswith("$") and val[1:] not in fdict:
                                 errors.append("Dangling saveframe reference '%s' in tag '%s.%s'" %
                                               (val,
@@ -893,31 +1159,67 @@ class Entry(object):
                                                each_loop.tags[pos]))
 
         # Ask the saveframes to check themselves for errors
-        for frame in self:
-            errors.extend(frame.validate(validate_schema=validate_schema, schema=schema, validate_star=validate_star))
+        if max_errors is None or len(errors) < max_errors:
+            if workers > 1 and len(self.frame_list) > 1:
+                from pynmrstar._parallel import _validate_saveframes
 
+                saveframe_errors = _validate_saveframes(self.frame_list, workers, validate_schema, schema,
+                                                        validate_star,
+                                                        max_errors - len(errors) if max_errors is not None else None)
+            else:
+                # A generator, so that each saveframe only looks for as many errors as are still needed
+                saveframe_errors = (frame.validate(validate_schema=validate_schema, schema=schema,
+                                                   validate_star=validate_star,
+                                                   max_errors=max_errors - len(errors) if max_errors is not None
+                                                   else None)
+                                    for frame in self)
+            try:
+                for frame_errors in saveframe_errors:
+                    errors.extend(frame_errors)
+                    if max_errors is not None and len(errors) >= max_errors:
+                        break
+            finally:
+                saveframe_errors.close()
+
+        if max_errors is not None:
+            errors = errors[:max_errors]
+
+        if hooks._callbacks['validate_end']:
+            hooks._emit('validate_end', source=self.source, entry_id=self.entry_id, seconds=perf_counter() - start,
+                        errors=len(errors))
         return errors
 
-    def write_to_file(self, file_name: str, format_: str = "nmrstar", show_comments: bool = True,
-                      skip_empty_loops: bool = True, skip_empty_tags: bool = False) -> None:
+    def write_to_file(self, file_name: Union[str, IO], format_: str = "nmrstar", show_comments: bool = True,
+                      skip_empty_loops: bool = True, skip_empty_tags: bool = False, compress: bool = False,
+                      atomic: bool = False, workers: int = 1, compact: bool = False) -> None:
         """ Writes the entry to the specified file in NMR-STAR format.
 
+        The output is streamed to the file saveframe by saveframe and loop
+        by loop, so the full text of the entry is never held in memory.
+        file_name can also be a (text or binary) file object to write to.
+
         Optionally specify:
         show_comments=False to disable the comments that are by default inserted. Ignored when writing json.
         skip_empty_loops=False to force printing loops with no tags at all (loops with null tags are still printed)
         skip_empty_tags=True will omit tags in the saveframes and loops which have no non-null values.
-        format_=json to write to the file in JSON format."""
+        format_=json to write to the file in JSON format.
+        compress=True to write the file gzip compressed.
+        atomic=True to write to a temporary file which then replaces file_name, so that the file is never left
+          partially written.
+        workers=N to format the saveframes in N worker processes. Ignored when writing json. With more than one
+          worker, each saveframe (rather than each loop) is held in memory in full while it is written.
+        compact=True to separate the values with single spaces rather than aligning them in columns. Ignored when
+          writing json."""
 
         if format_ not in ["nmrstar", "json"]:
             raise ValueError("Invalid output format.")
 
-        data_to_write = ''
         if format_ == "nmrstar":
-            data_to_write = self.format(show_comments=show_comments, skip_empty_loops=skip_empty_loops,
-                                        skip_empty_tags=skip_empty_tags)
-        elif format_ == "json":
-            data_to_write = self.get_json()
-
-        out_file = open(file_name, "w")
-        out_file.write(data_to_write)
-        out_file.close()
+            chunks = self._format_chunks(show_comments=show_comments, skip_empty_loops=skip_empty_loops,
+                                         skip_empty_tags=skip_empty_tags, stream=True, workers=workers,
+                                         compact=compact)
+        else:
+            chunks = json.JSONEncoder(default=_json_serialize).iterencode(self.get_json(serialize=False))
+
+        _write_file(file_name, chunks, compress=compress, atomic=atomic,
+                    hook_info={'entry_id': self.entry_id, 'format': format_})
@@ -2,7 +2,8 @@ class ParsingError(Exception):
     """ Something went wrong when parsing. """
 
     def __init__(self, message, line_number: int = None):
-        Exception.__init__(self)
+        # Passing the arguments on allows the exception to be pickled (e.g. by a worker process)
+        Exception.__init__(self, message, line_number)
         self.message = message
         self.line_number = line_number
 
@@ -23,7 +24,7 @@ class FormattingError(Exception):
     """ Something went wrong when formatting a file. """
 
     def __init__(self, message):
-        Exception.__init__(self)
+        Exception.__init__(self, message)
         self.message = message
 
     def __repr__(self) -> str:
@@ -0,0 +1,96 @@
+""" A registry of callbacks which are called when PyNMR-STAR finishes
+parsing, validating or writing, for feeding timings into a metrics system:
+
+    >>> from pynmrstar import hooks
+    >>> def record(event, info):
+    ...     metrics.timing('pynmrstar.' + event, info['seconds'])
+    >>> hooks.on('parse_end', record)
+    >>> hooks.on('write_end', record)
+
+The callbacks are called with the name of the event and a dictionary of
+information about it. The events, and the information they provide, are:
+
+    parse_start       source, size
+    parse_end         source, size, seconds, entry_id, saveframes, error
+    saveframe_parsed  source, name, category, tags, loops, rows, seconds
+    validate_end      source, entry_id, seconds, errors
+    write_end         file_name, format, size, seconds, and entry_id or
+                      saveframe
+
+size is the number of characters parsed or written, seconds the wall time
+the operation took, and source the source of the entry (e.g. the file it
+was loaded from). In parse_end, error is the exception that stopped the
+parse, or None if it succeeded. In validate_end, errors is the number of
+validation errors found.
+
+An exception raised by a callback is logged rather than interrupting
+PyNMR-STAR. While no callbacks are registered for an event, the only cost
+is checking whether there are any. Callbacks are not called in worker
+processes, e.g. when using format(workers=N) or pynmrstar.corpus. """
+
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+EVENTS = ['parse_start', 'parse_end', 'saveframe_parsed', 'validate_end', 'write_end']
+
+logger = logging.getLogger(__name__)
+
+# The registered callbacks of each event. Tuples are replaced rather than modified, so that they can be iterated over
+#  while callbacks are registered from another thread.
+_callbacks: Dict[str, Tuple[Callable[[str, Dict[str, Any]], None], ...]] = {event: () for event in EVENTS}
+
+
+def _check_event(event: str) -> None:
+    if event not in _callbacks:
+        raise ValueError("Unknown event '%s'. Valid events are: %s" % (event, ", ".join(EVENTS)))
+
+
+def on(event: str, callback: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+    """ Registers the callback to be called when the event happens, and
+    returns it. Can also be used as a decorator:
+
+        @hooks.on('validate_end')
+        def record(event, info):
+            ... """
+
+    _check_event(event)
+    if callback is None:
+        return lambda function: on(event, function)
+    _callbacks[event] = _callbacks[event] + (callback,)
+    return callback
+
+
+def off(event: str, callback: Callable[[str, Dict[str, Any]], None]) -> None:
+    """ Unregisters a callback registered using on(). """
+
+    _check_event(event)
+    if callback not in _callbacks[event]:
+        raise ValueError("The callback is not registered for event '%s'." % event)
+    callbacks = list(_callbacks[event])
+    callbacks.remove(callback)
+    _callbacks[event] = tuple(callbacks)
+
+
+def clear(event: str = None) -> None:
+    """ Unregisters all of the callbacks of the event, or of all events if
+    no event is specified. """
+
+    if event is None:
+        for each_event in EVENTS:
+            _callbacks[each_event] = ()
+    else:
+        _check_event(event)
+        _callbacks[event] = ()
+
+
+def _emit(event: str, **info) -> None:
+    """ Calls the callbacks registered for the event. """
+
+    for callback in _callbacks[event]:
+        try:
+            callback(event, info)
+        except Exception:
+            logger.exception("Exception in callback for the '%s' event.", event)
+
+
+__all__ = ['EVENTS', 'clear', 'off', 'on']
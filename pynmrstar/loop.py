@@ -4,14 +4,19 @@ from copy import deepcopy
 from csv import reader as csv_reader, writer as csv_writer
 from io import StringIO
 from itertools import chain
-from typing import TextIO, BinaryIO, Union, List, Optional, Any, Dict, Callable, Tuple
+from typing import TextIO, BinaryIO, Union, List, Optional, Any, Dict, Callable, Tuple, Iterator
 
-from pynmrstar import definitions, utils, entry as entry_mod, exceptions
+from pynmrstar import definitions, utils, entry as entry_mod, exceptions, profiling
 from pynmrstar._internal import _json_serialize, _interpret_file
 from pynmrstar.exceptions import FormattingError
 from pynmrstar.parser import Parser
 from pynmrstar.schema import Schema
 
+# The number of rows formatted at a time when streaming a loop
+STREAM_ROWS: int = 1000
+# The number of rows validated at a time when validation stops after a number of errors
+VALIDATE_ROWS: int = 1000
+
 
 class Loop(object):
     """A BMRB loop object. Create using the class methods, see below."""
@@ -49,6 +54,8 @@ class Loop(object):
         self.data: List[List[Any]] = []
         self.category: Optional[str] = None
         self.source: str = "unknown"
+        self._digest: Optional[str] = None
+        self._formatted: Optional[Tuple[tuple, str]] = None
 
         star_buffer: StringIO = StringIO("")
 
@@ -166,19 +173,59 @@ class Loop(object):
         # Do the assignment
         for pos, row in enumerate(self.data):
             row[tag_id] = item[pos]
+        self._clear_cache()
 
-    def __str__(self, skip_empty_loops: bool = False, skip_empty_tags: bool = False) -> str:
+    def __str__(self, skip_empty_loops: bool = False, skip_empty_tags: bool = False, compact: bool = False) -> str:
         """Returns the loop in STAR format as a string."""
 
+        return "".join(self._format_chunks(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags,
+                                           compact=compact))
+
+    @profiling._timed('format')
+    def _format_chunks(self, skip_empty_loops: bool = False, skip_empty_tags: bool = False,
+                       stream: bool = False, compact: bool = False) -> Iterator[str]:
+        """Yields the loop in STAR format as a series of strings.
+
+        If definitions.CACHE_FORMATTED_OUTPUT is set, the text is cached
+        until the loop is modified (or formatted with different options).
+        If stream is True and the text is not cached, it is streamed rather
+        than cached."""
+
+        if not definitions.CACHE_FORMATTED_OUTPUT:
+            yield from self._render_chunks(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags,
+                                           stream=stream, compact=compact)
+            return
+
+        cache_key = (skip_empty_loops, skip_empty_tags, compact, self.category, dict(definitions.STR_CONVERSION_DICT))
+        if self._formatted is None or self._formatted[0] != cache_key:
+            if stream:
+                yield from self._render_chunks(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags,
+                                               stream=True, compact=compact)
+                return
+            self._formatted = (cache_key, "".join(self._render_chunks(skip_empty_loops=skip_empty_loops,
+                                                                      skip_empty_tags=skip_empty_tags,
+                                                                      compact=compact)))
+        yield self._formatted[1]
+
+    def _render_chunks(self, skip_empty_loops: bool = False, skip_empty_tags: bool = False,
+                       stream: bool = False, compact: bool = False) -> Iterator[str]:
+        """Does the work of _format_chunks().
+
+        If stream is True, the quoted values are not kept in memory.
+        Instead the values are quoted once to determine the column widths,
+        and then again as the rows are yielded, in groups of
+        STREAM_ROWS rows. If compact is True, see _render_compact()."""
+
         # Check if there is any data in this loop
         if len(self.data) == 0:
             # They do not want us to print empty loops
             if skip_empty_loops:
-                return ""
+                return
             else:
                 # If we have no tags than return the empty loop
                 if len(self.tags) == 0:
-                    return "\n   loop_\n\n   stop_\n"
+                    yield "loop_\nstop_\n" if compact else "\n   loop_\n\n   stop_\n"
+                    return
 
         if len(self.tags) == 0:
             raise ValueError("Impossible to print data if there are no associated tags. Loop: '%s'." % self.category)
@@ -189,75 +236,155 @@ class Loop(object):
         # If skipping null tags, it's easier to filter out a loop with only real tags and then print
         if skip_empty_tags:
             has_data = [not all([_ in definitions.NULL_VALUES for _ in column]) for column in zip(*self.data)]
-            return self.filter([tag for x, tag in enumerate(self.tags) if has_data[x]]).format()
-
-        # Start the loop
-        ret_string = "\n   loop_\n"
-        # Print the tags
-        format_string = "      %-s\n"
+            yield from self.filter([tag for x, tag in enumerate(self.tags) if has_data[x]])._render_chunks(
+                skip_empty_loops=True, stream=stream, compact=compact)
+            return
 
         # Check to make sure our category is set
         if self.category is None:
             raise ValueError("The category was never set for this loop. Either add a tag with the category intact, "
                              "specify it when generating the loop, or set it using set_category.")
 
-        # Print the categories
-        if self.category is None:
-            for tag in self.tags:
-                ret_string += format_string % tag
-        else:
-            for tag in self.tags:
-                ret_string += format_string % (self.category + "." + tag)
+        if compact:
+            yield from self._render_compact()
+            return
 
-        ret_string += "\n"
+        # Use the fast code if it is available. If it fails, the python code
+        #  below runs instead, and raises the appropriate exception
+        fast_formatter = utils.cnmrstar if hasattr(utils.cnmrstar, 'format_loop') else None
+        if fast_formatter is not None and not stream:
+            try:
+                yield fast_formatter.format_loop(self.category, self.tags, self.data,
+                                                 definitions.STR_CONVERSION_DICT)
+                return
+            except Exception:
+                pass
 
-        row_strings = []
+        # Start the loop and print the tags
+        yield "\n   loop_\n%s\n" % "".join(["      %s.%s\n" % (self.category, tag) for tag in self.tags])
 
         if len(self.data) != 0:
 
-            # Make a copy of the data
-            working_data = []
-            # Put quotes as needed on the data
-            for row_pos, datum in enumerate(self.data):
-                clean_row = []
-                for col_pos, x in enumerate(datum):
-                    try:
-                        clean_row.append(utils.quote_value(x))
-                    except ValueError:
-                        raise FormattingError('Cannot generate NMR-STAR for entry, as empty strings are not valid '
-                                              'tag values in NMR-STAR. Please either replace the empty strings with'
-                                              ' None objects, or set pynmrstar.definitions.STR_CONVERSION_DICT[\'\'] ='
-                                              f' None.\n Loop: {self.category} Row: {row_pos} Column: {col_pos}')
-
-                working_data.append(clean_row)
-
-            # The nightmare below creates a list of the maximum length of
-            #  elements in each tag in the self.data matrix. Don't try to
-            #   understand it. It's an incomprehensible list comprehension.
-            title_widths = [max([len(str(x)) + 3 for x in col]) for
-                            col in [[row[x] for row in working_data] for
-                                    x in range(0, len(working_data[0]))]]
-
-            # TODO: Replace with a smarter title_widths algorithm - or in C
-            # It needs to not count the length of items that will go on their
-            # own line...
-
             # Generate the format string
             format_string = "     " + "%-*s" * len(self.tags) + " \n"
 
-            # Print the data, with the tags sized appropriately
-            for datum in working_data:
-                for pos, item in enumerate(datum):
-                    if "\n" in item:
-                        datum[pos] = "\n;\n%s;\n" % item
+            if stream:
+                title_widths = None
+                if fast_formatter is not None:
+                    try:
+                        title_widths = fast_formatter.loop_widths(self.data, definitions.STR_CONVERSION_DICT)
+                    except Exception:
+                        pass
+                if title_widths is None:
+                    title_widths = [3] * len(self.tags)
+                    for row_pos, datum in enumerate(self.data):
+                        for col_pos, item in enumerate(self._quote_row(row_pos, datum)):
+                            if len(item) + 3 > title_widths[col_pos]:
+                                title_widths[col_pos] = len(item) + 3
+
+                for first_row in range(0, len(self.data), STREAM_ROWS):
+                    last_row = min(first_row + STREAM_ROWS, len(self.data))
+                    if fast_formatter is not None:
+                        try:
+                            yield fast_formatter.format_loop_rows(self.data[first_row:last_row],
+                                                                  definitions.STR_CONVERSION_DICT, title_widths)
+                            continue
+                        except Exception:
+                            pass
+                    yield "".join([self._format_row(format_string, title_widths,
+                                                    self._quote_row(row_pos, self.data[row_pos]))
+                                   for row_pos in range(first_row, last_row)])
+            else:
+                # Put quotes as needed on the data
+                working_data = [self._quote_row(row_pos, datum) for row_pos, datum in enumerate(self.data)]
+
+                # The nightmare below creates a list of the maximum length of
+                #  elements in each tag in the self.data matrix. Don't try to
+                #   understand it. It's an incomprehensible list comprehension.
+                title_widths = [max([len(str(x)) + 3 for x in col]) for
+                                col in [[row[x] for row in working_data] for
+                                        x in range(0, len(working_data[0]))]]
 
-                # Print the data (combine the tags' widths with their data)
-                tag_width_list = [d for d in zip(title_widths, datum)]
-                row_strings.append(format_string % tuple(chain.from_iterable(tag_width_list)))
+                # TODO: Replace with a smarter title_widths algorithm - or in C
+                # It needs to not count the length of items that will go on their
+                # own line...
+
+                yield "".join([self._format_row(format_string, title_widths, datum) for datum in working_data])
 
         # Close the loop
-        ret_string += "".join(row_strings) + "\n   stop_\n"
-        return ret_string
+        yield "\n   stop_\n"
+
+    def _render_compact(self) -> Iterator[str]:
+        """Yields the loop without any alignment: the values are separated
+        by single spaces (and each row indented by one), so the rows are formatted in a single pass
+        without computing the column widths. The rows are yielded in
+        groups of STREAM_ROWS rows."""
+
+        yield "loop_\n%s" % "".join(["%s.%s\n" % (self.category, tag) for tag in self.tags])
+
+        width = len(self.tags)
+        for first_row in range(0, len(self.data), STREAM_ROWS):
+            rows = self.data[first_row:first_row + STREAM_ROWS]
+
+            # Quote the whole group of rows at once, which is much faster than quoting row by row. This only
+            #  works if there are no values that need to go on their own lines or that can't be quoted.
+            try:
+                values = utils.quote_values(list(chain.from_iterable(rows)))
+            except ValueError:
+                values = None
+            if values is not None:
+                chunk = "".join([" %s\n" % " ".join(values[pos:pos + width]) for pos in range(0, len(values), width)])
+                if chunk.count("\n") == len(rows):
+                    yield chunk
+                    continue
+
+            yield "".join([self._format_compact_row(self._quote_row(row_pos, row))
+                           for row_pos, row in enumerate(rows, first_row)])
+        yield "stop_\n"
+
+    @staticmethod
+    def _format_compact_row(datum: List[str]) -> str:
+        """Returns a row of quoted values separated by single spaces.
+        Multi-line values are put in semicolon-delimited blocks. The row
+        is indented by one space, as a value that starts with a semicolon
+        at the start of a line would open a semicolon-delimited block."""
+
+        for pos, item in enumerate(datum):
+            if "\n" in item:
+                datum[pos] = "\n;\n%s;\n" % item
+        return " %s\n" % " ".join(datum)
+
+    def _quote_row(self, row_pos: int, datum: List[Any]) -> List[str]:
+        """Returns the values of a row of the loop, quoted as needed."""
+
+        try:
+            return utils.quote_values(datum)
+        except ValueError:
+            # Find the value that could not be quoted
+            pass
+
+        clean_row = []
+        for col_pos, x in enumerate(datum):
+            try:
+                clean_row.append(utils.quote_value(x))
+            except ValueError:
+                raise FormattingError('Cannot generate NMR-STAR for entry, as empty strings are not valid '
+                                      'tag values in NMR-STAR. Please either replace the empty strings with'
+                                      ' None objects, or set pynmrstar.definitions.STR_CONVERSION_DICT[\'\'] ='
+                                      f' None.\n Loop: {self.category} Row: {row_pos} Column: {col_pos}')
+        return clean_row
+
+    @staticmethod
+    def _format_row(format_string: str, title_widths: List[int], datum: List[str]) -> str:
+        """Returns a row of quoted values, with the tags sized
+        appropriately."""
+
+        for pos, item in enumerate(datum):
+            if "\n" in item:
+                datum[pos] = "\n;\n%s;\n" % item
+
+        # Print the data (combine the tags' widths with their data)
+        return format_string % tuple(chain.from_iterable(zip(title_widths, datum)))
 
     @property
     def empty(self) -> bool:
@@ -401,6 +528,14 @@ class Loop(object):
 
         return True
 
+    def _clear_cache(self) -> None:
+        """ Discards the cached digest and formatted text of the tags and
+        data. Called by every method that modifies the tags or data of the
+        loop. """
+
+        self._digest = None
+        self._formatted = None
+
     def add_data(self, the_list: List[Any], rearrange: bool = False, convert_data_types: bool = False):
         """Add a list to the data field. Items in list can be any type,
         they will be converted to string and formatted correctly. The
@@ -416,6 +551,7 @@ class Loop(object):
                                  "names first.")
             # Add the user data
             self.data.append(the_list)
+            self._clear_cache()
             return
 
         # Break their data into chunks based on the number of tags
@@ -433,6 +569,7 @@ class Loop(object):
                                                      line_num="Loop %s" % self.category)
 
         self.data.extend(processed_data)
+        self._clear_cache()
 
     def add_data_by_tag(self, tag_name: str, value) -> None:
         """Add data to the loop one element at a time, based on tag.
@@ -456,6 +593,7 @@ class Loop(object):
         if len(self.data[-1]) != pos:
             raise ValueError("You cannot add data out of tag order.")
         self.data[-1].append(value)
+        self._clear_cache()
 
     def add_missing_tags(self, schema: 'Schema' = None, all_tags: bool = False) -> None:
         """ Automatically adds any missing tags (according to the schema),
@@ -476,6 +614,7 @@ class Loop(object):
             # If we are in another row, assign to the previous row
             for pos, row in enumerate(self.data):
                 row[ordinal_idx] = pos + 1
+            self._clear_cache()
 
     def add_tag(self, name: Union[str, List[str]], ignore_duplicates: bool = False, update_data: bool = False) -> None:
         """Add a tag to the tag name list. Does a bit of validation
@@ -535,12 +674,14 @@ class Loop(object):
 
             for row in self.data:
                 row.append(None)
+        self._clear_cache()
 
     def clear_data(self) -> None:
         """Erases all data in this loop. Does not erase the tag names
         or loop category."""
 
         self.data = []
+        self._clear_cache()
 
     def compare(self, other) -> List[str]:
         """Returns the differences between two loops as a list. Order of
@@ -614,6 +755,7 @@ class Loop(object):
             del self.tags[tag_position]
             for row in self.data:
                 del row[tag_position]
+        self._clear_cache()
 
     def delete_data_by_tag_value(self, tag: str, value: Any, index_tag: str = None) -> List[List[Any]]:
         """Deletes all rows which contain the provided value in the
@@ -640,6 +782,8 @@ class Loop(object):
                 deleted.append(self.data.pop(cur_row))
                 continue
             cur_row += 1
+        if deleted:
+            self._clear_cache()
 
         # Re-number if they so desire
         if index_tag is not None:
@@ -647,6 +791,28 @@ class Loop(object):
 
         return deleted
 
+    def digest(self, refresh: bool = False) -> str:
+        """ Returns a stable hash (as a hex string) of the category, tags,
+        and data of the loop. Values are hashed as they would be printed,
+        so a loop and a copy of it parsed from str(loop) have the same
+        digest, even if the data types of their values differ.
+
+        The hash of the tags and data is cached, and only recomputed after
+        the loop is modified using the Loop methods. If you modify the
+        .tags or .data lists directly, call mark_dirty() afterwards, or
+        specify refresh=True to ignore the cached hash."""
+
+        import hashlib
+
+        if refresh or self._digest is None:
+            conversion = definitions.STR_CONVERSION_DICT
+            hasher = hashlib.sha256(json.dumps(self.tags).encode())
+            for row in self.data:
+                hasher.update(json.dumps([str(conversion.get(x, x)) for x in row]).encode())
+            self._digest = hasher.hexdigest()
+
+        return hashlib.sha256(json.dumps([str(self.category), self._digest]).encode()).hexdigest()
+
     def filter(self, tag_list: Union[str, List[str], Tuple[str]], ignore_missing_tags: bool = False):
         """ Returns a new loop containing only the specified tags.
         Specify ignore_missing_tags=True to bypass missing tags rather
@@ -691,14 +857,16 @@ class Loop(object):
 
         return result
 
-    def format(self, skip_empty_loops: bool = True, skip_empty_tags: bool = False) -> str:
+    def format(self, skip_empty_loops: bool = True, skip_empty_tags: bool = False, compact: bool = False) -> str:
         """ The same as calling str(Loop), except that you can pass options
         to customize how the loop is printed.
 
         skip_empty_loops will omit printing loops with no tags at all. (A loop with null tags is not "empty".)
-        skip_empty_tags will omit tags in the loop which have no non-null values."""
+        skip_empty_tags will omit tags in the loop which have no non-null values.
+        compact will separate the values with single spaces rather than aligning them in columns. This is faster,
+          and intended for output that will be read by programs rather than people."""
 
-        return self.__str__(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags)
+        return self.__str__(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags, compact=compact)
 
     def get_data_as_csv(self, header: bool = True, show_category: bool = True) -> str:
         """Return the data contained in the loops, properly CSVd, as a
@@ -828,6 +996,14 @@ class Loop(object):
 
         return result
 
+    def mark_dirty(self) -> None:
+        """ Notifies the loop that its tags or data were modified directly,
+        rather than through the Loop methods, so that any cached values
+        (such as the digest() and the formatted text) are recomputed the next
+        time they are needed."""
+
+        self._clear_cache()
+
     def print_tree(self) -> None:
         """Prints a summary, tree style, of the loop."""
 
@@ -886,6 +1062,7 @@ class Loop(object):
         else:
             for pos in range(0, len(self.data)):
                 self.data[pos][renumber_tag] = pos + start_value
+        self._clear_cache()
 
     def set_category(self, category: str) -> None:
         """ Set the category of the loop. Useful if you didn't know the
@@ -912,6 +1089,7 @@ class Loop(object):
         else:
             self.data = self.get_tag(sorted_order)
             self.tags = [utils.format_tag(x) for x in sorted_order]
+            self._clear_cache()
 
     def sort_rows(self, tags: Union[str, List[str]], key: Callable = None) -> None:
         """ Sort the data in the rows by their values for a given tag
@@ -972,6 +1150,7 @@ class Loop(object):
                 else:
                     tmp_data = sorted(self.data, key=key)
             self.data = tmp_data
+        self._clear_cache()
 
     def tag_index(self, tag_name: str) -> Optional[int]:
         """ Helper method to do a case-insensitive check for the presence
@@ -988,7 +1167,7 @@ class Loop(object):
             return None
 
     def validate(self, validate_schema: bool = True, schema: 'Schema' = None,
-                 validate_star: bool = True, category: str = None) -> List[str]:
+                 validate_star: bool = True, category: str = None, max_errors: Optional[int] = None) -> List[str]:
         """Validate a loop in a variety of ways. Returns a list of
         errors found. 0-length list indicates no errors found. By
         default all validation modes are enabled.
@@ -997,22 +1176,27 @@ class Loop(object):
         the NMR-STAR schema. You can pass your own custom schema if desired,
         otherwise the schema will be fetched from the BMRB servers.
 
-        validate_star - Determines if the STAR syntax checks are ran."""
+        validate_star - Determines if the STAR syntax checks are ran.
+
+        max_errors - Stop validating once this many errors have been found,
+        and return only the first max_errors errors."""
+
+        if max_errors is not None and max_errors < 1:
+            raise ValueError("max_errors must be at least 1.")
 
         errors = []
 
         if validate_schema:
             # Get the default schema if we are not passed a schema
             my_schema = utils.get_schema(schema)
+            plans = [my_schema._validation_plan(self.category + "." + tag) for tag in self.tags]
 
-            # Check the data
-            for row_num, row in enumerate(self.data):
-                for pos, datum in enumerate(row):
-                    line_no = str(row_num) + " tag " + str(pos) + " of loop"
-                    if datum == "a":
-                        pass
-                    errors.extend(my_schema.val_type(self.category + "." + self.tags[pos], datum, category=category,
-                                                     line_number=line_no))
+            # When stopping early, check the rows a block at a time so that the rest of the rows can be skipped
+            block_rows = max(len(self.data), 1) if max_errors is None else VALIDATE_ROWS
+            for first_row in range(0, len(self.data), block_rows):
+                errors.extend(self._validate_rows(plans, category, first_row, first_row + block_rows))
+                if max_errors is not None and len(errors) >= max_errors:
+                    return errors[:max_errors]
 
         if validate_star:
             # Check for wrong data size
@@ -1023,7 +1207,32 @@ class Loop(object):
                     errors.append("Loop '%s' data width does not match it's tag width on row '%d'." %
                                   (self.category, row_num))
 
-        return errors
+        return errors if max_errors is None else errors[:max_errors]
+
+    def _validate_rows(self, plans: list, category: Optional[str], start: int, stop: int) -> List[str]:
+        """ Returns the schema errors of the rows from start to stop. The
+        rows are checked a column at a time, and the error messages are
+        only built for the values that failed. """
+
+        rows = self.data[start:stop]
+        failed = []
+        regular = all(len(row) == len(plans) for row in rows)
+        for pos, plan in enumerate(plans):
+            if regular:
+                row_nums = range(len(rows))
+                column = [row[pos] for row in rows]
+            else:
+                row_nums = [row_num for row_num, row in enumerate(rows) if len(row) > pos]
+                column = [rows[row_num][pos] for row_num in row_nums]
+
+            for index in plan.failures(column, category):
+                row_num = start + row_nums[index]
+                failed.append((row_num, pos, plan.errors(column[index], category,
+                                                         str(row_num) + " tag " + str(pos) + " of loop")))
+
+        # Report the errors row by row
+        failed.sort(key=lambda x: x[:2])
+        return [error for _, _, value_errors in failed for error in value_errors]
 
     def add_column(self, name, ignore_duplicates=False, update_data=False) -> None:
         """ Deprecated, please use add_tag() instead. """
@@ -1,12 +1,18 @@
 import logging
 import re
-from typing import Optional, Any
+import threading
+from time import perf_counter
+from typing import Optional, Any, Iterator, Tuple, Union
 
-from pynmrstar import definitions, entry as entry_mod, loop as loop_mod, saveframe as saveframe_mod
+from pynmrstar import definitions, entry as entry_mod, hooks, loop as loop_mod, profiling, saveframe as saveframe_mod
 from pynmrstar._internal import _get_cnmrstar
 from pynmrstar.exceptions import ParsingError
 
+logger = logging.getLogger(__name__)
 cnmrstar = _get_cnmrstar()
+# The C tokenizer with its own state per use, if the C module is recent enough to have it
+_c_tokenizer = getattr(cnmrstar, 'Tokenizer', None)
+_cnmrstar_lock: threading.Lock = threading.Lock()
 
 
 class Parser(object):
@@ -26,6 +32,7 @@ class Parser(object):
         self.source: str = "unknown"
         self.delimiter: str = " "
         self.line_number: int = 0
+        self._tokens: Iterator[Union[Tuple[Optional[str], int, str], ValueError]] = iter(())
 
     def get_line_number(self) -> int:
         """ Returns the current line number that is in the process of
@@ -40,10 +47,12 @@ class Parser(object):
         """ Returns the next token in the parsing process."""
 
         if cnmrstar is not None:
-            try:
-                self.token, self.line_number, self.delimiter = cnmrstar.get_token_full()
-            except ValueError as err:
-                raise ParsingError(str(err))
+            token = next(self._tokens, None)
+            if isinstance(token, ValueError):
+                raise ParsingError(str(token))
+            # Once all of the tokens have been used, self.token stays None
+            if token is not None:
+                self.token, self.line_number, self.delimiter = token
         else:
             self.real_get_token(raise_parse_warnings)
             self.line_number = 0
@@ -67,9 +76,9 @@ class Parser(object):
                     pass
 
         if self.token:
-            logging.debug("'%s': '%s'" % (self.delimiter, self.token))
+            logger.debug("'%s': '%s'" % (self.delimiter, self.token))
         else:
-            logging.debug("No more tokens.")
+            logger.debug("No more tokens.")
 
         # Return the token
         return self.token
@@ -108,10 +117,36 @@ class Parser(object):
         data = re.sub(r'\n;([^\n]+?)\n', r'\n;\n\1\n', data)
 
         if cnmrstar is not None:
-            cnmrstar.load_string(data)
+            self._tokens = self._c_tokenize(data)
         else:
             self.full_data = data + "\n"
 
+    @staticmethod
+    def _c_tokenize(data: str) -> Iterator[Union[Tuple[Optional[str], int, str], ValueError]]:
+        """ Yields the (token, line number, delimiter) tuples the C
+        tokenizer finds in the data, ending with a None token, as they are
+        needed. If the tokenizer fails, the error takes the place of the
+        rest of the tokens, so that it is raised when it is reached.
+
+        Each call gets its own tokenizer state, unless the C module is too
+        old to have the Tokenizer type. The module then keeps the state in
+        global variables, and _parse() holds _cnmrstar_lock while it is in
+        use and resets it afterwards. """
+
+        if _c_tokenizer is not None:
+            get_token_full = _c_tokenizer(data).get_token_full
+        else:
+            cnmrstar.load_string(data)
+            get_token_full = cnmrstar.get_token_full
+        try:
+            while True:
+                token = get_token_full()
+                yield token
+                if token[0] is None:
+                    return
+        except ValueError as err:
+            yield err
+
     def parse(self, data: str, source: str = "unknown", raise_parse_warnings: bool = False,
               convert_data_types: bool = False) -> 'entry_mod.Entry':
         """ Parses the string provided as data as an NMR-STAR entry
@@ -131,6 +166,88 @@ class Parser(object):
         but the tag looked like this:
         \n; The multi-line\nvalue here.\n;\n"""
 
+        if hooks._callbacks['parse_start'] or hooks._callbacks['parse_end']:
+            return self._hooked_parse(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                                      convert_data_types=convert_data_types)
+        return self._measured_parse(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                                    convert_data_types=convert_data_types)
+
+    def _hooked_parse(self, data: str, source: str = "unknown", raise_parse_warnings: bool = False,
+                      convert_data_types: bool = False) -> 'entry_mod.Entry':
+        """ Parses while calling the parse_start and parse_end hooks. """
+
+        hooks._emit('parse_start', source=source, size=len(data))
+        start, error = perf_counter(), None
+        try:
+            return self._measured_parse(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                                        convert_data_types=convert_data_types)
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            hooks._emit('parse_end', source=source, size=len(data), seconds=perf_counter() - start,
+                        entry_id=self.ent.entry_id, saveframes=len(self.ent.frame_list), error=error)
+
+    def _measured_parse(self, data: str, source: str = "unknown", raise_parse_warnings: bool = False,
+                        convert_data_types: bool = False) -> 'entry_mod.Entry':
+        """ Parses while collecting the profiling counters, if they are
+        being collected. """
+
+        if profiling.active() is not None:
+            return self._profiled_parse(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                                        convert_data_types=convert_data_types)
+        return self._parse(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                           convert_data_types=convert_data_types)
+
+    def _profiled_parse(self, data: str, source: str = "unknown", raise_parse_warnings: bool = False,
+                        convert_data_types: bool = False) -> 'entry_mod.Entry':
+        """ Parses while adding the time spent to the parse, tokenize and
+        construct phases of the active profile. """
+
+        profile = profiling.active()
+        get_token = self.get_token
+
+        def timed_get_token(raise_parse_warnings: bool = False) -> str:
+            token_start = perf_counter()
+            try:
+                return get_token(raise_parse_warnings)
+            finally:
+                profile.add('tokenize', perf_counter() - token_start)
+
+        tokenize_before, convert_before = profile.seconds.get('tokenize', 0), profile.seconds.get('convert', 0)
+        self.get_token = timed_get_token
+        start = perf_counter()
+        try:
+            return self._parse(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                               convert_data_types=convert_data_types)
+        finally:
+            elapsed = perf_counter() - start
+            del self.get_token
+            profile.add('parse', elapsed)
+            profile.add('construct', elapsed - (profile.seconds.get('tokenize', 0) - tokenize_before) -
+                        (profile.seconds.get('convert', 0) - convert_before))
+            profile.bytes_parsed += len(data)
+
+    def _parse(self, data: str, source: str = "unknown", raise_parse_warnings: bool = False,
+               convert_data_types: bool = False) -> 'entry_mod.Entry':
+        """ Does the work of parse(), holding the lock on the C tokenizer
+        if it keeps its state in global variables. """
+
+        if cnmrstar is not None and _c_tokenizer is None:
+            with _cnmrstar_lock:
+                try:
+                    return self._parse_tokens(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                                              convert_data_types=convert_data_types)
+                finally:
+                    self._tokens = iter(())
+                    cnmrstar.reset()
+        return self._parse_tokens(data, source=source, raise_parse_warnings=raise_parse_warnings,
+                                  convert_data_types=convert_data_types)
+
+    def _parse_tokens(self, data: str, source: str = "unknown", raise_parse_warnings: bool = False,
+                      convert_data_types: bool = False) -> 'entry_mod.Entry':
+        """ Parses the tokens of the data. """
+
         # Prepare the data for parsing
         self.load_data(data)
 
@@ -156,6 +273,7 @@ class Parser(object):
         # Set the entry_id
         self.ent._entry_id = self.token[5:]
         self.source = source
+        saveframe_hooked = bool(hooks._callbacks['saveframe_parsed'])
 
         # We are expecting to get saveframes
         while self.get_token() is not None:
@@ -176,6 +294,8 @@ class Parser(object):
             cur_frame: Optional[saveframe_mod.Saveframe] = saveframe_mod.Saveframe.from_scratch(self.token[5:],
                                                                                                 source=source)
             self.ent.add_saveframe(cur_frame)
+            if saveframe_hooked:
+                saveframe_start = perf_counter()
 
             # We are in a saveframe
             while self.get_token() is not None:
@@ -219,14 +339,14 @@ class Parser(object):
                                         if raise_parse_warnings:
                                             raise ParsingError("Loop with no tags.", self.get_line_number())
                                         else:
-                                            logging.warning('Loop with no tags in parsed file on line: %s' %
-                                                            self.get_line_number())
+                                            logger.warning('Loop with no tags in parsed file on line: %s' %
+                                                           self.get_line_number())
                                         cur_loop = None
                                     if not seen_data:
                                         if raise_parse_warnings:
                                             raise ParsingError("Loop with no data.", self.get_line_number())
                                         else:
-                                            logging.warning("Loop with no data on line: %s" % self.get_line_number())
+                                            logger.warning("Loop with no data on line: %s" % self.get_line_number())
 
                                     if len(cur_data) > 0:
                                         try:
@@ -272,6 +392,11 @@ class Parser(object):
                         raise ParsingError("The tag prefix was never set! Either the saveframe had no tags, you "
                                            "tried to read a version 2.1 file, or there is something else wrong with "
                                            "your file. Saveframe error occurred within: '%s'" % cur_frame.name)
+                    if saveframe_hooked:
+                        hooks._emit('saveframe_parsed', source=source, name=cur_frame.name,
+                                    category=cur_frame.category, tags=len(cur_frame.tags),
+                                    loops=len(cur_frame.loops), rows=sum([len(x.data) for x in cur_frame.loops]),
+                                    seconds=perf_counter() - saveframe_start)
                     break
 
                 # Invalid content in saveframe
@@ -307,9 +432,8 @@ class Parser(object):
         # Free the memory of the original copy of the data we parsed
         self.full_data = None
 
-        # Reset the parser
-        if cnmrstar is not None:
-            cnmrstar.reset()
+        # Free the tokens
+        self._tokens = iter(())
 
         return self.ent
 
@@ -392,9 +516,9 @@ class Parser(object):
                                                "should terminate with \\n;\\n but in this file only \\n; with "
                                                "non-return whitespace following was found.", self.get_line_number())
                         else:
-                            logging.warning("Technically invalid line found in file. Multi-line values "
-                                            "should terminate with \\n;\\n but in this file only \\n; with non-return "
-                                            "whitespace following was found. Line: %s" % self.get_line_number())
+                            logger.warning("Technically invalid line found in file. Multi-line values "
+                                           "should terminate with \\n;\\n but in this file only \\n; with non-return "
+                                           "whitespace following was found. Line: %s" % self.get_line_number())
                         self.token = tmp[0:until + 1]
                         self.index += until + 4
                         self.delimiter = ";"
@@ -0,0 +1,221 @@
+""" Lightweight counters of where PyNMR-STAR spends its time. Unlike a
+profiler such as cProfile, only a few points in the library are measured,
+so the counters barely affect the timings and can be left enabled in
+production. Until counters are first collected, the measured functions
+are not wrapped at all, so they cost nothing; after that, outside of a
+collect() block they only check whether counters are being collected.
+
+    >>> from pynmrstar import profiling
+    >>> with profiling.collect() as profile:
+    ...     entry = pynmrstar.Entry.from_file('bmr15000_3.str', convert_data_types=True)
+    ...     entry.validate()
+    >>> print(profile.report())
+
+The phases that are measured are:
+
+    read       reading (and decompressing) files, URLs and file objects
+    parse      parsing, which is made up of the three phases below
+    tokenize   getting the tokens from the tokenizer
+    convert    converting values to python types (Schema.convert_tag())
+    construct  the rest of parsing, i.e. building the entry objects
+    validate   validating values against the schema (Schema.val_type() and
+               the checks of loop columns in Loop.validate())
+    format     rendering saveframes and loops as NMR-STAR
+    quote      quoting values (utils.quote_value() and quote_values()),
+               mostly as part of format
+    write      writing the output to files or file objects
+
+Phases can overlap (e.g. quote and format), so the times of the phases
+should not be added up. Only the work done in the thread (or asyncio task)
+running the with block is counted, so collect() blocks running at the same
+time in different threads each get their own counters. Work done in other
+threads or processes (e.g. format(workers=N)) is not counted. """
+
+import functools
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# The counters currently being collected in this context, if any
+_profile: ContextVar = ContextVar('pynmrstar_profile', default=None)
+# The functions to time while collecting, as (phase, function) tuples, and whether the timed versions are installed
+_TIMED: List[Tuple[str, Callable]] = []
+_installed: bool = False
+_lock: threading.Lock = threading.Lock()
+
+PHASES = ['read', 'parse', 'tokenize', 'convert', 'construct', 'validate', 'format', 'quote', 'write']
+
+
+class Profile(object):
+    """ The counters collected by collect(). seconds and calls hold the
+    wall time and the number of calls of each phase. bytes_read and
+    bytes_parsed are the number of characters read and parsed. """
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.bytes_read: int = 0
+        self.bytes_parsed: int = 0
+
+    def __repr__(self) -> str:
+        return "<pynmrstar.profiling.Profile %s>" % ", ".join(["%s=%.3fs" % (phase, self.seconds[phase])
+                                                               for phase in self._phases()])
+
+    def _phases(self) -> list:
+        return [x for x in PHASES if x in self.calls] + sorted([x for x in self.calls if x not in PHASES])
+
+    def add(self, phase: str, seconds: float, calls: int = 1) -> None:
+        """ Adds time spent and calls made to a phase. """
+
+        self.seconds[phase] = self.seconds.get(phase, 0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def rates(self) -> Dict[str, float]:
+        """ Returns the throughput of reading and parsing (in characters
+        per second) and of tokenizing (in tokens per second), for the
+        phases that were measured. """
+
+        rates = {}
+        if self.seconds.get('read'):
+            rates['bytes_read_per_second'] = self.bytes_read / self.seconds['read']
+        if self.seconds.get('parse'):
+            rates['bytes_parsed_per_second'] = self.bytes_parsed / self.seconds['parse']
+        if self.seconds.get('tokenize'):
+            rates['tokens_per_second'] = self.calls['tokenize'] / self.seconds['tokenize']
+        return rates
+
+    def as_dict(self) -> Dict[str, Any]:
+        """ Returns the counters as a dictionary, e.g. to send them to a
+        metrics system. """
+
+        return {'phases': {phase: {'seconds': self.seconds[phase], 'calls': self.calls[phase]}
+                           for phase in self._phases()},
+                'bytes_read': self.bytes_read, 'bytes_parsed': self.bytes_parsed, 'rates': self.rates()}
+
+    def report(self) -> str:
+        """ Returns a table of the counters. """
+
+        lines = ["%-12s %12s %12s %14s" % ('Phase', 'Seconds', 'Calls', 'Per call (us)')]
+        for phase in self._phases():
+            lines.append("%-12s %12.4f %12d %14.2f" % (phase, self.seconds[phase], self.calls[phase],
+                                                        self.seconds[phase] / self.calls[phase] * 1e6))
+        rates = self.rates()
+        if 'bytes_read_per_second' in rates:
+            lines.append("Read %d bytes at %.1f MB/s" % (self.bytes_read, rates['bytes_read_per_second'] / 1e6))
+        if 'bytes_parsed_per_second' in rates:
+            lines.append("Parsed %d bytes at %.1f MB/s" % (self.bytes_parsed,
+                                                          rates['bytes_parsed_per_second'] / 1e6))
+        if 'tokens_per_second' in rates:
+            lines.append("Tokenized %d tokens at %.0f tokens/s" % (self.calls['tokenize'],
+                                                                  rates['tokens_per_second']))
+        return "\n".join(lines)
+
+
+@contextmanager
+def collect() -> Iterator[Profile]:
+    """ Collects the counters for the code run within the with block.
+    Yields the Profile the counters are collected in. If collect() is
+    nested, only the innermost block collects the counters. """
+
+    _install()
+    profile = Profile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def active() -> Optional[Profile]:
+    """ Returns the Profile the counters are currently being collected
+    in, or None if they are not being collected. """
+
+    return _profile.get()
+
+
+def _timed(phase: str) -> Callable[[Callable], Callable]:
+    """ Decorator which marks the function (or method) to be timed as
+    part of the phase. Until counters are first collected, the function
+    is returned unchanged, so that it costs nothing in programs which
+    never collect them; the first collect() then replaces the functions
+    with timed versions, which only check that no counters are being
+    collected when called outside of a collect() block. """
+
+    def decorator(function: Callable) -> Callable:
+        with _lock:
+            if _installed:
+                return _timed_wrapper(phase, function)
+            _TIMED.append((phase, function))
+        return function
+    return decorator
+
+
+def _install() -> None:
+    """ Replaces the functions marked by _timed() with their timed
+    versions, the first time it is called. They are never removed again,
+    so that collect() blocks in different threads can't undo each other's
+    changes. """
+
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        for phase, function in _TIMED:
+            setattr(_owner(function), function.__name__, _timed_wrapper(phase, function))
+        _installed = True
+
+
+def _owner(function: Callable) -> Any:
+    """ Returns the module or class the function is defined in. """
+
+    owner = sys.modules[function.__module__]
+    for name in function.__qualname__.split(".")[:-1]:
+        owner = getattr(owner, name)
+    return owner
+
+
+def _timed_wrapper(phase: str, function: Callable) -> Callable:
+    """ Returns a version of the function which adds the time spent in it
+    to the phase. For generator functions, the time spent producing each
+    value is counted, and the generator counts as a single call. """
+
+    import inspect
+
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def generator_wrapper(*args, **kwargs):
+            profile = _profile.get()
+            if profile is None:
+                yield from function(*args, **kwargs)
+                return
+
+            iterator, calls = function(*args, **kwargs), 1
+            while True:
+                start = perf_counter()
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    profile.add(phase, perf_counter() - start, calls)
+                    return
+                profile.add(phase, perf_counter() - start, calls)
+                calls = 0
+                yield value
+        return generator_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profile = _profile.get()
+        if profile is None:
+            return function(*args, **kwargs)
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.add(phase, perf_counter() - start)
+    return wrapper
+
+
+__all__ = ['PHASES', 'Profile', 'active', 'collect']
@@ -1,10 +1,10 @@
 import json
 from csv import reader as csv_reader, writer as csv_writer
 from io import StringIO
-from typing import TextIO, BinaryIO, Union, List, Optional, Any, Dict, Iterable
+from typing import TextIO, BinaryIO, IO, Union, List, Optional, Any, Dict, Iterable, Iterator, Tuple
 
-from pynmrstar import definitions, entry as entry_mod, loop as loop_mod, parser as parser_mod, utils
-from pynmrstar._internal import _get_comments, _json_serialize, _interpret_file
+from pynmrstar import definitions, entry as entry_mod, loop as loop_mod, parser as parser_mod, profiling, utils
+from pynmrstar._internal import _get_comments, _json_serialize, _interpret_file, _write_file
 from pynmrstar.exceptions import FormattingError
 from pynmrstar.schema import Schema
 
@@ -100,6 +100,8 @@ class Saveframe(object):
         self.source: str = "unknown"
         self.category: Optional[str] = None
         self.tag_prefix: Optional[str] = None
+        self._digest: Optional[str] = None
+        self._formatted: Optional[Tuple[tuple, str]] = None
 
         star_buffer: StringIO = StringIO('')
 
@@ -381,31 +383,71 @@ class Saveframe(object):
             self.add_tag(key, item, update=True)
 
     def __str__(self, first_in_category: bool = True, skip_empty_loops: bool = False,
-                skip_empty_tags: bool = False, show_comments: bool = True) -> str:
+                skip_empty_tags: bool = False, show_comments: bool = True, compact: bool = False) -> str:
         """Returns the saveframe in STAR format as a string."""
 
+        return "".join(self._format_chunks(first_in_category=first_in_category, skip_empty_loops=skip_empty_loops,
+                                           skip_empty_tags=skip_empty_tags, show_comments=show_comments,
+                                           compact=compact))
+
+    def _format_chunks(self, first_in_category: bool = True, skip_empty_loops: bool = False,
+                       skip_empty_tags: bool = False, show_comments: bool = True,
+                       stream: bool = False, compact: bool = False) -> Iterator[str]:
+        """Yields the saveframe in STAR format as a series of strings.
+        If stream is True, the loops are streamed as well, rather than
+        each being formatted as one string."""
+
         if self.tag_prefix is None:
             raise ValueError("The tag prefix was never set!")
 
         # Make sure this isn't a dummy saveframe before proceeding
-        try:
-            width = max([len(self.tag_prefix + "." + x[0]) for x in self.tags])
-        except ValueError:
-            return "\nsave_%s\n\nsave_\n" % self.name
+        if not self.tags:
+            yield "save_%s\nsave_\n" % self.name if compact else "\nsave_%s\n\nsave_\n" % self.name
+            return
+
+        yield self._format_tags(first_in_category=first_in_category, skip_empty_tags=skip_empty_tags,
+                                show_comments=show_comments, compact=compact)
+
+        # Print any loops
+        for each_loop in self.loops:
+            yield from each_loop._format_chunks(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags,
+                                                stream=stream, compact=compact)
 
-        ret_string = ""
+        # Close the saveframe
+        yield "save_\n" if compact else "\nsave_\n"
+
+    @profiling._timed('format')
+    def _format_tags(self, first_in_category: bool = True, skip_empty_tags: bool = False,
+                     show_comments: bool = True, compact: bool = False) -> str:
+        """Returns the comment, the saveframe header, and the tags of the
+        saveframe in STAR format. If definitions.CACHE_FORMATTED_OUTPUT is
+        set, the text is cached until the tags are modified (or formatted
+        with different options). If compact is True the tag names are not
+        padded to align the values."""
+
+        if definitions.CACHE_FORMATTED_OUTPUT:
+            cache_key = (first_in_category, skip_empty_tags, show_comments, compact, self.name, self.tag_prefix,
+                         self.category, dict(definitions.STR_CONVERSION_DICT))
+            if self._formatted is not None and self._formatted[0] == cache_key:
+                return self._formatted[1]
+
+        width = 0 if compact else max([len(self.tag_prefix + "." + x[0]) for x in self.tags])
+        chunks = []
 
         # Insert the comment if not disabled
         if show_comments:
             if self.category in _get_comments():
                 this_comment = _get_comments()[self.category]
                 if first_in_category or this_comment['every_flag']:
-                    ret_string = _get_comments()[self.category]['comment']
+                    chunks.append(_get_comments()[self.category]['comment'])
 
         # Print the saveframe
-        ret_string += "save_%s\n" % self.name
-        pstring = "   %%-%ds  %%s\n" % width
-        mstring = "   %%-%ds\n;\n%%s;\n" % width
+        chunks.append("save_%s\n" % self.name)
+        if compact:
+            pstring, mstring = "%s %s\n", "%s\n;\n%s;\n"
+        else:
+            pstring = "   %%-%ds  %%s\n" % width
+            mstring = "   %%-%ds\n;\n%%s;\n" % width
 
         # Print the tags
         for each_tag in self.tags:
@@ -421,17 +463,22 @@ class Saveframe(object):
 
             formatted_tag = self.tag_prefix + "." + each_tag[0]
             if "\n" in clean_tag:
-                ret_string += mstring % (formatted_tag, clean_tag)
+                chunks.append(mstring % (formatted_tag, clean_tag))
             else:
-                ret_string += pstring % (formatted_tag, clean_tag)
+                chunks.append(pstring % (formatted_tag, clean_tag))
 
-        # Print any loops
-        for each_loop in self.loops:
-            ret_string += each_loop.format(skip_empty_loops=skip_empty_loops, skip_empty_tags=skip_empty_tags)
+        text = "".join(chunks)
+        if definitions.CACHE_FORMATTED_OUTPUT:
+            self._formatted = (cache_key, text)
+        return text
 
-        # Close the saveframe
-        ret_string += "\nsave_\n"
-        return ret_string
+    def _clear_cache(self) -> None:
+        """ Discards the cached digest and formatted text of the saveframe
+        tags. Called by every method that modifies the tags of the
+        saveframe. """
+
+        self._digest = None
+        self._formatted = None
 
     def add_loop(self, loop_to_add: 'loop_mod.Loop') -> None:
         """Add a loop to the saveframe loops."""
@@ -471,6 +518,7 @@ class Saveframe(object):
                 raise ValueError("There is already a tag with the name '%s'." % name)
             else:
                 self.get_tag(name, whole_tag=True)[0][1] = value
+                self._clear_cache()
                 return
 
         if "." in name:
@@ -499,6 +547,7 @@ class Saveframe(object):
             new_tag.append(line_num)
 
         self.tags.append(new_tag)
+        self._clear_cache()
 
     def add_tags(self, tag_list: list, update: bool = False) -> None:
         """Adds multiple tags to the list. Input should be a list of
@@ -639,10 +688,35 @@ class Saveframe(object):
         for position, each_tag in enumerate(self.tags):
             # If the tag is a match, remove it
             if each_tag[0].lower() == tag:
+                self._clear_cache()
                 return self.tags.pop(position)
 
         raise KeyError("There is no tag with name '%s' to remove." % tag)
 
+    def digest(self, refresh: bool = False) -> str:
+        """ Returns a stable hash (as a hex string) of the name, tags, and
+        loops of the saveframe. Values are hashed as they would be printed,
+        so a saveframe and a copy of it parsed from str(saveframe) have the
+        same digest, even if the data types of their values differ.
+
+        The hash is built from the cached hash of the saveframe tags and
+        the digest() of each loop, so only the parts of the saveframe which
+        were modified since the last call are hashed again. If you modify
+        the .tags list directly, call mark_dirty() afterwards, or specify
+        refresh=True to ignore the cached hashes."""
+
+        import hashlib
+
+        if refresh or self._digest is None:
+            conversion = definitions.STR_CONVERSION_DICT
+            hasher = hashlib.sha256()
+            for tag in self.tags:
+                hasher.update(json.dumps([tag[0], str(conversion.get(tag[1], tag[1]))]).encode())
+            self._digest = hasher.hexdigest()
+
+        return hashlib.sha256(json.dumps([str(self.name), str(self.tag_prefix), str(self.category), self._digest] +
+                                         [x.digest(refresh=refresh) for x in self.loops]).encode()).hexdigest()
+
     def get_data_as_csv(self, header: bool = True, show_category: bool = True) -> str:
         """Return the data contained in the loops, properly CSVd, as a
         string. Set header to False omit the header. Set show_category
@@ -666,16 +740,19 @@ class Saveframe(object):
         csv_buffer.seek(0)
         return csv_buffer.read().replace('\r\n', '\n')
 
-    def format(self, skip_empty_loops: bool = True, skip_empty_tags: bool = False, show_comments: bool = True) -> str:
+    def format(self, skip_empty_loops: bool = True, skip_empty_tags: bool = False, show_comments: bool = True,
+               compact: bool = False) -> str:
         """ The same as calling str(Saveframe), except that you can pass options
         to customize how the saveframe is printed.
 
         skip_empty_loops will omit printing loops with no tags at all. (A loop with null tags is not "empty".)
         skip_empty_tags will omit tags in the saveframe and child loops which have no non-null values.
-        show_comments will show the standard comments before a saveframe."""
+        show_comments will show the standard comments before a saveframe.
+        compact will separate the values with single spaces rather than aligning them in columns. This is faster,
+          and intended for output that will be read by programs rather than people."""
 
         return self.__str__(skip_empty_loops=skip_empty_loops, show_comments=show_comments,
-                            skip_empty_tags=skip_empty_tags)
+                            skip_empty_tags=skip_empty_tags, compact=compact)
 
     def get_json(self, serialize: bool = True) -> Union[dict, str]:
         """ Returns the saveframe in JSON format. If serialize is set to
@@ -743,6 +820,17 @@ class Saveframe(object):
 
         return iter(self.loops)
 
+    def mark_dirty(self) -> None:
+        """ Notifies the saveframe that its tags, or the tags or data of
+        one of its loops, were modified directly rather than through the
+        Saveframe and Loop methods, so that any cached values (such as the
+        digest() and the formatted text) are recomputed the next time they
+        are needed."""
+
+        self._clear_cache()
+        for each_loop in self.loops:
+            each_loop.mark_dirty()
+
     def print_tree(self) -> None:
         """Prints a summary, tree style, of the loops in the saveframe."""
 
@@ -766,13 +854,15 @@ class Saveframe(object):
             return schema.tag_key(self.tag_prefix + "." + x[0])
 
         self.tags.sort(key=sort_key)
+        self._clear_cache()
 
     def tag_iterator(self) -> Iterable[list]:
         """Returns an iterator for saveframe tags."""
 
         return iter(self.tags)
 
-    def validate(self, validate_schema: bool = True, schema: Schema = None, validate_star: bool = True):
+    def validate(self, validate_schema: bool = True, schema: Schema = None, validate_star: bool = True,
+                 max_errors: Optional[int] = None):
         """Validate a saveframe in a variety of ways. Returns a list of
         errors found. 0-length list indicates no errors found. By
         default all validation modes are enabled.
@@ -781,7 +871,13 @@ class Saveframe(object):
         the NMR-STAR schema. You can pass your own custom schema if desired,
         otherwise the schema will be fetched from the BMRB servers.
 
-        validate_star - Determines if the STAR syntax checks are ran."""
+        validate_star - Determines if the STAR syntax checks are ran.
+
+        max_errors - Stop validating once this many errors have been found,
+        and return only the first max_errors errors."""
+
+        if max_errors is not None and max_errors < 1:
+            raise ValueError("max_errors must be at least 1.")
 
         errors = []
 
@@ -802,31 +898,42 @@ class Saveframe(object):
 
         # Check the loops for errors
         for each_loop in self.loops:
+            if max_errors is not None and len(errors) >= max_errors:
+                return errors[:max_errors]
             errors.extend(each_loop.validate(validate_schema=validate_schema, schema=schema,
-                                             validate_star=validate_star, category=my_category))
+                                             validate_star=validate_star, category=my_category,
+                                             max_errors=max_errors - len(errors) if max_errors is not None else None))
 
-        return errors
+        return errors if max_errors is None else errors[:max_errors]
 
-    def write_to_file(self, file_name: str, format_: str = "nmrstar", show_comments: bool = True,
-                      skip_empty_loops: bool = True, skip_empty_tags: bool = False):
+    def write_to_file(self, file_name: Union[str, IO], format_: str = "nmrstar", show_comments: bool = True,
+                      skip_empty_loops: bool = True, skip_empty_tags: bool = False, compress: bool = False,
+                      atomic: bool = False, compact: bool = False):
         """ Writes the saveframe to the specified file in NMR-STAR format.
 
+        The output is streamed to the file loop by loop, so the full text
+        of the saveframe is never held in memory. file_name can also be a
+        (text or binary) file object to write to.
+
         Optionally specify:
         show_comments=False to disable the comments that are by default inserted. Ignored when writing json.
         skip_empty_loops=False to force printing loops with no tags at all (loops with null tags are still printed)
         skip_empty_tags=True will omit tags in the saveframes and loops which have no non-null values.
-        format_=json to write to the file in JSON format."""
+        format_=json to write to the file in JSON format.
+        compress=True to write the file gzip compressed.
+        atomic=True to write to a temporary file which then replaces file_name, so that the file is never left
+          partially written.
+        compact=True to separate the values with single spaces rather than aligning them in columns. Ignored when
+          writing json."""
 
         if format_ not in ["nmrstar", "json"]:
             raise ValueError("Invalid output format.")
 
-        data_to_write = ''
         if format_ == "nmrstar":
-            data_to_write = self.format(show_comments=show_comments, skip_empty_loops=skip_empty_loops,
-                                        skip_empty_tags=skip_empty_tags)
-        elif format_ == "json":
-            data_to_write = self.get_json()
-
-        out_file = open(file_name, "w")
-        out_file.write(data_to_write)
-        out_file.close()
+            chunks = self._format_chunks(show_comments=show_comments, skip_empty_loops=skip_empty_loops,
+                                         skip_empty_tags=skip_empty_tags, stream=True, compact=compact)
+        else:
+            chunks = json.JSONEncoder(default=_json_serialize).iterencode(self.get_json(serialize=False))
+
+        _write_file(file_name, chunks, compress=compress, atomic=atomic,
+                    hook_info={'saveframe': self.name, 'format': format_})
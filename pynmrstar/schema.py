@@ -5,11 +5,14 @@ import re
 from csv import reader as csv_reader
 from datetime import date
 from io import StringIO
+from time import perf_counter
 from typing import Union, List, Optional, Any, Dict, IO
 
-from pynmrstar import definitions, utils
+from pynmrstar import definitions, profiling, utils
 from pynmrstar._internal import _interpret_file
 
+logger = logging.getLogger(__name__)
+
 
 class Schema(object):
     """A BMRB schema. Used to validate STAR files."""
@@ -18,7 +21,14 @@ class Schema(object):
         """Initialize a BMRB schema. With no arguments the most
         up-to-date schema will be fetched from the BMRB FTP site.
         Otherwise pass a URL or a file to load a schema from using the
-        schema_file keyword argument."""
+        schema_file keyword argument.
+
+        The schema shipped with the library is loaded from a precompiled
+        copy, which is created the first time it is parsed and recreated
+        whenever the CSV files change. If the parse cache was enabled
+        using pynmrstar.enable_cache() and the schema is loaded from a
+        local file which was loaded before, the cached schema is used
+        instead of parsing the file again."""
 
         self.headers: List[str] = []
         self.schema: Dict[str, Dict[str, str]] = {}
@@ -32,6 +42,15 @@ class Schema(object):
             schema_file = definitions.SCHEMA_URL
         self.schema_file = schema_file
 
+        from pynmrstar._cache import _load_schema, _store_schema
+
+        cached_schema = _load_schema(schema_file)
+        if cached_schema is not None:
+            self.__dict__.update(cached_schema)
+            self.schema_file = schema_file
+            self._build_lookups()
+            return
+
         # Get whatever schema they specified, wrap in StringIO and pass that to the csv reader
         schema_stream = _interpret_file(schema_file)
         fix_newlines = StringIO('\n'.join(schema_stream.read().splitlines()))
@@ -90,6 +109,9 @@ class Schema(object):
         for item in csv_reader_instance:
             self.data_types[item[0]] = "^" + item[1] + "$"
 
+        _store_schema(schema_file, self.__dict__)
+        self._build_lookups()
+
     def __repr__(self) -> str:
         """Return how we can be initialized."""
 
@@ -100,6 +122,37 @@ class Schema(object):
 
         return self.string_representation()
 
+    def invalidate_caches(self) -> None:
+        """ Rebuilds the lookup tables the schema keeps to speed up
+        normalizing and validating. Call this after modifying schema_order
+        or category_order directly. (Changes to the tag definitions in
+        schema and to data_types are noticed without it.) add_tag() calls
+        this itself. """
+
+        self._build_lookups()
+
+    def _build_lookups(self) -> None:
+        """ Builds the dictionaries of the positions of the tags in
+        schema_order and of the categories in category_order, so that
+        they can be looked up without searching the lists, and empties
+        the cache of validation plans. """
+
+        # Iterate backwards so that the first position of a (repeated) item is kept, the same as list.index()
+        self._tag_positions: Dict[str, int] = {tag: pos for pos, tag in reversed(list(enumerate(self.schema_order)))}
+        self._category_positions: Dict[str, int] = {category: pos for pos, category in
+                                                    reversed(list(enumerate(self.category_order)))}
+        self._validation_plans: Dict[str, _ValidationPlan] = {}
+
+    def _validation_plan(self, tag: str) -> '_ValidationPlan':
+        """ Returns the compiled checks of the tag, compiling them the first
+        time they are needed and again whenever the definition of the tag
+        or its data type has been changed. """
+
+        plan = self._validation_plans.get(tag)
+        if plan is None or not plan.is_current(self):
+            plan = self._validation_plans[tag] = _ValidationPlan(self, tag)
+        return plan
+
     def add_tag(self, tag: str, tag_type: str, null_allowed: bool, sf_category: str, loop_flag: bool,
                 after: str = None):
         """ Adds the specified tag to the tag dictionary. You must provide:
@@ -166,26 +219,26 @@ class Schema(object):
         # Conditionally check the tag to insert after
         new_tag_pos = len(self.schema_order)
         if after is not None:
-            try:
-                # See if the tag with caps exists in the order
-                new_tag_pos = self.schema_order.index(after) + 1
-            except ValueError:
-                try:
-                    # See if the tag in lowercase exists in the order
-                    new_tag_pos = [x.lower() for x in
-                                   self.schema_order].index(after.lower()) + 1
-                except ValueError:
+            # See if the tag with caps exists in the order
+            after_pos = self._tag_positions.get(after)
+            if after_pos is None:
+                # See if the tag in lowercase exists in the order
+                after = after.lower()
+                after_pos = next((pos for pos, x in enumerate(self.schema_order) if x.lower() == after), None)
+                if after_pos is None:
                     raise ValueError("The tag you specified to insert this tag after does not exist in the schema.")
+            new_tag_pos = after_pos + 1
         else:
             # Determine a sensible place to put the new tag
             search = utils.format_category(tag.lower())
-            for pos, stag in enumerate([x.lower() for x in self.schema_order]):
-                if stag.startswith(search):
+            for pos, stag in enumerate(self.schema_order):
+                if stag.lower().startswith(search):
                     new_tag_pos = pos + 1
 
         # Add the new tag to the tag order and tag list
         self.schema_order.insert(new_tag_pos, tag)
         self.category_order.insert(new_tag_pos, "_" + utils.format_tag(tag))
+        self.invalidate_caches()
 
         # Calculate up the 'Dictionary Sequence' based on the tag position
         new_tag_pos = (new_tag_pos - 1) * 10
@@ -203,6 +256,7 @@ class Schema(object):
                                     "SFCategory": sf_category, "Tag": tag,
                                     "Dictionary sequence": new_tag_pos}
 
+    @profiling._timed('convert')
     def convert_tag(self, tag: str, value: Any, line_num: int = None) -> \
             Optional[Union[str, int, decimal.Decimal, date]]:
         """ Converts the provided tag from string to the appropriate
@@ -210,7 +264,7 @@ class Schema(object):
 
         # If we don't know what the tag is, just return it
         if tag.lower() not in self.schema:
-            logging.warning("Couldn't convert tag data type because it is not in the dictionary: " + tag)
+            logger.warning("Couldn't convert tag data type because it is not in the dictionary: " + tag)
             return value
 
         full_tag = self.schema[tag.lower()]
@@ -300,12 +354,67 @@ class Schema(object):
 
         return text
 
+    @profiling._timed('validate')
     def val_type(self, tag: str, value: Any, category: str = None, line_number: Union[int, str] = None):
         """ Validates that a tag matches the type it should have
         according to this schema."""
 
-        if tag.lower() not in self.schema:
-            return ["Tag '%s' not found in schema. Line '%s'." % (tag, line_number)]
+        return self._validation_plan(tag).errors(value, category, line_number)
+
+    def tag_key(self, x) -> int:
+        """ Helper function to figure out how to sort the tags."""
+
+        position = self._tag_positions.get(x)
+        if position is None:
+            # Generate an arbitrary sort order for tags that aren't in the
+            #  schema but make sure that they always come after tags in the
+            #   schema
+            return len(self.schema_order) + abs(hash(x))
+        return position
+
+
+class _ValidationPlan(object):
+    """ The checks Schema.val_type() does for one tag, compiled once (with
+    the regular expression and length limit of the data type) so that
+    they can be applied to many values quickly. """
+
+    def __init__(self, schema: Schema, tag: str) -> None:
+        self.tag: str = tag
+        self.lower_tag: str = tag.lower()
+        self.known: bool = self.lower_tag in schema.schema
+        if not self.known:
+            return
+
+        # Make local copies of the fields we care about
+        full_tag = schema.schema[self.lower_tag]
+        self.bmrb_type: str = full_tag["BMRB data type"]
+        self.val_type: str = full_tag["Data Type"]
+        self.null_allowed: bool = full_tag["Nullable"]
+        self.allowed_category: str = full_tag["SFCategory"]
+        self.capitalized_tag: str = full_tag["Tag"]
+
+        self.length: Optional[int] = None
+        if "CHAR" in self.val_type:
+            self.length = int(self.val_type[self.val_type.index("(") + 1:self.val_type.index(")")])
+        self.expression: Optional[str] = schema.data_types.get(self.bmrb_type)
+        self.regex: Optional['re.Pattern'] = re.compile(self.expression) if self.expression is not None else None
+
+    def is_current(self, schema: Schema) -> bool:
+        """ Returns whether the plan still matches the definition of the
+        tag and the regular expression of its data type in the schema. """
+
+        full_tag = schema.schema.get(self.lower_tag)
+        if full_tag is None or not self.known:
+            return full_tag is None and not self.known
+        return full_tag["BMRB data type"] == self.bmrb_type and full_tag["Data Type"] == self.val_type and \
+            full_tag["Nullable"] == self.null_allowed and full_tag["SFCategory"] == self.allowed_category and \
+            full_tag["Tag"] == self.capitalized_tag and schema.data_types.get(self.bmrb_type) == self.expression
+
+    def errors(self, value: Any, category: Optional[str], line_number: Union[int, str, None]) -> List[str]:
+        """ Validates one value. See Schema.val_type(). """
+
+        if not self.known:
+            return ["Tag '%s' not found in schema. Line '%s'." % (self.tag, line_number)]
 
         # We will skip type checks for None's
         is_none = value is None
@@ -323,50 +432,70 @@ class Schema(object):
         if value in definitions.NULL_VALUES:
             is_none = True
 
-        # Make local copies of the fields we care about
-        full_tag = self.schema[tag.lower()]
-        bmrb_type = full_tag["BMRB data type"]
-        val_type = full_tag["Data Type"]
-        null_allowed = full_tag["Nullable"]
-        allowed_category = full_tag["SFCategory"]
-        capitalized_tag = full_tag["Tag"]
-
         if category is not None:
-            if category != allowed_category:
+            if category != self.allowed_category:
                 return ["The tag '%s' in category '%s' should be in category "
-                        "'%s'." % (capitalized_tag, category, allowed_category)]
+                        "'%s'." % (self.capitalized_tag, category, self.allowed_category)]
 
         if is_none:
-            if not null_allowed:
-                return ["Value cannot be NULL but is: '%s':'%s' on line '%s'." % (capitalized_tag, value, line_number)]
+            if not self.null_allowed:
+                return ["Value cannot be NULL but is: '%s':'%s' on line '%s'." % (self.capitalized_tag, value,
+                                                                                   line_number)]
             return []
         else:
             # Don't run these checks on unassigned tags
-            if "CHAR" in val_type:
-                length = int(val_type[val_type.index("(") + 1:val_type.index(")")])
-                if len(str(value)) > length:
-                    return ["Length of '%d' is too long for %s: '%s':'%s' on line '%s'." %
-                            (len(value), val_type, capitalized_tag, value, line_number)]
+            if self.length is not None and len(value) > self.length:
+                return ["Length of '%d' is too long for %s: '%s':'%s' on line '%s'." %
+                        (len(value), self.val_type, self.capitalized_tag, value, line_number)]
 
             # Check that the value matches the regular expression for the type
-            if not re.match(self.data_types[bmrb_type], str(value)):
+            if self.regex is None:
+                raise KeyError(self.bmrb_type)
+            if not self.regex.match(value):
                 return ["Value does not match specification: '%s':'%s' on line '%s'.\n     Type specified: %s\n     "
-                        "Regular expression for type: '%s'" % (capitalized_tag, value, line_number, bmrb_type,
-                                                               self.data_types[bmrb_type])]
+                        "Regular expression for type: '%s'" % (self.capitalized_tag, value, line_number, self.bmrb_type,
+                                                               self.expression)]
 
         # Check the tag capitalization
-        if tag != capitalized_tag:
+        if self.tag != self.capitalized_tag:
             return ["The tag '%s' is improperly capitalized but otherwise valid. Should be '%s'." %
-                    (tag, capitalized_tag)]
+                    (self.tag, self.capitalized_tag)]
         return []
 
-    def tag_key(self, x) -> int:
-        """ Helper function to figure out how to sort the tags."""
+    def failures(self, values: List[Any], category: Optional[str]) -> List[int]:
+        """ Returns the positions of the values for which errors() would
+        return errors, without building the error messages. """
 
-        try:
-            return self.schema_order.index(x)
-        except ValueError:
-            # Generate an arbitrary sort order for tags that aren't in the
-            #  schema but make sure that they always come after tags in the
-            #   schema
-            return len(self.schema_order) + abs(hash(x))
+        profile = profiling.active()
+        start = perf_counter() if profile is not None else 0
+
+        if not self.known or (category is not None and category != self.allowed_category):
+            failed = list(range(len(values)))
+        else:
+            conversion = definitions.STR_CONVERSION_DICT
+            conversion_types = tuple(set([type(x) for x in conversion]))
+            null_values = definitions.NULL_VALUES
+            null_allowed = self.null_allowed
+            # Every value that is not null fails if the tag is improperly capitalized
+            miscapitalized = self.tag != self.capitalized_tag
+            length = self.length
+            match = self.regex.match if self.regex is not None else None
+
+            failed = []
+            for pos, value in enumerate(values):
+                is_none = value is None
+                if value in conversion and isinstance(value, conversion_types):
+                    value = conversion[value]
+                if not isinstance(value, str):
+                    value = str(value)
+
+                if is_none or value in null_values:
+                    if not null_allowed:
+                        failed.append(pos)
+                elif miscapitalized or (length is not None and len(value) > length) or match is None or \
+                        not match(value):
+                    failed.append(pos)
+
+        if profile is not None:
+            profile.add('validate', perf_counter() - start, len(values))
+        return failed
@@ -0,0 +1,274 @@
+""" Generates synthetic entries of any size, for reproducing scaling
+problems without needing real data. The entries are built from the
+saveframe templates of the schema, and the values are generated to match
+the data type of each tag, so the entries pass validation:
+
+    >>> from pynmrstar import testing
+    >>> entry = testing.generate_entry(n_saveframes=20, loop_rows=10000, seed=1)
+    >>> entry.validate()
+    []
+
+To create very large files, use write_entry(), which writes the entry to
+the file as it is generated rather than building it in memory:
+
+    >>> testing.write_entry('large.str', n_saveframes=100, loop_rows=1000000, seed=1)
+
+The same arguments (including the seed) produce the same entry, whichever
+of the two functions is used. """
+
+import random
+from datetime import date, timedelta
+from itertools import chain, islice
+from typing import Callable, Iterator, List, Optional, Tuple, Union, IO
+
+from pynmrstar import entry as entry_mod, loop as loop_mod, saveframe as saveframe_mod, utils
+from pynmrstar._internal import _write_file
+from pynmrstar.schema import Schema
+
+# The values to choose from, depending on the data type of the tag
+_WORDS: List[str] = ['protein', 'solution', 'sample', 'uniform', 'natural', 'abundance', 'H2O', 'D2O', '13C', '15N',
+                     'mM', 'ppm', 'pH', 'K', 'Bruker', 'Varian', 'Avance', 'cryoprobe', 'HSQC', 'HNCA', 'HNCO',
+                     'NOESY', 'TOCSY', 'polymer', 'monomer', 'assigned', 'chemical', 'shifts', 'structure']
+_RESIDUES: List[str] = ['ALA', 'ARG', 'ASN', 'ASP', 'CYS', 'GLN', 'GLU', 'GLY', 'HIS', 'ILE', 'LEU', 'LYS', 'MET',
+                        'PHE', 'PRO', 'SER', 'THR', 'TRP', 'TYR', 'VAL']
+_ATOMS: List[str] = ['H', 'HA', 'HB2', 'HB3', 'C', 'CA', 'CB', 'N', 'O', "O5'", "C1'", "H2''", 'HD1', 'CG']
+_PHRASES: List[str] = ["5' end", '"quoted" name', "it's", 'first; second', 'data_block', 'loop_ stop_',
+                       '# not a comment']
+
+
+class _EntryGenerator(object):
+    """ Generates the saveframes and loop rows of a synthetic entry. The
+    saveframes are generated one at a time, and the loop rows as they are
+    iterated over, so that nothing but the current saveframe needs to be
+    held in memory. """
+
+    def __init__(self, n_saveframes: int, loop_rows: int, entry_id: Union[str, int], categories: Optional[List[str]],
+                 seed: Optional[int], null_fraction: float, multiline_fraction: float,
+                 schema: Optional[Schema]) -> None:
+
+        if n_saveframes < 1:
+            raise ValueError("n_saveframes must be at least 1.")
+        if loop_rows < 0:
+            raise ValueError("loop_rows can not be negative.")
+        if not 0 <= null_fraction <= 1 or not 0 <= multiline_fraction <= 1:
+            raise ValueError("null_fraction and multiline_fraction must be between 0 and 1.")
+
+        self.schema = utils.get_schema(schema)
+        schema_categories = []
+        for tag in self.schema.schema_order:
+            category = self.schema.schema[tag.lower()]['SFCategory']
+            if category not in schema_categories:
+                schema_categories.append(category)
+        if categories is None:
+            categories = schema_categories
+        for category in categories:
+            if category not in schema_categories:
+                raise ValueError("The saveframe category '%s' was not found in the dictionary." % category)
+        if not categories:
+            raise ValueError("At least one saveframe category must be provided.")
+
+        self.n_saveframes = n_saveframes
+        self.loop_rows = loop_rows
+        self.entry_id = entry_id
+        self.categories = categories
+        self.null_fraction = null_fraction
+        self.multiline_fraction = multiline_fraction
+        self.random = random.Random(seed)
+        self.names: List[str] = []
+
+    def saveframes(self) -> Iterator[Tuple['saveframe_mod.Saveframe', int]]:
+        """ Yields the saveframes, with their tag values set and their loops
+        empty, along with the ID of each saveframe within its category. """
+
+        counts = {}
+        for position in range(self.n_saveframes):
+            category = self.categories[position % len(self.categories)]
+            counts[category] = counts.get(category, 0) + 1
+            name = "%s_%d" % (category, counts[category])
+            self.names.append(name)
+
+            saveframe = saveframe_mod.Saveframe.from_template(category, name, entry_id=self.entry_id,
+                                                              schema=self.schema)
+            saveframe.source = "generate_entry()"
+            for tag in saveframe.tags:
+                if tag[1] is None:
+                    tag[1] = self._value_generator(saveframe.tag_prefix + "." + tag[0], counts[category])(1)
+            yield saveframe, counts[category]
+
+    def rows(self, loop: 'loop_mod.Loop', saveframe_id: int) -> Iterator[List[str]]:
+        """ Yields the rows of the loop. """
+
+        generators = [self._value_generator(loop.category + "." + tag, saveframe_id) for tag in loop.tags]
+        for row in range(1, self.loop_rows + 1):
+            yield [generator(row) for generator in generators]
+
+    def _value_generator(self, tag: str, saveframe_id: int) -> Callable[[int], str]:
+        """ Returns a function that generates a value for the tag, given the
+        row number. """
+
+        tag_schema = self.schema.schema[tag.lower()]
+        if tag_schema['entryIdFlg'] == 'Y':
+            entry_id = str(self.entry_id)
+            return lambda row: entry_id
+        if tag_schema['Row Index Key'] == 'Y' or (tag_schema['Loopflag'] == 'Y' and utils.format_tag(tag) == 'ID'):
+            return str
+        if tag_schema['lclSfIdFlg'] == 'Y':
+            saveframe_id = str(saveframe_id)
+            return lambda row: saveframe_id
+
+        rand = self.random
+        max_length = None
+        if "CHAR" in tag_schema['Data Type']:
+            data_type = tag_schema['Data Type']
+            max_length = int(data_type[data_type.index("(") + 1:data_type.index(")")])
+        value_function = self._type_function(tag_schema['BMRB data type'])
+        null_fraction = self.null_fraction if tag_schema['Nullable'] else 0
+
+        def generate(row: int) -> str:
+            if null_fraction and rand.random() < null_fraction:
+                return '.'
+            value = value_function()
+            if max_length is not None and len(value) > max_length:
+                value = value[:max_length].strip()
+            return value
+        return generate
+
+    def _type_function(self, bmrb_type: str) -> Callable[[], str]:
+        """ Returns a function that generates a value of the BMRB data
+        type. """
+
+        rand = self.random
+        if bmrb_type == 'int':
+            return lambda: str(int(rand.expovariate(0.01)) + 1)
+        if bmrb_type == 'float':
+            return lambda: "%.3f" % rand.gauss(50, 40)
+        if bmrb_type == 'yes_no':
+            return lambda: rand.choice(('yes', 'no'))
+        if bmrb_type == 'yyyy-mm-dd':
+            return lambda: (date(1990, 1, 1) + timedelta(days=rand.randrange(12000))).isoformat()
+        if bmrb_type == 'framecode':
+            # Point to a saveframe that already exists, so that there are no dangling references
+            return lambda: "$" + rand.choice(self.names)
+        if bmrb_type == 'atcode':
+            return lambda: rand.choice(_ATOMS)
+        if bmrb_type == 'uchar1':
+            return lambda: rand.choice(_RESIDUES)[0]
+        if bmrb_type == 'uchar3':
+            return lambda: rand.choice(_RESIDUES)
+        if bmrb_type == 'email':
+            return lambda: "user%d@example.com" % rand.randrange(1000)
+        if bmrb_type in ('phone', 'fax'):
+            return lambda: "+1-555-%04d" % rand.randrange(10000)
+        if bmrb_type in ('line', 'uline'):
+            return self._line
+        if bmrb_type == 'text':
+            return self._text
+        return lambda: rand.choice(_RESIDUES) if rand.random() < 0.5 else rand.choice(_WORDS)
+
+    def _line(self) -> str:
+        rand = self.random.random
+        if rand() < 0.1:
+            return _PHRASES[int(rand() * len(_PHRASES))]
+        return " ".join([_WORDS[int(rand() * len(_WORDS))] for _ in range(int(rand() * 4) + 1)])
+
+    def _text(self) -> str:
+        if self.random.random() < self.multiline_fraction:
+            return "\n".join([self._line() for _ in range(self.random.randint(2, 5))]) + "\n"
+        return self._line()
+
+
+def _loop_chunks(loop: 'loop_mod.Loop', rows: Iterator[List[str]], compact: bool) -> Iterator[str]:
+    """ Yields the loop in STAR format, with the rows taken from the
+    iterator in groups of STREAM_ROWS rows. The rows are aligned within
+    each group. """
+
+    if compact:
+        yield "loop_\n%s" % "".join(["%s.%s\n" % (loop.category, tag) for tag in loop.tags])
+    else:
+        yield "\n   loop_\n%s\n" % "".join(["      %s.%s\n" % (loop.category, tag) for tag in loop.tags])
+
+    format_string = "     " + "%-*s" * len(loop.tags) + " \n"
+    first_row = 0
+    rows_chunk = list(islice(rows, loop_mod.STREAM_ROWS))
+    while rows_chunk:
+        # Quoting all of the values at once is much faster than quoting row by row
+        try:
+            values = utils.quote_values(list(chain.from_iterable(rows_chunk)))
+            quoted = [values[pos:pos + len(loop.tags)] for pos in range(0, len(values), len(loop.tags))]
+        except ValueError:
+            quoted = [loop._quote_row(row_pos, row) for row_pos, row in enumerate(rows_chunk, first_row)]
+        if compact:
+            yield "".join([loop._format_compact_row(row) for row in quoted])
+        else:
+            title_widths = [max([len(x) + 3 for x in column]) for column in zip(*quoted)]
+            yield "".join([loop._format_row(format_string, title_widths, row) for row in quoted])
+        first_row += len(rows_chunk)
+        rows_chunk = list(islice(rows, loop_mod.STREAM_ROWS))
+
+    yield "stop_\n" if compact else "\n   stop_\n"
+
+
+def generate_entry(n_saveframes: int = 10, loop_rows: int = 100, entry_id: Union[str, int] = 'generated',
+                   categories: List[str] = None, seed: int = None, null_fraction: float = 0.1,
+                   multiline_fraction: float = 0.2, schema: Schema = None) -> 'entry_mod.Entry':
+    """ Returns a synthetic entry with n_saveframes saveframes, each of
+    which has the mandatory tags and loops of its category, with loop_rows
+    rows in each loop.
+
+    The saveframes are created from the schema templates of the categories
+    (by default all of the categories of the schema, in schema order),
+    repeating the categories as needed. The values match the data types of
+    the schema, and include quoted values and (in text tags) multi-line
+    values. Optionally specify:
+
+    seed - to generate the same entry every time
+    null_fraction - the fraction of the values of nullable tags that are null
+    multiline_fraction - the fraction of the values of text tags that span several lines
+    schema - to use a different schema than the default schema"""
+
+    generator = _EntryGenerator(n_saveframes, loop_rows, entry_id, categories, seed, null_fraction,
+                                multiline_fraction, schema)
+    entry = entry_mod.Entry.from_scratch(entry_id)
+    for saveframe, saveframe_id in generator.saveframes():
+        for loop in saveframe.loops:
+            loop.data = list(generator.rows(loop, saveframe_id))
+        entry.add_saveframe(saveframe)
+    entry.source = "generate_entry()"
+    return entry
+
+
+def write_entry(file_name: Union[str, IO], n_saveframes: int = 10, loop_rows: int = 100,
+                entry_id: Union[str, int] = 'generated', categories: List[str] = None, seed: int = None,
+                null_fraction: float = 0.1, multiline_fraction: float = 0.2, schema: Schema = None,
+                compress: bool = False, compact: bool = False) -> None:
+    """ Writes the entry generate_entry() would return for the same
+    arguments to the file, as it is generated. Only one saveframe and
+    STREAM_ROWS loop rows are held in memory at a time, so there is no
+    limit on the size of the file. The loop rows are aligned in groups of
+    STREAM_ROWS rows, so for loops that are longer than that the file
+    differs from what Entry.write_to_file() would write in whitespace.
+
+    compress=True writes the file gzip compressed, and compact=True
+    separates the values with single spaces rather than aligning them. """
+
+    generator = _EntryGenerator(n_saveframes, loop_rows, entry_id, categories, seed, null_fraction,
+                                multiline_fraction, schema)
+
+    def chunks() -> Iterator[str]:
+        yield "data_%s\n" % entry_id if compact else "data_%s\n\n" % entry_id
+
+        seen_categories = set()
+        for position, (saveframe, saveframe_id) in enumerate(generator.saveframes()):
+            if position > 0 and not compact:
+                yield "\n"
+            yield saveframe._format_tags(show_comments=saveframe.category not in seen_categories, compact=compact)
+            seen_categories.add(saveframe.category)
+            for loop in saveframe.loops:
+                if loop.tags and loop_rows > 0:
+                    yield from _loop_chunks(loop, generator.rows(loop, saveframe_id), compact)
+            yield "save_\n" if compact else "\nsave_\n"
+
+    _write_file(file_name, chunks(), compress=compress)
+
+
+__all__ = ['generate_entry', 'write_entry']
@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 
+import asyncio
+import gzip
 import json
 import logging
 import os
 import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import zlib
 from copy import deepcopy as copy
+from io import StringIO, BytesIO
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
 
-from pynmrstar import utils, definitions, Saveframe, Entry, Schema, Loop, _Parser
+import pynmrstar
+from pynmrstar import utils, definitions, Saveframe, Entry, Schema, Loop, _Parser, benchmarks
+from pynmrstar import _cache
 from pynmrstar._internal import _interpret_file
-from pynmrstar.exceptions import ParsingError
+from pynmrstar.exceptions import ParsingError, FormattingError
 
 try:
     import pynmrstar.cnmrstar as cnmrstar
@@ -27,6 +41,70 @@ sample_file_location = os.path.join(our_path, "sample_files", "bmr15000_3.str")
 file_entry = Entry.from_file(sample_file_location)
 
 
+class _APIHandler(BaseHTTPRequestHandler):
+    """ A local stand-in for the BMRB API which serves the sample entry. """
+
+    protocol_version = 'HTTP/1.1'
+    served_json = zlib.compress(file_entry.get_json().encode())
+    with open(sample_file_location, 'rb') as sample_file:
+        served_file = sample_file.read()
+
+    def do_GET(self):
+        entry_id = self.path.split('/')[-1].split('?')[0]
+        self.server.requests.append(entry_id)
+        if entry_id == 'missing':
+            self.send_response(404)
+            body = b''
+        elif entry_id == 'forbidden':
+            self.send_response(403)
+            body = b''
+        elif entry_id == 'moved':
+            self.send_response(301)
+            self.send_header('Location', self.path.replace('moved', '15000'))
+            body = b''
+        elif entry_id == 'apierror':
+            self.send_response(200)
+            body = zlib.compress(json.dumps({'error': 'Something went wrong.'}).encode())
+        elif self.server.failures.get(entry_id):
+            self.server.failures[entry_id] -= 1
+            self.send_response(500)
+            body = b''
+        elif self.path.endswith('.str'):
+            self.send_response(200)
+            body = self.served_file
+        else:
+            self.send_response(200)
+            body = self.served_json
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _APIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _start_api_server(failures: dict = None) -> _APIServer:
+    """ Starts the local API stand-in on a free port in the background. """
+
+    server = _APIServer(('127.0.0.1', 0), _APIHandler)
+    server.failures = failures if failures is not None else {}
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _saveframe_categories(entry: Entry) -> list:
+    """ Used by test_corpus, at the top level so the worker processes can use it. """
+
+    if entry.entry_id == '2':
+        raise ValueError('Entry 2 is not allowed.')
+    return [saveframe.category for saveframe in entry]
+
+
 class TestPyNMRSTAR(unittest.TestCase):
 
     def setUp(self):
@@ -50,6 +128,25 @@ class TestPyNMRSTAR(unittest.TestCase):
         self.assertEqual(utils.quote_value("loop_"), "noloop_")
         definitions.STR_CONVERSION_DICT = {None: "."}
 
+    def test_quote_values(self):
+        values = ["single quote test", "double quote' test", "loop_", "#comment", "_tag", "simple", "  ", "\nnewline\n",
+                  None, 1, 2.5, "both ' \" quotes", "both 'quotes\"", "a\n;b", "ünïcödé"]
+        self.assertEqual(utils.quote_values(values), [utils.quote_value(x) for x in values])
+        self.assertEqual(utils.quote_values(iter(values)), [utils.quote_value(x) for x in values])
+        self.assertEqual(utils.quote_values([]), [])
+        self.assertRaises(ValueError, utils.quote_values, ["fine", ""])
+
+        definitions.STR_CONVERSION_DICT = {"loop_": "noloop_", True: "yes"}
+        try:
+            self.assertEqual(utils.quote_values(["loop_", True, 1]), ["noloop_", "yes", "1"])
+        finally:
+            definitions.STR_CONVERSION_DICT = {None: "."}
+
+        if cnmrstar is not None and hasattr(cnmrstar, 'clean_values'):
+            self.assertEqual(cnmrstar.clean_values(values, definitions.STR_CONVERSION_DICT),
+                             [cnmrstar.clean_value(utils.quote_value(x) if x is None else str(x)) for x in values])
+            self.assertRaises(ValueError, cnmrstar.clean_values, ["fine", ""], definitions.STR_CONVERSION_DICT)
+
     def test__odd_strings(self):
         """ Make sure the library can handle odd strings. """
 
@@ -195,6 +292,774 @@ class TestPyNMRSTAR(unittest.TestCase):
         self.assertEqual(str(Entry.from_scratch(15000)), "data_15000\n\n")
         self.assertEqual(Entry.from_file(os.path.join(our_path, "sample_files", "bmr15000_3.str.gz")), self.file_entry)
 
+    def test_from_database_many(self):
+        ftp_url = definitions.FTP_URL
+        failures = {'flaky': 1}
+        server = _start_api_server(failures)
+        api_url = 'http://127.0.0.1:%s/v2' % server.server_address[1]
+        try:
+            entries = list(Entry.from_database_many(['15000', 'flaky', '15000'], max_workers=1, api_url=api_url))
+            self.assertEqual(len(entries), 3)
+            for entry in entries:
+                self.assertEqual(entry, self.file_entry)
+            self.assertEqual(entries[1].source, 'from_database(flaky)')
+            # Only the server error was retried
+            self.assertEqual(server.requests, ['15000', 'flaky', 'flaky', '15000'])
+            self.assertEqual(next(Entry.from_database_many(['moved'], api_url=api_url)), self.file_entry)
+
+            converted = next(Entry.from_database_many([15000], convert_data_types=True, api_url=api_url))
+            self.assertEqual(converted[-1][-1].data[0][0], 1)
+
+            self.assertEqual(len(list(Entry.from_database_many(range(20), max_workers=4, api_url=api_url))), 20)
+            self.assertRaises(IOError, list, Entry.from_database_many(['missing'], api_url=api_url))
+            self.assertRaises(ValueError, list, Entry.from_database_many([1], api_url='ftp://example.com'))
+
+            # Like from_database(), entries are loaded from the FTP site when the API server fails or returns an error
+            definitions.FTP_URL = 'http://127.0.0.1:%s/ftp' % server.server_address[1]
+            failures['flaky'] = 2
+            with self.assertLogs('pynmrstar', level='WARNING'):
+                entries = list(Entry.from_database_many(['flaky', 'apierror'], max_workers=1, retries=1,
+                                                        api_url=api_url))
+            self.assertEqual(entries, [self.file_entry, self.file_entry])
+            self.assertEqual(entries[1].source, 'from_database(apierror)')
+
+            # Client errors other than 404 aren't retried
+            del server.requests[:]
+            with self.assertLogs('pynmrstar', level='WARNING'):
+                entry = next(Entry.from_database_many(['forbidden'], api_url=api_url))
+            self.assertEqual(entry, self.file_entry)
+            self.assertEqual(server.requests, ['forbidden', 'bmrforbidden_3.str'])
+        finally:
+            definitions.FTP_URL = ftp_url
+            server.shutdown()
+            server.server_close()
+
+    def test_async(self):
+        server = _start_api_server({'flaky': 1})
+        base_url = 'http://127.0.0.1:%s' % server.server_address[1]
+        original_api_url, original_ftp_url = definitions.API_URL, definitions.FTP_URL
+        definitions.API_URL, definitions.FTP_URL = base_url + '/v2', base_url + '/ftp'
+        loop = asyncio.new_event_loop()
+        try:
+            entry = loop.run_until_complete(Entry.from_database_async(15000))
+            self.assertEqual(entry, self.file_entry)
+            self.assertEqual(entry.source, 'from_database(15000)')
+            converted = loop.run_until_complete(Entry.from_database_async(15000, convert_data_types=True))
+            self.assertEqual(converted[-1][-1].data[0][0], 1)
+            self.assertRaises(IOError, loop.run_until_complete, Entry.from_database_async('missing'))
+            # Redirects are followed, and like from_database() the FTP site is used if the API server fails
+            self.assertEqual(loop.run_until_complete(Entry.from_database_async('moved')), self.file_entry)
+            with self.assertLogs('pynmrstar', level='WARNING'):
+                entry = loop.run_until_complete(Entry.from_database_async('flaky'))
+            self.assertEqual(entry, self.file_entry)
+
+            url = base_url + '/ftp/bmr15000_3.str'
+            entry = loop.run_until_complete(Entry.from_file_async(url))
+            self.assertEqual(entry, self.file_entry)
+            self.assertEqual(entry.source, "from_file('%s')" % url)
+            entry = loop.run_until_complete(Entry.from_file_async(sample_file_location))
+            self.assertEqual(entry.source, self.file_entry.source)
+
+            entries = loop.run_until_complete(utils.gather_entries([15000] * 10, max_concurrency=3))
+            self.assertEqual(len(entries), 10)
+            self.assertEqual(entries[9], self.file_entry)
+            self.assertRaises(IOError, loop.run_until_complete, utils.gather_entries([15000, 'missing']))
+        finally:
+            loop.close()
+            definitions.API_URL, definitions.FTP_URL = original_api_url, original_ftp_url
+            server.shutdown()
+            server.server_close()
+
+    def test_iter_entries(self):
+        mirror = tempfile.mkdtemp()
+        try:
+            for entry_id in range(1, 6):
+                os.mkdir(os.path.join(mirror, 'bmr%s' % entry_id))
+                modified = copy(self.file_entry)
+                modified.entry_id = entry_id
+                modified.write_to_file(os.path.join(mirror, 'bmr%s' % entry_id, 'bmr%s_3.str' % entry_id))
+            shutil.copy(os.path.join(our_path, "sample_files", "bmr15000_3.str.gz"), mirror)
+            with open(os.path.join(mirror, 'README'), 'w') as ignored:
+                ignored.write('Not an entry.')
+
+            sequential = list(utils.iter_entries(source=mirror))
+            self.assertEqual([x.entry_id for x in sequential], ['1', '15000', '2', '3', '4', '5'])
+            self.assertEqual(sequential[1], self.file_entry)
+            self.assertEqual(list(utils.iter_entries(source=mirror, prefetch=2)), sequential)
+            self.assertEqual(list(utils.iter_entries(source=mirror, prefetch=3, workers=2)), sequential)
+            self.assertEqual(list(utils.iter_entries(source=mirror, workers=10)), sequential)
+
+            # Stopping early must not raise
+            for _ in utils.iter_entries(source=mirror, prefetch=2):
+                break
+            self.assertRaises(ValueError, list, utils.iter_entries(source=mirror, prefetch=2, workers=0))
+            self.assertRaises(IOError, list, utils.iter_entries(source=os.path.join(mirror, 'README')))
+        finally:
+            shutil.rmtree(mirror)
+
+    def test_corpus(self):
+        mirror = tempfile.mkdtemp()
+        try:
+            for entry_id in range(1, 6):
+                modified = copy(self.file_entry)
+                modified.entry_id = entry_id
+                modified.write_to_file(os.path.join(mirror, 'bmr%s_3.str' % entry_id))
+            with open(os.path.join(mirror, 'bmr6_3.str'), 'w') as broken:
+                broken.write('data_6 save_broken')
+
+            corpus = pynmrstar.corpus.Corpus(mirror)
+            self.assertEqual(len(corpus), 6)
+            self.assertEqual(len(pynmrstar.corpus.Corpus(os.path.join(mirror, 'bmr[1-3]*.str'))), 3)
+
+            categories = [saveframe.category for saveframe in self.file_entry]
+            expected = [(os.path.join(mirror, 'bmr%s_3.str' % x), categories) for x in (1, 3, 4, 5)]
+            self.assertEqual(list(corpus.map(_saveframe_categories)), expected)
+            self.assertEqual([x[0] for x in corpus.errors], [os.path.join(mirror, 'bmr%s_3.str' % x) for x in (2, 6)])
+            self.assertIn('ValueError: Entry 2 is not allowed.', corpus.errors[0][1])
+            self.assertIn('ParsingError', corpus.errors[1][1])
+
+            self.assertEqual(list(corpus.map(_saveframe_categories, workers=2, chunksize=2)), expected)
+            self.assertEqual(len(corpus.errors), 2)
+            self.assertEqual(sorted(corpus.map(_saveframe_categories, workers=3, ordered=False,
+                                               max_tasks_per_worker=1)), expected)
+            self.assertEqual(corpus.reduce(_saveframe_categories, lambda x, y: x + y, workers=2),
+                             categories * 4)
+            self.assertEqual(corpus.reduce(len, max, 0), len(categories))
+
+            # Category filtered views
+            filtered = pynmrstar.corpus.Corpus(mirror, categories=['entry_information', 'citations'])
+            self.assertEqual(list(filtered.map(_saveframe_categories, workers=2))[0][1],
+                             ['entry_information', 'citations'])
+            self.assertEqual(len(next(iter(filtered))), 2)
+
+            self.assertRaises(ValueError, pynmrstar.corpus.Corpus([]).reduce, len, max)
+            self.assertRaises(ValueError, list, corpus.map(len, workers=0))
+        finally:
+            shutil.rmtree(mirror)
+
+    def test_tag_index(self):
+        mirror = tempfile.mkdtemp()
+        try:
+            file_names = []
+            for entry_id in range(1, 4):
+                modified = copy(self.file_entry)
+                modified.entry_id = entry_id
+                file_names.append(os.path.join(mirror, 'bmr%s_3.str' % entry_id))
+                modified.write_to_file(file_names[-1])
+
+            index = pynmrstar.corpus.TagIndex(os.path.join(mirror, 'index.sqlite'))
+            corpus = pynmrstar.corpus.Corpus(mirror)
+            self.assertEqual(index.update(corpus, workers=2), 3)
+            self.assertEqual(len(index), 3)
+            self.assertEqual(index.search('_Entity.Name', 'F5-Phe-cVHP'),
+                             [(x, str(pos + 1), 'F5-Phe-cVHP', None) for pos, x in enumerate(file_names)])
+            self.assertEqual(index.search('Comp_ID', 'PHE'),
+                             [(x, str(pos + 1), sf, loop) for pos, x in enumerate(file_names)
+                              for sf, loop in (('F5-Phe-cVHP', 'Entity_comp_index'),
+                                               ('assigned_chem_shift_list_1', 'Atom_chem_shift'))])
+            self.assertEqual(index.search('_atom_chem_shift.comp_id', 'PHE'), index.search('Comp_ID', 'PHE')[1::2])
+            self.assertEqual(index.search('Comp_ID', 'phe'), [])
+            self.assertEqual(index.search_prefix('_Entry.Submission_date', '2006-'),
+                             index.search('_Entry.Submission_date', '2006-09-07'))
+            self.assertEqual(len(index.search_prefix('_Entry.Submission_date', '2006-')), 3)
+
+            # Only modified files are reindexed
+            self.assertEqual(index.update(corpus), 0)
+            os.utime(file_names[0], (0, 0))
+            self.assertEqual(index.update(corpus), 0)
+            modified = Entry.from_file(file_names[1])
+            modified[-1][-1]['Comp_ID'] = ['MSE'] * len(modified[-1][-1])
+            modified.write_to_file(file_names[1])
+            os.utime(file_names[1], (1, 1))
+            self.assertEqual(index.update(corpus), 1)
+            self.assertEqual(index.search('Comp_ID', 'MSE'),
+                             [(file_names[1], '2', 'assigned_chem_shift_list_1', 'Atom_chem_shift')])
+
+            # Removed and broken files are dropped from the index
+            os.unlink(file_names[2])
+            with open(file_names[0], 'w') as broken:
+                broken.write('data_1 save_broken')
+            corpus = pynmrstar.corpus.Corpus(mirror)
+            self.assertEqual(index.update(corpus), 0)
+            self.assertEqual([x[0] for x in corpus.errors], [file_names[0]])
+            self.assertEqual(len(index), 1)
+
+            # Files deleted after the corpus was created are dropped from the index too
+            modified.write_to_file(file_names[2])
+            corpus = pynmrstar.corpus.Corpus(mirror)
+            self.assertEqual(index.update(corpus), 1)
+            self.assertEqual(len(index), 2)
+            os.unlink(file_names[2])
+            self.assertEqual(index.update(corpus), 0)
+            self.assertEqual(len(index), 1)
+            errors = dict(corpus.errors)
+            self.assertEqual(sorted(errors), [file_names[0], file_names[2]])
+            self.assertTrue(errors[file_names[2]].startswith('FileNotFoundError'))
+            self.assertEqual(index.search('Comp_ID', 'MSE'),
+                             [(file_names[1], '2', 'assigned_chem_shift_list_1', 'Atom_chem_shift')])
+            index.close()
+
+            # The index persists
+            index = pynmrstar.corpus.TagIndex(os.path.join(mirror, 'index.sqlite'))
+            self.assertEqual(index.search('Comp_ID', 'MSE')[0][0], file_names[1])
+            index.close()
+        finally:
+            shutil.rmtree(mirror)
+
+    def test_sqlite(self):
+        connection = sqlite3.connect(':memory:')
+        self.assertRaises(ValueError, Entry.from_sqlite, connection, 15000)
+        self.file_entry.to_sqlite(connection)
+        self.assertRaises(ValueError, Entry.from_sqlite, connection, 1)
+
+        # Values come back as the schema types, with null values as None
+        converted = Entry.from_file(sample_file_location, convert_data_types=True)
+        from_sqlite = Entry.from_sqlite(connection, 15000)
+        self.assertEqual(from_sqlite, converted)
+        self.assertEqual(from_sqlite[0]['Submission_date'], converted[0]['Submission_date'])
+        self.assertEqual(from_sqlite.source, 'from_sqlite()')
+
+        # The columns are typed, so the data can be queried
+        self.assertEqual(connection.execute("SELECT typeof(Val), typeof(Comp_ID) FROM Atom_chem_shift LIMIT 1")
+                         .fetchall(), [('real', 'text')])
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM Atom_chem_shift WHERE Atom_ID = 'CA' AND "
+                                            "Val > 50").fetchall(),
+                         [(len([x for x in self.file_entry[-1][-1].get_tag(['Atom_ID', 'Val'])
+                                if x[0] == 'CA' and float(x[1]) > 50]),)])
+        indexes = [x[0] for x in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertIn('Atom_chem_shift_Entity_ID_index', indexes)
+
+        # Storing an entry again replaces it, and other entries are kept separately
+        self.file_entry.to_sqlite(connection)
+        second = Entry.from_string(str(self.file_entry))
+        second.entry_id = 2
+        second[0]['Title'] = 'The second entry'
+        second[-1][-1].add_tag('Custom_tag')
+        for row in second[-1][-1].data:
+            row.append('custom')
+        second.to_sqlite(connection)
+        self.assertEqual(connection.execute("SELECT _entry_id, COUNT(*) FROM Atom_chem_shift GROUP BY 1").fetchall(),
+                         [('15000', len(self.file_entry[-1][-1])), ('2', len(self.file_entry[-1][-1]))])
+        self.assertEqual(Entry.from_sqlite(connection, 15000), converted)
+        self.assertEqual(Entry.from_sqlite(connection, '2')[0]['Title'], ['The second entry'])
+        self.assertEqual(Entry.from_sqlite(connection, '2')[-1][-1]['Custom_tag'][0], 'custom')
+
+        # Nothing is stored if there is an error
+        second[-1][-1].data[0].pop()
+        second[0]['Title'] = 'Not stored'
+        self.assertRaises(ValueError, second.to_sqlite, connection)
+        self.assertEqual(Entry.from_sqlite(connection, '2')[0]['Title'], ['The second entry'])
+
+    def test_benchmarks(self):
+        self.assertRaises(ValueError, benchmarks.run, benchmarks=['nonexistent'], entry=self.file_entry)
+        results = benchmarks.run(sizes=[1, 2], repeat=2, benchmarks=['format', 'loop_sort_rows', 'import'],
+                                 entry=self.file_entry)
+        self.assertEqual(sorted(results['results']), ['format[size=1]', 'format[size=2]', 'import[size=1]',
+                                                       'loop_sort_rows[size=1]', 'loop_sort_rows[size=2]'])
+        rows = sum([len(loop) for saveframe in self.file_entry for loop in saveframe.loops])
+        self.assertEqual(results['results']['format[size=2]']['rows'], rows * 2)
+        self.assertEqual(str(benchmarks.scale_entry(self.file_entry, 1)), str(self.file_entry))
+        wide = benchmarks.scale_entry(self.file_entry, 3, saveframes=True)
+        self.assertEqual(len(wide.frame_list), len(self.file_entry.frame_list) * 3)
+        self.assertEqual([x.name for x in wide.frame_list[:3]], [self.file_entry[0].name + x for x in ['', '_2', '_3']])
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as results_file:
+            benchmarks.save(results, results_file.name)
+            baseline = benchmarks.load(results_file.name)
+        self.assertEqual(baseline, results)
+        self.assertEqual(benchmarks.compare(results, baseline), [])
+
+        # Only results which are slower than the threshold allows are regressions
+        baseline['results']['format[size=1]']['min'] = results['results']['format[size=1]']['min'] / 2
+        baseline['results']['format[size=2]']['min'] = results['results']['format[size=2]']['min'] / 1.05
+        del baseline['results']['loop_sort_rows[size=1]']
+        self.assertEqual([x[0] for x in benchmarks.compare(results, baseline)], ['format[size=1]'])
+        self.assertEqual(len(benchmarks.compare(results, baseline, threshold=0.01)), 2)
+
+    def test_import(self):
+        # Importing leaves the logging configuration alone, and doesn't load the modules only some functions need
+        optional = ['asyncio', 'glob', 'hashlib', 'http.client', 'multiprocessing', 'pickle', 'sqlite3', 'subprocess',
+                    'urllib.request', 'pynmrstar._binary', 'pynmrstar._cache', 'pynmrstar._fetch', 'pynmrstar._memory',
+                    'pynmrstar._parallel', 'pynmrstar._sqlite', 'pynmrstar.benchmarks', 'pynmrstar.corpus',
+                    'pynmrstar.testing']
+        code = ("import logging, sys; import pynmrstar; "
+                "print(len(logging.root.handlers), logging.root.level, sorted(set(sys.modules) & set(%r))); "
+                "pynmrstar.corpus, pynmrstar.testing, pynmrstar.enable_cache; "
+                "print(sorted(set(sys.modules) & {'pynmrstar.corpus', 'pynmrstar.testing', 'pynmrstar._cache'}))"
+                % optional)
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(our_path)),
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        self.assertEqual(output.split('\n'), ['0 %d []' % logging.WARNING,
+                                              "['pynmrstar._cache', 'pynmrstar.corpus', 'pynmrstar.testing']", ''])
+        # The optional modules are still found by dir() and "from pynmrstar import ..."
+        self.assertIn('corpus', dir(pynmrstar))
+        from pynmrstar import disable_cache, hooks
+        self.assertIs(disable_cache, pynmrstar._cache.disable_cache)
+        self.assertIs(hooks, pynmrstar.hooks)
+        self.assertRaises(AttributeError, getattr, pynmrstar, 'not_a_module')
+
+    def test_generate_entry(self):
+        self.assertRaises(ValueError, pynmrstar.testing.generate_entry, categories=['not_a_category'])
+        self.assertRaises(ValueError, pynmrstar.testing.generate_entry, n_saveframes=0)
+
+        arguments = {'n_saveframes': 12, 'loop_rows': 30, 'entry_id': 1, 'seed': 5,
+                     'categories': ['entity', 'assigned_chemical_shifts']}
+        generated = pynmrstar.testing.generate_entry(**arguments)
+        self.assertEqual(generated.validate(), [])
+        self.assertEqual(len(generated), 12)
+        self.assertEqual(generated.get_saveframes_by_category('entity')[-1].name, 'entity_6')
+        self.assertEqual(generated.get_loops_by_category('Atom_chem_shift')[0].get_tag('ID'),
+                         [str(x) for x in range(1, 31)])
+        self.assertTrue(any("\n" in x for x in generated.get_tag('_Entity.Details')))
+        self.assertEqual(generated, pynmrstar.testing.generate_entry(**arguments))
+
+        # The streamed file has the same contents
+        with tempfile.NamedTemporaryFile(suffix='.str') as generated_file:
+            pynmrstar.testing.write_entry(generated_file.name, **arguments)
+            with open(generated_file.name) as written:
+                self.assertEqual(written.read(), generated.format())
+            pynmrstar.testing.write_entry(generated_file.name, compact=True, **arguments)
+            self.assertEqual(Entry.from_file(generated_file.name), generated)
+
+    def test_profiling(self):
+        # Load the schema and the formatting comments first, so that reading them is not counted
+        utils.get_schema()
+        str(self.file_entry)
+        self.assertIsNone(pynmrstar.profiling.active())
+        with pynmrstar.profiling.collect() as profile:
+            self.assertIs(pynmrstar.profiling.active(), profile)
+            # Nested blocks collect separately
+            with pynmrstar.profiling.collect() as inner_profile:
+                Entry.from_file(sample_file_location)
+            entry = Entry.from_file(sample_file_location, convert_data_types=True)
+            entry.validate()
+            with tempfile.TemporaryFile('w') as out_file:
+                entry.write_to_file(out_file)
+        self.assertIsNone(pynmrstar.profiling.active())
+
+        # Nothing is counted outside of the block
+        validate_calls = profile.calls['validate']
+        entry.validate()
+        self.assertEqual(profile.calls['validate'], validate_calls)
+
+        # Blocks running at the same time in different threads count separately
+        thread_profiles = {}
+
+        def parse(times):
+            with pynmrstar.profiling.collect() as thread_profile:
+                for _ in range(times):
+                    Entry.from_file(sample_file_location)
+                    self.file_entry.validate()
+            thread_profiles[times] = thread_profile
+
+        threads = [threading.Thread(target=parse, args=(times,)) for times in [1, 2, 3]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({times: x.calls['parse'] for times, x in thread_profiles.items()}, {1: 1, 2: 2, 3: 3})
+        self.assertEqual(thread_profiles[2].calls['validate'], thread_profiles[1].calls['validate'] * 2)
+
+        self.assertEqual(inner_profile.calls['parse'], 1)
+        self.assertNotIn('convert', inner_profile.calls)
+        for phase in ['read', 'parse', 'tokenize', 'convert', 'construct', 'validate', 'format', 'quote', 'write']:
+            self.assertGreater(profile.calls[phase], 0)
+            self.assertGreaterEqual(profile.seconds[phase], 0)
+        self.assertEqual(profile.calls['parse'], 1)
+        self.assertEqual(profile.calls['validate'], profile.calls['convert'])
+        self.assertEqual(profile.calls['tokenize'], inner_profile.calls['tokenize'])
+        self.assertEqual(profile.bytes_read, os.path.getsize(sample_file_location))
+        self.assertEqual(profile.bytes_parsed, profile.bytes_read)
+        self.assertEqual(set(profile.rates()), {'bytes_read_per_second', 'bytes_parsed_per_second',
+                                                'tokens_per_second'})
+        self.assertEqual(profile.as_dict()['phases']['format']['calls'], profile.calls['format'])
+        self.assertIn('tokens/s', profile.report())
+
+    def test_memory_report(self):
+        report = self.file_entry.memory_report()
+        self.assertEqual(len(report['saveframes']), len(self.file_entry))
+        self.assertEqual(len(report['loops']), sum([len(x.loops) for x in self.file_entry]))
+        self.assertEqual(report['loops'][0]['rows'], len(self.file_entry[0].loops[0]))
+        self.assertEqual(report['total']['total'], sum([x['total'] for x in report['categories'].values()]))
+        self.assertEqual(report['total']['total'], sum([report['total'][x] for x in ['row_overhead', 'strings',
+                                                                                      'converted']]))
+        self.assertEqual(report['total']['converted'], 0)
+        self.assertEqual(list(report['categories'])[0], '_Atom_chem_shift')
+        self.assertGreater(report['total']['interning_savings'], 0)
+
+        # Converted values are counted separately, and equal strings which are shared are counted once
+        converted = Entry.from_file(sample_file_location, convert_data_types=True).memory_report()
+        self.assertGreater(converted['total']['converted'], 0)
+        self.assertLess(converted['total']['strings'], report['total']['strings'])
+        loop = Loop.from_scratch('_Test')
+        loop.add_tag(['a', 'b'])
+        loop.data = [[''.join(['va', 'lue']), ''.join(['va', 'lue'])] for _ in range(10)]
+        frame = Saveframe.from_scratch('test', '_Test_frame')
+        frame.add_loop(loop)
+        entry = Entry.from_scratch(1)
+        entry.add_saveframe(frame)
+        unshared_report = entry.memory_report()['loops'][0]
+        loop.data = [[sys.intern(x) for x in row] for row in loop.data]
+        shared_report = entry.memory_report()['loops'][0]
+        self.assertEqual(shared_report['strings'], sys.getsizeof('value'))
+        self.assertEqual(unshared_report['strings'] - unshared_report['interning_savings'], shared_report['strings'])
+
+    def test_hooks(self):
+        self.assertRaises(ValueError, pynmrstar.hooks.on, 'not_an_event', print)
+        events = []
+
+        @pynmrstar.hooks.on('parse_end')
+        def record(event, info):
+            events.append((event, info))
+
+        pynmrstar.hooks.on('parse_start', record)
+        pynmrstar.hooks.on('saveframe_parsed', record)
+        pynmrstar.hooks.on('validate_end', record)
+        pynmrstar.hooks.on('write_end', record)
+        try:
+            entry = Entry.from_file(sample_file_location)
+            self.assertEqual(events[0], ('parse_start', {'source': "from_file('%s')" % sample_file_location,
+                                                         'size': os.path.getsize(sample_file_location)}))
+            self.assertEqual([x[1]['name'] for x in events if x[0] == 'saveframe_parsed'],
+                             [x.name for x in entry])
+            self.assertEqual(events[1][1]['rows'], sum([len(x) for x in entry[0].loops]))
+            self.assertEqual(events[-1][0], 'parse_end')
+            self.assertEqual((events[-1][1]['entry_id'], events[-1][1]['saveframes'], events[-1][1]['error']),
+                             ('15000', len(entry), None))
+            self.assertGreaterEqual(events[-1][1]['seconds'], 0)
+
+            self.assertRaises(ParsingError, Entry.from_string, "data_1 save_1 _Tag.a b c")
+            self.assertIsInstance(events[-1][1]['error'], ParsingError)
+
+            # Formatting parses the formatting comments the first time
+            str(entry)
+            del events[:]
+            entry.validate()
+            entry[0].write_to_file(StringIO())
+            with tempfile.NamedTemporaryFile(suffix='.str') as out_file:
+                entry.write_to_file(out_file.name)
+                self.assertEqual([x[0] for x in events], ['validate_end', 'write_end', 'write_end'])
+                self.assertEqual(events[0][1]['errors'], len(entry.validate()))
+                self.assertEqual(events[1][1]['saveframe'], entry[0].name)
+                self.assertEqual((events[2][1]['entry_id'], events[2][1]['format'], events[2][1]['file_name'],
+                                  events[2][1]['size']), ('15000', 'nmrstar', out_file.name,
+                                                          os.path.getsize(out_file.name)))
+
+            # Exceptions in the callbacks are logged, and unregistered callbacks are no longer called
+            pynmrstar.hooks.on('validate_end', lambda event, info: 1 / 0)
+            with self.assertLogs(level='ERROR'):
+                entry.validate()
+            pynmrstar.hooks.off('validate_end', record)
+            self.assertRaises(ValueError, pynmrstar.hooks.off, 'validate_end', record)
+            pynmrstar.hooks.clear('validate_end')
+            del events[:]
+            entry.validate()
+            self.assertEqual(events, [])
+        finally:
+            pynmrstar.hooks.clear()
+
+    def test_bytes(self):
+        from_bytes = Entry.from_bytes(self.file_entry.to_bytes())
+        self.assertEqual(str(from_bytes), str(self.file_entry))
+        self.assertEqual(from_bytes.get_tag("entry.Submission_date", whole_tag=True),
+                         [[u'Submission_date', u'2006-09-07', 17]])
+
+        # Data types should be preserved
+        converted = Entry.from_file(sample_file_location, convert_data_types=True)
+        converted[-1][-1].add_tag('Extra', update_data=True)
+        converted[-1][-1]['Extra'] = [0.5] * len(converted[-1][-1])
+        from_bytes = Entry.from_bytes(converted.to_bytes())
+        self.assertEqual(str(from_bytes), str(converted))
+        self.assertEqual(from_bytes[-1][-1].data, converted[-1][-1].data)
+        self.assertEqual([type(x) for x in from_bytes[-1][-1].data[0]], [type(x) for x in converted[-1][-1].data[0]])
+
+        # Loops with rows of the wrong width are preserved as they are
+        self.file_entry[-1][-1].data[0].pop()
+        self.assertEqual(Entry.from_bytes(self.file_entry.to_bytes())[-1][-1].data, self.file_entry[-1][-1].data)
+
+        self.assertRaises(ValueError, Entry.from_bytes, b'data_1')
+        self.assertRaises(ValueError, Entry.from_bytes, self.file_entry.to_bytes()[:1000])
+
+    def test_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        work_dir = tempfile.mkdtemp()
+        try:
+            pynmrstar.enable_cache(cache_dir)
+            local_copy = os.path.join(work_dir, 'bmr15000_3.str')
+            shutil.copy(sample_file_location, local_copy)
+
+            # The schema is cached too
+            schema_file = os.path.join(work_dir, 'schema.csv')
+            shutil.copy(os.path.join(our_path, '..', 'reference_files', 'schema.csv'), schema_file)
+            parsed_schema = Schema(schema_file)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached_schema = Schema(schema_file)
+            self.assertEqual(cached_schema.schema, parsed_schema.schema)
+            self.assertEqual(cached_schema.category_order, parsed_schema.category_order)
+            self.assertEqual(cached_schema.data_types, parsed_schema.data_types)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            parsed = Entry.from_file(local_copy)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            cached = Entry.from_file(local_copy)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            self.assertEqual(str(cached), str(parsed))
+            self.assertEqual(cached.source, parsed.source)
+            self.assertEqual(cached[0].source, parsed[0].source)
+            self.assertEqual(cached[0].tags[0], parsed[0].tags[0])
+
+            # Converted data types are cached separately
+            converted = Entry.from_file(local_copy, convert_data_types=True)
+            num_cached = len(os.listdir(cache_dir))
+            self.assertGreater(num_cached, 2)
+            self.assertEqual(Entry.from_file(local_copy, convert_data_types=True), converted)
+            self.assertEqual(len(os.listdir(cache_dir)), num_cached)
+
+            # A modified file should not use the cached copy
+            with open(local_copy, 'a') as appended:
+                appended.write('\n')
+            Entry.from_file(local_copy)
+            self.assertEqual(len(os.listdir(cache_dir)), num_cached + 1)
+
+            # The size of the cache is tracked without scanning the directory after every write
+            self.assertEqual(_cache._cache_size,
+                             sum(os.path.getsize(os.path.join(cache_dir, x)) for x in os.listdir(cache_dir)))
+
+            # Corrupt cached copies, however they fail to load, are treated as a miss and replaced
+            cache_file = _cache._cache_file('entry', local_copy, False)
+            expected = Entry.from_file(local_copy)
+            with open(cache_file, 'rb') as cached_file:
+                cached_data = cached_file.read()
+            for corrupt_data in [cached_data[:len(cached_data) // 2], cached_data[:20], b'', b'\xff' * 100]:
+                with open(cache_file, 'wb') as cached_file:
+                    cached_file.write(corrupt_data)
+                self.assertEqual(Entry.from_file(local_copy), expected)
+                self.assertEqual(os.path.getsize(cache_file), len(cached_data))
+
+            # The least recently used files are evicted
+            pynmrstar.enable_cache(cache_dir, max_bytes=1)
+            Entry.from_file(sample_file_location)
+            self.assertEqual(len(os.listdir(cache_dir)), 0)
+            self.assertRaises(ValueError, pynmrstar.enable_cache, cache_dir, 0)
+        finally:
+            pynmrstar.disable_cache()
+            shutil.rmtree(cache_dir)
+            shutil.rmtree(work_dir)
+
+    def test_compiled_schema(self):
+        work_dir = tempfile.mkdtemp()
+        schema_file = os.path.join(work_dir, 'schema.csv')
+        shipped_file = os.path.join(work_dir, 'schema.pickle')
+        compiled_dir = os.path.join(work_dir, 'cache')
+        shutil.copy(os.path.join(our_path, '..', 'reference_files', 'schema.csv'), schema_file)
+        # Only the temporary schema, so that nothing is written into the package
+        compiled_schemas = dict(_cache._COMPILED_SCHEMAS)
+        _cache._COMPILED_SCHEMAS.clear()
+        _cache._COMPILED_SCHEMAS[os.path.realpath(schema_file)] = shipped_file
+        _cache._COMPILED_SCHEMA_DIR = compiled_dir
+        try:
+            # The schema is compiled into the user cache the first time it is parsed, and loaded from there afterwards
+            parsed_schema = Schema(schema_file)
+            self.assertFalse(os.path.exists(shipped_file))
+            self.assertEqual(len(os.listdir(compiled_dir)), 1)
+            compiled_file = os.path.join(compiled_dir, os.listdir(compiled_dir)[0])
+            compiled_schema = Schema(schema_file)
+            for attribute in ['headers', 'schema', 'schema_order', 'category_order', 'version', 'data_types',
+                              'schema_file']:
+                self.assertEqual(getattr(compiled_schema, attribute), getattr(parsed_schema, attribute))
+
+            # The compiled schema is replaced when the CSV file changes
+            with open(schema_file, 'r') as schema_csv:
+                schema_text = schema_csv.read()
+            with open(schema_file, 'w') as schema_csv:
+                schema_csv.write(schema_text.replace('TBL_BEGIN,,new,%s,' % parsed_schema.version,
+                                                     'TBL_BEGIN,,new,9.9.9,', 1))
+            self.assertEqual(Schema(schema_file).version, '9.9.9')
+            self.assertEqual(Schema(schema_file).version, '9.9.9')
+
+            # An unreadable compiled schema is ignored
+            with open(compiled_file, 'wb') as compiled:
+                compiled.write(b'not a pickle')
+            self.assertEqual(Schema(schema_file).version, '9.9.9')
+
+            # The copy shipped with the library is used once installing changes the mtimes, and is then stored in
+            #  the user cache
+            _cache._ship_compiled_schemas()
+            self.assertEqual(sorted(os.listdir(work_dir)), ['cache', 'schema.csv', 'schema.pickle'])
+            shutil.rmtree(compiled_dir)
+            os.utime(schema_file, (0, 0))
+            self.assertEqual(_cache._load_compiled_schema(schema_file)['version'], '9.9.9')
+            self.assertTrue(os.path.isfile(compiled_file))
+
+            # But not once the CSV file changes, even if its size doesn't
+            with open(schema_file, 'w') as schema_csv:
+                schema_csv.write(schema_text.replace('TBL_BEGIN,,new,%s,' % parsed_schema.version,
+                                                     'TBL_BEGIN,,new,9.9.8,', 1))
+            shutil.rmtree(compiled_dir)
+            self.assertIsNone(_cache._load_compiled_schema(schema_file))
+            self.assertEqual(Schema(schema_file).version, '9.9.8')
+        finally:
+            _cache._COMPILED_SCHEMAS.clear()
+            _cache._COMPILED_SCHEMAS.update(compiled_schemas)
+            _cache._COMPILED_SCHEMA_DIR = None
+            shutil.rmtree(work_dir)
+
+    def test_c_loop_formatter(self):
+        if cnmrstar is None or not hasattr(cnmrstar, 'format_loop'):
+            self.skipTest('The cnmrstar module is not available.')
+
+        conversions = definitions.STR_CONVERSION_DICT
+        test_loop = Loop.from_scratch('_Test')
+        test_loop.add_tag(['one', 'two', 'three'])
+        test_loop.add_data([None, 1, 'single quote test'])
+        test_loop.add_data(['loop_', '#comment', "double quote' test"])
+        test_loop.add_data(["\nnewline\n", "ünïcödé", 2.5])
+        test_loop.add_data(['_tag', 'simple', '  '])
+
+        for each_loop in [test_loop] + [x for frame in self.file_entry for x in frame.loops]:
+            if not each_loop.data:
+                continue
+            expected = "".join(each_loop._format_chunks())
+            self.assertEqual(cnmrstar.format_loop(each_loop.category, each_loop.tags, each_loop.data, conversions),
+                             expected)
+            widths = cnmrstar.loop_widths(each_loop.data, conversions)
+            rows = cnmrstar.format_loop_rows(each_loop.data[:2], conversions, widths) + \
+                cnmrstar.format_loop_rows(each_loop.data[2:], conversions, widths)
+            self.assertEqual(rows, expected[expected.index('\n\n') + 2:-len('\n   stop_\n')])
+
+        test_loop.data[0][0] = ''
+        self.assertRaises(ValueError, cnmrstar.format_loop, '_Test', test_loop.tags, test_loop.data, conversions)
+        test_loop.data[0][0] = None
+        test_loop.data[0].append(1)
+        self.assertRaises(ValueError, cnmrstar.format_loop, '_Test', test_loop.tags, test_loop.data, conversions)
+
+        # The loop formatter falls back to the python code to raise the appropriate error
+        original_cnmrstar = utils.cnmrstar
+        utils.cnmrstar = cnmrstar
+        try:
+            test_loop.data[0].pop()
+            self.assertEqual(str(test_loop), cnmrstar.format_loop('_Test', test_loop.tags, test_loop.data, conversions))
+            test_loop.data[0][0] = ''
+            self.assertRaises(FormattingError, str, test_loop)
+            self.assertRaises(FormattingError, "".join, test_loop._format_chunks(stream=True))
+        finally:
+            utils.cnmrstar = original_cnmrstar
+
+    def test_write_to_file(self):
+        out_dir = tempfile.mkdtemp()
+        out_file = os.path.join(out_dir, 'out.str')
+        expected = self.file_entry.format()
+
+        # Make sure that streamed loops are formatted the same way, even across chunks of rows
+        loop = self.file_entry.get_loops_by_category('atom_chem_shift')[0]
+        for _ in range(2500):
+            loop.add_data(copy(loop.data[random.randint(0, len(loop.data) - 1)]))
+        self.assertEqual("".join(loop._format_chunks(stream=True)), str(loop))
+        self.file_entry = copy(file_entry)
+
+        try:
+            self.file_entry.write_to_file(out_file)
+            with open(out_file) as written:
+                self.assertEqual(written.read(), expected)
+            self.file_entry.write_to_file(out_file, skip_empty_tags=True, show_comments=False, atomic=True)
+            with open(out_file) as written:
+                self.assertEqual(written.read(), self.file_entry.format(skip_empty_tags=True, show_comments=False))
+            self.assertEqual(os.listdir(out_dir), ['out.str'])
+
+            self.file_entry.write_to_file(out_file, compress=True, atomic=True)
+            with gzip.open(out_file, 'rt') as written:
+                self.assertEqual(written.read(), expected)
+            self.assertEqual(Entry.from_file(out_file), self.file_entry)
+
+            self.file_entry.write_to_file(out_file, format_='json')
+            with open(out_file) as written:
+                self.assertEqual(written.read(), self.file_entry.get_json())
+
+            self.file_entry[0].write_to_file(out_file, compress=True)
+            with gzip.open(out_file, 'rt') as written:
+                self.assertEqual(written.read(), self.file_entry[0].format())
+
+            # File objects
+            text_buffer, binary_buffer, compressed_buffer = StringIO(), BytesIO(), BytesIO()
+            self.file_entry.write_to_file(text_buffer)
+            self.file_entry.write_to_file(binary_buffer)
+            self.file_entry.write_to_file(compressed_buffer, compress=True)
+            self.assertEqual(text_buffer.getvalue(), expected)
+            self.assertEqual(binary_buffer.getvalue().decode(), expected)
+            self.assertEqual(gzip.decompress(compressed_buffer.getvalue()).decode(), expected)
+            self.assertRaises(ValueError, self.file_entry.write_to_file, StringIO(), atomic=True)
+
+            # A failed atomic write leaves the original file in place
+            self.file_entry.write_to_file(out_file)
+            self.file_entry[-1].tags[0][1] = ''
+            self.assertRaises(FormattingError, self.file_entry.write_to_file, out_file, atomic=True)
+            self.assertEqual(os.listdir(out_dir), ['out.str'])
+            with open(out_file) as written:
+                self.assertEqual(written.read(), expected)
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_parallel_format(self):
+        # Repeat the categories so that the comments are only printed for the first of each
+        for saveframe in list(self.file_entry)[:5]:
+            duplicate = Saveframe.from_string(str(saveframe))
+            duplicate.name = saveframe.name + '_2'
+            self.file_entry.add_saveframe(duplicate)
+
+        self.assertEqual(self.file_entry.format(workers=3), self.file_entry.format())
+        self.assertEqual(self.file_entry.format(workers=2, skip_empty_loops=False, skip_empty_tags=True,
+                                                show_comments=False),
+                         self.file_entry.format(skip_empty_loops=False, skip_empty_tags=True, show_comments=False))
+        self.assertRaises(ValueError, self.file_entry.format, workers=0)
+
+        definitions.STR_CONVERSION_DICT[None] = '?'
+        try:
+            self.file_entry[0]['Title'] = None
+            self.assertEqual(self.file_entry.format(workers=2), self.file_entry.format())
+        finally:
+            definitions.STR_CONVERSION_DICT[None] = '.'
+
+        text_buffer = StringIO()
+        self.file_entry.write_to_file(text_buffer, workers=2)
+        self.assertEqual(text_buffer.getvalue(), self.file_entry.format())
+
+        # Errors in the workers are raised in the calling process
+        self.file_entry[-1].tags[0][1] = ''
+        self.assertRaises(FormattingError, self.file_entry.format, workers=2)
+
+    def test_compact_format(self):
+        compact = self.file_entry.format(compact=True)
+        self.assertEqual(Entry.from_string(compact), self.file_entry)
+        self.assertLess(len(compact), len(self.file_entry.format()))
+        self.assertNotIn('\n\n\n', compact)
+        self.assertEqual(self.file_entry.format(compact=True, workers=2), compact)
+        text_buffer = StringIO()
+        self.file_entry.write_to_file(text_buffer, compact=True)
+        self.assertEqual(text_buffer.getvalue(), compact)
+
+        # Multi-line and quoted values, across more than one chunk of rows
+        loop = Loop.from_scratch('_Test')
+        loop.add_tag(['a', 'b', 'c'])
+        for x in range(2500):
+            loop.add_data([x, "multi\nline" if x % 1000 == 999 else "two words", "it's"])
+        self.assertEqual(Loop.from_string(loop.format(compact=True)), loop)
+        self.assertEqual(Loop.from_string(str(loop.filter(['a']).format(compact=True))), loop.filter(['a']))
+        self.assertEqual(Loop.from_scratch('_Test').format(skip_empty_loops=False, compact=True), "loop_\nstop_\n")
+
+        # Values that start with a semicolon can't open a line
+        for values in [[';abc', 'x'], [';a b', 'x'], ['x', ';abc'], ['multi\nline', ';abc']]:
+            semicolon_loop = Loop.from_scratch('_Test')
+            semicolon_loop.add_tag(['a', 'b'])
+            semicolon_loop.add_data(values)
+            semicolon_loop.add_data(['y', 'z'])
+            self.assertEqual(Loop.from_string(semicolon_loop.format(compact=True)), semicolon_loop)
+
+        self.file_entry[0]['Title'] = "A\nmulti-line title"
+        self.assertEqual(Entry.from_string(self.file_entry.format(compact=True)), self.file_entry)
+        self.assertEqual(Saveframe.from_scratch('empty', '_Empty').format(compact=True), "save_empty\nsave_\n")
+        loop.data[1500][1] = ''
+        self.assertRaises(FormattingError, loop.format, compact=True)
+
     def test___setitem(self):
         tmp_entry = copy(self.file_entry)
         tmp_entry[0] = tmp_entry.get_saveframe_by_name('entry_information')
@@ -216,6 +1081,66 @@ class TestPyNMRSTAR(unittest.TestCase):
                          ["The number of saveframes in the entries are not equal: '25' vs '24'.",
                           "No saveframe with name 'assigned_chem_shift_list_1' in other entry."])
 
+    def test_digest(self):
+        original = self.file_entry.digest()
+        self.assertEqual(original, Entry.from_string(str(self.file_entry)).digest())
+        self.assertEqual(original, Entry.from_file(sample_file_location, convert_data_types=True).digest())
+
+        # Changes made through the API are detected
+        self.file_entry[0]['Title'] = 'A new title'
+        self.assertNotEqual(self.file_entry.digest(), original)
+        self.file_entry[0].delete_tag('Title')
+        self.assertNotEqual(self.file_entry.digest(), original)
+
+        loop_digest = self.file_entry[-1][-1].digest()
+        self.file_entry[-1][-1].add_data(self.file_entry[-1][-1].data[0][:])
+        self.assertNotEqual(self.file_entry[-1][-1].digest(), loop_digest)
+        self.file_entry[-1][-1].data.pop()
+        self.file_entry[-1].mark_dirty()
+        self.assertEqual(self.file_entry[-1][-1].digest(), loop_digest)
+
+        # Direct modifications are only detected after calling mark_dirty()
+        self.file_entry[-1][-1].data[0][0] = 'changed'
+        self.assertEqual(self.file_entry[-1][-1].digest(), loop_digest)
+        self.assertNotEqual(self.file_entry[-1][-1].digest(refresh=True), loop_digest)
+        self.file_entry[-1][-1].data[0][0] = '1'
+        self.file_entry[-1][-1].mark_dirty()
+        self.assertEqual(self.file_entry[-1][-1].digest(), loop_digest)
+
+    def test_formatted_cache(self):
+        uncached = str(self.file_entry)
+        definitions.CACHE_FORMATTED_OUTPUT = True
+        try:
+            self.assertEqual(str(self.file_entry), uncached)
+            self.assertEqual(str(self.file_entry), uncached)
+            self.assertEqual(self.file_entry.format(skip_empty_tags=True),
+                             Entry.from_string(uncached).format(skip_empty_tags=True))
+
+            # Changes made through the API invalidate the cached text
+            self.file_entry[0]['Title'] = 'A new title'
+            self.assertIn('A new title', str(self.file_entry))
+            self.file_entry[0].delete_tag('Title')
+            self.assertNotIn('A new title', str(self.file_entry))
+            the_loop = self.file_entry[-1][-1]
+            loop_text = str(the_loop)
+            the_loop.add_data(the_loop.data[0][:])
+            self.assertEqual(str(the_loop).count('\n'), loop_text.count('\n') + 1)
+            the_loop.data.pop()
+            the_loop.mark_dirty()
+            self.assertEqual(str(the_loop), loop_text)
+            the_loop.sort_rows('ID', key=lambda row: -float(row[0]))
+            self.assertNotEqual(str(the_loop), loop_text)
+            the_loop.sort_rows('ID')
+            self.assertEqual(str(the_loop), loop_text)
+
+            # Direct modifications are only detected after calling mark_dirty()
+            the_loop.data[0][0] = 'changed'
+            self.assertNotIn('changed', str(the_loop))
+            self.file_entry.mark_dirty()
+            self.assertIn('changed', str(the_loop))
+        finally:
+            definitions.CACHE_FORMATTED_OUTPUT = False
+
     def test_getmethods(self):
         self.assertEqual(5, len(self.file_entry.get_loops_by_category("_Vendor")))
         self.assertEqual(5, len(self.file_entry.get_loops_by_category("vendor")))
@@ -248,6 +1173,77 @@ class TestPyNMRSTAR(unittest.TestCase):
         self.assertEqual(self.file_entry.validate(), validation)
         self.file_entry[-1][-1][0][0] = '1'
 
+    def test_validate_columns(self):
+        # Validating a loop a column at a time gives the same errors, in the same order, as checking each value
+        schema = utils.get_schema()
+        loop = copy(self.file_entry[-1][-1])
+        for row_num, row in enumerate(loop.data[:20]):
+            row[row_num % len(row)] = ['a', '', None, '?', 'x' * 300, 12][row_num % 6]
+        loop.tags[1] = loop.tags[1].lower()
+        loop.data[5].append('extra')
+        loop.data[7].pop()
+
+        expected = []
+        for row_num, row in enumerate(loop.data):
+            for pos, datum in enumerate(row[:len(loop.tags)]):
+                expected.extend(schema.val_type(loop.category + "." + loop.tags[pos], datum, category='wrong',
+                                                line_number=str(row_num) + " tag " + str(pos) + " of loop"))
+        self.assertGreater(len(expected), 20)
+        self.assertEqual(loop.validate(category='wrong', validate_star=False), expected)
+        self.assertEqual(schema._validation_plan('_Not_a.tag').failures(['1', '2'], None), [0, 1])
+
+    def test_edited_schema(self):
+        # Validation follows edits made directly to the tag definitions and data types of a schema
+        schema = Schema(os.path.join(our_path, '..', 'reference_files', 'schema.csv'))
+        loop = copy(self.file_entry[-1][-1])
+        tag = loop.category + "." + loop.tags[0]
+        self.assertEqual(loop.validate(schema=schema), [])
+        self.assertEqual(schema.val_type(tag, loop.data[0][0]), [])
+
+        schema.data_types['Never'] = '^$'
+        schema.schema[tag.lower()]['BMRB data type'] = 'Never'
+        self.assertEqual(len(loop.validate(schema=schema)), len(loop.data))
+        self.assertEqual(len(schema.val_type(tag, loop.data[0][0])), 1)
+
+        schema.data_types['Never'] = '^.*$'
+        self.assertEqual(loop.validate(schema=schema), [])
+        self.assertEqual(schema.val_type(tag, loop.data[0][0]), [])
+
+        schema.schema[tag.lower()]['Nullable'] = False
+        loop.data[0][0] = '.'
+        self.assertEqual(len(loop.validate(schema=schema)), 1)
+
+        # Changes to the order of the tags take effect once the caches are invalidated
+        schema.schema_order.insert(0, '_New_category.Tag')
+        schema.invalidate_caches()
+        self.assertEqual(schema.tag_key('_New_category.Tag'), 0)
+        self.assertEqual(schema.tag_key(schema.schema_order[1]), 1)
+
+    def test_validate_many(self):
+        entry = copy(self.file_entry)
+        for row in entry[-1][-1].data[:30]:
+            row[0] = 'a'
+        entry[0].tags[1][1] = '$missing'
+        errors = entry.validate()
+        self.assertEqual(len(errors), 31)
+
+        # The errors are the same, and in the same order, with workers and when stopping early
+        self.assertEqual(entry.validate(workers=2), errors)
+        for max_errors in [1, 5, 31, 100]:
+            self.assertEqual(entry.validate(max_errors=max_errors), errors[:max_errors])
+            self.assertEqual(entry.validate(workers=2, max_errors=max_errors), errors[:max_errors])
+        with self.assertRaises(ValueError):
+            entry.validate(max_errors=0)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            entry.write_to_file(os.path.join(tmp_dir, 'invalid.str'))
+            with open(os.path.join(tmp_dir, 'broken.str'), 'w') as broken:
+                broken.write('data_broken\nsave_')
+            results = pynmrstar.corpus.validate_many(tmp_dir, workers=2, max_errors=3)
+            self.assertEqual(list(results), [os.path.join(tmp_dir, 'broken.str'), os.path.join(tmp_dir, 'invalid.str')])
+            self.assertEqual(len(results[os.path.join(tmp_dir, 'broken.str')]), 1)
+            self.assertEqual(len(results[os.path.join(tmp_dir, 'invalid.str')]), 3)
+
     def test_saveframe(self):
         frame = self.file_entry[0]
 
@@ -721,6 +1717,20 @@ loop_
         frame.add_loop(one)
         self.assertRaises(ValueError, frame.add_loop, two)
 
+    def test_schema_positions(self):
+        schema = Schema(os.path.join(our_path, '..', 'reference_files', 'schema.csv'))
+        for tag in schema.schema_order[::100]:
+            self.assertEqual(schema.tag_key(tag), schema.schema_order.index(tag))
+        self.assertGreaterEqual(schema.tag_key('_Not_a.tag'), len(schema.schema_order))
+
+        # The positions stay up to date when tags are added
+        schema.add_tag('_Entry.Extra', 'TEXT', True, 'entry_information', False, after='_entry.title')
+        self.assertEqual(schema.tag_key('_Entry.Extra'), schema.tag_key('_Entry.Title') + 1)
+        for tag in schema.schema_order[::100] + ['_Entry.Extra']:
+            self.assertEqual(schema.tag_key(tag), schema.schema_order.index(tag))
+        for category in schema.category_order[::10]:
+            self.assertEqual(schema._category_positions[category], schema.category_order.index(category))
+
     def test_normalize(self):
 
         db_tmp = copy(self.file_entry)
@@ -780,6 +1790,27 @@ loop_
         # have already failed.)
         self.assertEqual(ml[0][0], Loop.from_string(str(ml))[0][0])
 
+    def test_threaded_parse(self):
+        # Entries parsed in several threads at once don't interfere with each other, even with the C tokenizer
+        text = str(self.file_entry)
+        results, errors = [], []
+
+        def parse():
+            results.append(Entry.from_string(text))
+            try:
+                Entry.from_string('data_1 save_a _A.b "c')
+            except ParsingError as err:
+                errors.append(str(err))
+
+        threads = [threading.Thread(target=parse) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [self.file_entry] * 4)
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(len(set(errors)), 1)
+
     def test_parse_outliers(self):
         """ Make sure the parser handles edge cases. """
 
@@ -6,11 +6,10 @@
 
 import json
 import os
-from typing import Iterable, Any, Dict
-from urllib.error import HTTPError, URLError
+from typing import Iterable, Any, Dict, List, Union
 
-from pynmrstar import definitions, entry as entry_mod
-from pynmrstar._internal import _interpret_file
+from pynmrstar import definitions, entry as entry_mod, profiling
+from pynmrstar._internal import _find_entry_files, _interpret_file
 from pynmrstar.schema import Schema
 
 try:
@@ -23,7 +22,8 @@ except ImportError:
 #############################################
 
 # Set this to allow import * from pynmrstar to work sensibly
-__all__ = ['diff', 'format_category', 'format_tag', 'get_schema', 'iter_entries', 'quote_value', 'validate']
+__all__ = ['diff', 'format_category', 'format_tag', 'gather_entries', 'get_schema', 'iter_entries', 'quote_value',
+           'quote_values', 'validate']
 
 
 def diff(entry1: 'entry_mod.Entry', entry2: 'entry_mod.Entry') -> None:
@@ -58,6 +58,31 @@ def format_tag(tag: str) -> str:
     return tag
 
 
+async def gather_entries(entry_nums: Iterable[Union[str, int]], max_concurrency: int = 8,
+                         convert_data_types: bool = False) -> List['entry_mod.Entry']:
+    """ Loads the provided entries from the BMRB API using
+        Entry.from_database_async(), with no more than max_concurrency
+        downloads in progress at once. Returns the entries in the same order
+        as entry_nums. If an entry fails to load, the exception is raised
+        once the others have finished. """
+
+    import asyncio
+
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1.")
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def load_entry(entry_num: Union[str, int]) -> 'entry_mod.Entry':
+        async with semaphore:
+            return await entry_mod.Entry.from_database_async(entry_num, convert_data_types=convert_data_types)
+
+    results = await asyncio.gather(*[load_entry(x) for x in entry_nums], return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
 # noinspection PyDefaultArgument
 def get_schema(passed_schema: 'Schema' = None, _cached_schema: Dict[str, Schema] = {}) \
         -> 'Schema':
@@ -76,6 +101,8 @@ def get_schema(passed_schema: 'Schema' = None, _cached_schema: Dict[str, Schema]
             schema_file = os.path.join(schema_file, "reference_files/schema.csv")
             _cached_schema['schema'] = Schema(schema_file=schema_file)
         except IOError:
+            from urllib.error import HTTPError, URLError
+
             # Try to load from the internet
             try:
                 _cached_schema['schema'] = Schema()
@@ -85,20 +112,48 @@ def get_schema(passed_schema: 'Schema' = None, _cached_schema: Dict[str, Schema]
     return _cached_schema['schema']
 
 
-def iter_entries(metabolomics: bool = False) -> Iterable['entry_mod.Entry']:
+def iter_entries(metabolomics: bool = False, prefetch: int = 0, workers: int = 1,
+                 source: str = None) -> Iterable['entry_mod.Entry']:
     """ Returns a generator that will yield an Entry object for every
         macromolecule entry in the current BMRB database. Perfect for performing
         an operation across the entire BMRB database. Set `metabolomics=True`
-        in order to get all the entries in the metabolomics database."""
-
-    api_url = "%s/list_entries?database=macromolecules" % definitions.API_URL
-    if metabolomics:
-        api_url = "%s/list_entries?database=metabolomics" % definitions.API_URL
-
-    for entry in json.loads(_interpret_file(api_url).read()):
-        yield entry_mod.Entry.from_database(entry)
-
-
+        in order to get all the entries in the metabolomics database.
+
+        Set `prefetch` to keep that many of the upcoming entries downloading
+        and loading in the background, using `workers` threads, while you
+        process the current one. At most `prefetch` entries are held in memory
+        in addition to the one that was yielded.
+
+        Set `source` to the path of a local directory containing a mirror of
+        the entries to load them from there rather than from the BMRB API.
+        Every file ending in .str or .str.gz found in the directory (or its
+        subdirectories) is loaded, in sorted order, and `metabolomics` is
+        ignored."""
+
+    if source is not None:
+        if not os.path.isdir(source):
+            raise IOError("The entry source '%s' is not a directory." % source)
+        entry_files = _find_entry_files(source)
+        loader = entry_mod.Entry.from_file
+    else:
+        api_url = "%s/list_entries?database=macromolecules" % definitions.API_URL
+        if metabolomics:
+            api_url = "%s/list_entries?database=metabolomics" % definitions.API_URL
+        entry_files = json.loads(_interpret_file(api_url).read())
+        loader = entry_mod.Entry.from_database
+
+    # Load them in the background
+    if prefetch > 0 or workers > 1:
+        from pynmrstar._fetch import _prefetch
+
+        yield from _prefetch(loader, entry_files, max(prefetch, workers), workers)
+        return
+
+    for entry in entry_files:
+        yield loader(entry)
+
+
+@profiling._timed('quote')
 def quote_value(value: Any) -> str:
     """Automatically quotes the value in the appropriate way. Don't
     quote values you send to this method or they will show up in
@@ -123,6 +178,43 @@ def quote_value(value: Any) -> str:
         if any(isinstance(value, type(x)) for x in definitions.STR_CONVERSION_DICT):
             value = definitions.STR_CONVERSION_DICT[value]
 
+    return _quote_converted_value(value)
+
+
+@profiling._timed('quote')
+def quote_values(values: Iterable[Any]) -> List[str]:
+    """Returns a list of the provided values, each quoted exactly as
+    quote_value() would quote it. This is much faster than calling
+    quote_value() on each value when there are many values to quote,
+    such as all of the values in a loop column or row."""
+
+    if not isinstance(values, list):
+        values = list(values)
+
+    # Use the fast code if it is available
+    if cnmrstar is not None and hasattr(cnmrstar, 'clean_values'):
+        try:
+            return cnmrstar.clean_values(values, definitions.STR_CONVERSION_DICT)
+        except Exception:
+            # Quote them below so the appropriate exception is raised
+            pass
+
+    # Only look up the types of the conversion keys once
+    conversions = definitions.STR_CONVERSION_DICT
+    conversion_types = tuple(type(x) for x in conversions)
+
+    quoted = []
+    for value in values:
+        if value in conversions and isinstance(value, conversion_types):
+            value = conversions[value]
+        quoted.append(_quote_converted_value(value))
+    return quoted
+
+
+def _quote_converted_value(value: Any) -> str:
+    """Does the work of quote_value() once the STR_CONVERSION_DICT
+    conversions have been applied."""
+
     # Use the fast code if it is available
     if cnmrstar is not None:
         # It's faster to assume we are working with a string and catch
@@ -157,17 +249,9 @@ def quote_value(value: Any) -> str:
     # If it has single and double quotes it will need to go on its
     #  own line under certain conditions...
     if '"' in value and "'" in value:
-        can_wrap_single = True
-        can_wrap_double = True
-
-        for pos, char in enumerate(value):
-            next_char = value[pos + 1:pos + 2]
-
-            if next_char != "" and next_char in definitions.WHITESPACE:
-                if char == "'":
-                    can_wrap_single = False
-                if char == '"':
-                    can_wrap_double = False
+        # A quote can only be used if it is never followed by whitespace within the value
+        can_wrap_single = not any("'" + x in value for x in definitions.WHITESPACE)
+        can_wrap_double = not any('"' + x in value for x in definitions.WHITESPACE)
 
         if not can_wrap_single and not can_wrap_double:
             return '%s\n' % value
@@ -16,7 +16,7 @@ while true; do
     case ${rt} in
         [Tt]* ) python3 -m twine upload --repository testpypi dist/*.tar.gz --sign; break;;
         [Rr]* ) python3 -m twine upload dist/*.tar.gz --sign; break;;
-        [Bb]* ) cp README.md README.rst; rm dist/*; touch pynmrstar/.nocompile; python3 setup.py sdist; rm -rfv pynmrstar.egg-info; break;;
+        [Bb]* ) cp README.md README.rst; rm dist/*; touch pynmrstar/.nocompile; python3 -c 'from pynmrstar._cache import _ship_compiled_schemas; _ship_compiled_schemas()'; python3 setup.py sdist; rm -rfv pynmrstar.egg-info; break;;
         * ) echo "Please answer r or t.";;
     esac
 done
@@ -17,9 +17,9 @@ long_des = open('README.rst', 'r').read()
 
 setup(name='pynmrstar',
       version=__version__,
-      packages=['pynmrstar'],
+      packages=['pynmrstar', 'pynmrstar.benchmarks'],
       ext_modules=[cnmrstar],
-      python_requires='>=3',
+      python_requires='>=3.7',
       author='Jon Wedell',
       author_email='wedell@uchc.edu',
       description='PyNMR-STAR provides tools for reading, writing, modifying, and interacting with NMR-STAR files. '
@@ -30,12 +30,13 @@ setup(name='pynmrstar',
       url='https://github.com/uwbmrb/PyNMRSTAR',
       license='MIT',
       package_data={'pynmrstar': ['reference_files/schema.csv', 'reference_files/comments.str',
-                                  'reference_files/data_types.csv', '.nocompile']},
+                                  'reference_files/data_types.csv', 'reference_files/schema.pickle', '.nocompile',
+                                  # The default entry of the benchmarks
+                                  'unit_tests/sample_files/bmr15000_3.str']},
       classifiers=[
           'Development Status :: 5 - Production/Stable',
           'Environment :: Console',
           'Programming Language :: Python :: 3 :: Only',
-          'Programming Language :: Python :: 3.6',
           'Programming Language :: Python :: 3.7',
           'Programming Language :: Python :: 3.8',
           'Intended Audience :: Developers',